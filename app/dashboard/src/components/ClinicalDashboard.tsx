@@ -1,4 +1,4 @@
-import { useState, useCallback, useRef } from 'react'
+import { useState, useCallback, useRef, useEffect } from 'react'
 import { predictImage } from '../services/api'
 import { PredictionResult, CURB65Data, SeverityResult } from '../types'
 import { calculateCURB65, calculateCombinedSeverity, getCURB65Breakdown } from '../utils/severity'
@@ -31,8 +31,19 @@ export default function ClinicalDashboard() {
   })
   
   const [showReport, setShowReport] = useState(false)
+  const [waitingCount, setWaitingCount] = useState(0)
   const fileInputRef = useRef<HTMLInputElement>(null)
 
+  const refreshWaitingCount = useCallback(() => {
+    TriageService.getStatistics()
+      .then(stats => setWaitingCount(stats.waiting))
+      .catch(() => {})
+  }, [])
+
+  useEffect(() => {
+    refreshWaitingCount()
+  }, [triageMode, refreshWaitingCount])
+
   const toggleDarkMode = () => {
     setDarkMode(!darkMode)
     document.documentElement.classList.toggle('dark')
@@ -67,27 +78,22 @@ export default function ClinicalDashboard() {
     // Mark score as calculated to show results
     setScoreCalculated(true)
     
-    // Convert image to base64 and add to triage queue
+    // Calculate final severity
+    const finalCurb65Score = calculateCURB65(curb65Data)
+    const finalSeverityResult = calculateCombinedSeverity(prediction, finalCurb65Score)
+
+    // Upload the X-ray once to the image store, then add the patient by image ID
     fetch(imageUrl)
       .then(res => res.blob())
-      .then(blob => {
-        const reader = new FileReader()
-        reader.onloadend = () => {
-          const imageData = reader.result as string
-          
-          // Calculate final severity and add to triage queue
-          const finalCurb65Score = calculateCURB65(curb65Data)
-          const finalSeverityResult = calculateCombinedSeverity(prediction, finalCurb65Score)
-          
-          TriageService.addPatient({
-            imageData,
-            prediction,
-            curb65Data,
-            severityResult: finalSeverityResult
-          })
-        }
-        reader.readAsDataURL(blob)
-      })
+      .then(blob => TriageService.uploadImage(blob))
+      .then(imageId => TriageService.addPatient({
+        imageId,
+        prediction,
+        curb65Data,
+        severityResult: finalSeverityResult
+      }))
+      .then(refreshWaitingCount)
+      .catch(err => setError(err.response?.data?.detail || 'Failed to add patient to triage queue'))
   }
 
   const handleCURB65Change = (field: keyof CURB65Data, value: any) => {
@@ -168,7 +174,7 @@ export default function ClinicalDashboard() {
             <span className="text-xl">🏥</span>
             <span>Triage Mode</span>
             <span className="bg-white/20 px-2 py-0.5 rounded-full text-xs">
-              {TriageService.getStatistics().waiting}
+              {waitingCount}
             </span>
           </button>
         </div>
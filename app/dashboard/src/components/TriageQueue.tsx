@@ -1,41 +1,60 @@
-import { useState, useEffect } from 'react'
-import { TriageService, PatientRecord } from '../services/triageService'
+import { useState, useEffect, useCallback } from 'react'
+import { TriageService, PatientRecord, EMPTY_STATISTICS } from '../services/triageService'
+
+const PAGE_SIZE = 20
 
 export default function TriageQueue() {
   const [queue, setQueue] = useState<PatientRecord[]>([])
-  const [stats, setStats] = useState(TriageService.getStatistics())
+  const [total, setTotal] = useState(0)
+  const [page, setPage] = useState(0)
+  const [stats, setStats] = useState(EMPTY_STATISTICS)
   const [selectedPatient, setSelectedPatient] = useState<PatientRecord | null>(null)
 
+  // Only the visible page is fetched; ordering and statistics come from the server
+  const loadQueue = useCallback(async () => {
+    try {
+      const [queuePage, statistics] = await Promise.all([
+        TriageService.getQueue(page * PAGE_SIZE, PAGE_SIZE),
+        TriageService.getStatistics(),
+      ])
+      setQueue(queuePage.items)
+      setTotal(queuePage.total)
+      setStats(statistics)
+    } catch (error) {
+      console.error('Error loading triage queue:', error)
+    }
+  }, [page])
+
   useEffect(() => {
     loadQueue()
     // Poll for updates every 2 seconds
     const interval = setInterval(loadQueue, 2000)
     return () => clearInterval(interval)
-  }, [])
+  }, [loadQueue])
 
-  const loadQueue = () => {
-    const updatedQueue = TriageService.getQueue()
-    setQueue(updatedQueue)
-    setStats(TriageService.getStatistics())
-  }
+  const pageCount = Math.max(1, Math.ceil(total / PAGE_SIZE))
+  useEffect(() => {
+    if (page >= pageCount) setPage(pageCount - 1)
+  }, [page, pageCount])
 
-  const handleStatusChange = (id: string, status: PatientRecord['status']) => {
-    TriageService.updatePatientStatus(id, status)
+  const handleStatusChange = async (id: string, status: PatientRecord['status']) => {
+    await TriageService.updatePatientStatus(id, status)
     loadQueue()
   }
 
-  const handleRemovePatient = (id: string) => {
+  const handleRemovePatient = async (id: string) => {
     if (confirm('Are you sure you want to remove this patient from the queue?')) {
-      TriageService.removePatient(id)
+      await TriageService.removePatient(id)
       setSelectedPatient(null)
       loadQueue()
     }
   }
 
-  const handleClearQueue = () => {
+  const handleClearQueue = async () => {
     if (confirm('⚠️ This will clear the entire queue. Are you sure?')) {
-      TriageService.clearQueue()
+      await TriageService.clearQueue()
       setSelectedPatient(null)
+      setPage(0)
       loadQueue()
     }
   }
@@ -116,7 +135,7 @@ export default function TriageQueue() {
       {/* Queue Actions */}
       <div className="flex justify-between items-center">
         <h2 className="text-2xl font-bold text-gray-800 dark:text-gray-200">
-          Priority Queue ({queue.length})
+          Priority Queue ({total})
         </h2>
         <button
           onClick={handleClearQueue}
@@ -127,7 +146,7 @@ export default function TriageQueue() {
       </div>
 
       {/* Patient Queue */}
-      {queue.length === 0 ? (
+      {total === 0 ? (
         <div className="glass-card p-12 text-center animate-fade-in">
           <div className="text-6xl mb-4">🏥</div>
           <h3 className="text-xl font-semibold text-gray-700 dark:text-gray-300 mb-2">
@@ -151,16 +170,19 @@ export default function TriageQueue() {
               <div className="flex items-center gap-4">
                 {/* Priority Number */}
                 <div className={`w-12 h-12 rounded-full bg-gradient-to-br ${getSeverityColor(patient.severityResult.finalSeverity)} flex items-center justify-center text-white font-bold text-lg shadow-lg`}>
-                  {index + 1}
+                  {page * PAGE_SIZE + index + 1}
                 </div>
 
                 {/* Patient Image Thumbnail */}
                 <div className="w-16 h-16 rounded-lg overflow-hidden bg-gray-200 dark:bg-gray-700 flex-shrink-0">
-                  <img
-                    src={patient.imageData}
-                    alt="X-ray"
-                    className="w-full h-full object-cover"
-                  />
+                  {patient.thumbnailUrl && (
+                    <img
+                      src={patient.thumbnailUrl}
+                      alt="X-ray"
+                      loading="lazy"
+                      className="w-full h-full object-cover"
+                    />
+                  )}
                 </div>
 
                 {/* Patient Info */}
@@ -220,6 +242,29 @@ export default function TriageQueue() {
               </div>
             </div>
           ))}
+
+          {/* Pagination */}
+          {pageCount > 1 && (
+            <div className="flex justify-center items-center gap-4 pt-2">
+              <button
+                onClick={() => setPage(p => Math.max(0, p - 1))}
+                disabled={page === 0}
+                className="px-3 py-1 bg-gray-100 dark:bg-gray-700 text-gray-700 dark:text-gray-300 rounded text-sm font-medium disabled:opacity-50"
+              >
+                ← Previous
+              </button>
+              <span className="text-sm text-gray-600 dark:text-gray-400">
+                Page {page + 1} of {pageCount}
+              </span>
+              <button
+                onClick={() => setPage(p => Math.min(pageCount - 1, p + 1))}
+                disabled={page >= pageCount - 1}
+                className="px-3 py-1 bg-gray-100 dark:bg-gray-700 text-gray-700 dark:text-gray-300 rounded text-sm font-medium disabled:opacity-50"
+              >
+                Next →
+              </button>
+            </div>
+          )}
         </div>
       )}
 
@@ -246,11 +291,13 @@ export default function TriageQueue() {
             </div>
 
             <div className="p-6 space-y-4">
-              <img
-                src={selectedPatient.imageData}
-                alt="X-ray"
-                className="w-full rounded-lg"
-              />
+              {selectedPatient.imageUrl && (
+                <img
+                  src={selectedPatient.imageUrl}
+                  alt="X-ray"
+                  className="w-full rounded-lg"
+                />
+              )}
               
               <div className="grid grid-cols-2 gap-4 text-sm">
                 <div>
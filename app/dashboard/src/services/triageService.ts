@@ -1,9 +1,14 @@
+import axios from 'axios'
 import { PredictionResult, CURB65Data, SeverityResult } from '../types'
 
+const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
+
 export interface PatientRecord {
   id: string
   timestamp: Date
-  imageData: string  // base64 encoded image
+  imageId: string | null
+  imageUrl: string | null  // full resolution, fetched only when a case is opened
+  thumbnailUrl: string | null  // small JPEG for queue views
   prediction: PredictionResult
   curb65Data: CURB65Data
   severityResult: SeverityResult
@@ -13,118 +18,102 @@ export interface PatientRecord {
   notes?: string
 }
 
-const STORAGE_KEY = 'pneumonia_triage_queue'
+export interface NewPatient {
+  imageId?: string  // from uploadImage
+  prediction: PredictionResult
+  curb65Data: CURB65Data
+  severityResult: SeverityResult
+  patientName?: string
+  patientAge?: number
+  notes?: string
+}
 
-export class TriageService {
-  
-  static getQueue(): PatientRecord[] {
-    try {
-      const data = localStorage.getItem(STORAGE_KEY)
-      if (!data) return []
-      
-      const records = JSON.parse(data) as PatientRecord[]
-      // Convert timestamp strings back to Date objects
-      const queue = records.map(record => ({
-        ...record,
-        timestamp: new Date(record.timestamp)
-      }))
-      
-      // Always return sorted queue by severity (highest first)
-      return this.sortBySeverity(queue)
-    } catch (error) {
-      console.error('Error loading triage queue:', error)
-      return []
-    }
-  }
+export interface QueuePage {
+  items: PatientRecord[]
+  total: number
+  offset: number
+  limit: number
+}
+
+export interface TriageStatistics {
+  total: number
+  waiting: number
+  inTreatment: number
+  completed: number
+  highSeverity: number
+  moderateSeverity: number
+  lowSeverity: number
+  avgWaitTime: number  // minutes
+}
+
+export const EMPTY_STATISTICS: TriageStatistics = {
+  total: 0,
+  waiting: 0,
+  inTreatment: 0,
+  completed: 0,
+  highSeverity: 0,
+  moderateSeverity: 0,
+  lowSeverity: 0,
+  avgWaitTime: 0,
+}
 
-  static saveQueue(queue: PatientRecord[]): void {
-    try {
-      localStorage.setItem(STORAGE_KEY, JSON.stringify(queue))
-    } catch (error) {
-      console.error('Error saving triage queue:', error)
-    }
+type RawPatientRecord = Omit<PatientRecord, 'timestamp'> & { timestamp: string }
+
+function toRecord(raw: RawPatientRecord): PatientRecord {
+  return {
+    ...raw,
+    timestamp: new Date(raw.timestamp),
+    imageUrl: raw.imageUrl ? `${API_BASE_URL}${raw.imageUrl}` : null,
+    thumbnailUrl: raw.thumbnailUrl ? `${API_BASE_URL}${raw.thumbnailUrl}` : null,
   }
+}
+
+/**
+ * Client for the server-side triage queue (/triage). Ordering by severity
+ * and arrival, pagination and statistics are all computed by the API.
+ */
+export class TriageService {
 
-  static addPatient(record: Omit<PatientRecord, 'id' | 'timestamp' | 'status'>): PatientRecord {
-    const newRecord: PatientRecord = {
-      ...record,
-      id: `patient-${Date.now()}-${Math.random().toString(36).substr(2, 9)}`,
-      timestamp: new Date(),
-      status: 'waiting'
-    }
-
-    const queue = this.getQueue()
-    queue.push(newRecord)
-    
-    // Sort by severity (highest first) and then by timestamp (oldest first)
-    const sortedQueue = this.sortBySeverity(queue)
-    this.saveQueue(sortedQueue)
-    
-    return newRecord
+  /** Store an X-ray in the server's content-addressed image store; returns its ID. */
+  static async uploadImage(image: Blob): Promise<string> {
+    const formData = new FormData()
+    formData.append('file', image, 'xray')
+    const response = await axios.post<{ imageId: string }>(`${API_BASE_URL}/images`, formData)
+    return response.data.imageId
   }
 
-  static sortBySeverity(queue: PatientRecord[]): PatientRecord[] {
-    return [...queue].sort((a, b) => {
-      // First priority: severity score (descending)
-      if (b.severityResult.finalSeverity !== a.severityResult.finalSeverity) {
-        return b.severityResult.finalSeverity - a.severityResult.finalSeverity
-      }
-      // Second priority: timestamp (ascending - earlier patients first)
-      return a.timestamp.getTime() - b.timestamp.getTime()
-    })
+  static async getQueue(
+    offset = 0,
+    limit = 20,
+    status?: PatientRecord['status']
+  ): Promise<QueuePage> {
+    const response = await axios.get<Omit<QueuePage, 'items'> & { items: RawPatientRecord[] }>(
+      `${API_BASE_URL}/triage/queue`,
+      { params: { offset, limit, status } }
+    )
+    return { ...response.data, items: response.data.items.map(toRecord) }
   }
 
-  static updatePatientStatus(id: string, status: PatientRecord['status']): void {
-    const queue = this.getQueue()
-    const index = queue.findIndex(record => record.id === id)
-    
-    if (index !== -1) {
-      queue[index].status = status
-      this.saveQueue(queue)
-    }
+  static async addPatient(record: NewPatient): Promise<PatientRecord> {
+    const response = await axios.post<RawPatientRecord>(`${API_BASE_URL}/triage/patients`, record)
+    return toRecord(response.data)
   }
 
-  static removePatient(id: string): void {
-    const queue = this.getQueue()
-    const filtered = queue.filter(record => record.id !== id)
-    this.saveQueue(filtered)
+  static async updatePatientStatus(id: string, status: PatientRecord['status']): Promise<PatientRecord> {
+    const response = await axios.patch<RawPatientRecord>(`${API_BASE_URL}/triage/patients/${id}`, { status })
+    return toRecord(response.data)
   }
 
-  static clearQueue(): void {
-    localStorage.removeItem(STORAGE_KEY)
+  static async removePatient(id: string): Promise<void> {
+    await axios.delete(`${API_BASE_URL}/triage/patients/${id}`)
   }
 
-  static getStatistics() {
-    const queue = this.getQueue()
-    
-    const waiting = queue.filter(p => p.status === 'waiting')
-    const inTreatment = queue.filter(p => p.status === 'in-treatment')
-    const completed = queue.filter(p => p.status === 'completed')
-    
-    const highSeverity = waiting.filter(p => p.severityResult.riskLevel === 'high').length
-    const moderateSeverity = waiting.filter(p => p.severityResult.riskLevel === 'moderate').length
-    const lowSeverity = waiting.filter(p => p.severityResult.riskLevel === 'low').length
-    
-    return {
-      total: queue.length,
-      waiting: waiting.length,
-      inTreatment: inTreatment.length,
-      completed: completed.length,
-      highSeverity,
-      moderateSeverity,
-      lowSeverity,
-      avgWaitTime: this.calculateAverageWaitTime(waiting)
-    }
+  static async clearQueue(): Promise<void> {
+    await axios.delete(`${API_BASE_URL}/triage/queue`)
   }
 
-  private static calculateAverageWaitTime(waiting: PatientRecord[]): number {
-    if (waiting.length === 0) return 0
-    
-    const now = new Date().getTime()
-    const totalWaitTime = waiting.reduce((sum, patient) => {
-      return sum + (now - patient.timestamp.getTime())
-    }, 0)
-    
-    return Math.floor(totalWaitTime / waiting.length / 1000 / 60) // minutes
+  static async getStatistics(): Promise<TriageStatistics> {
+    const response = await axios.get<TriageStatistics>(`${API_BASE_URL}/triage/stats`)
+    return response.data
   }
 }
@@ -12,26 +12,15 @@ import cv2
 import os
 
 from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
-from src.data.loader import CLASS_NAMES, IMG_SIZE
+from src.data.constants import CLASS_NAMES, IMG_SIZE
 from src.inference.severity import compute_severity_1_to_10
+from src.inference.postprocess import smart_threshold
+from src.inference.backends import CompiledKerasModel, warmup
+from src.inference.registry import read_version
 
-MODEL_PATH = "models/final/best_model.keras"
+MODEL_PATH = os.getenv("MODEL_PATH", "models/final/best_model.keras")
 DEFAULT_PNEUMONIA_MIN_CONFIDENCE = 0.65
 
-def smart_threshold(probs):
-    """
-    Reduce false VIRAL positives by adjusting probability distribution
-    """
-    probs = np.array(probs, dtype=np.float32)
-    probs[2] *= 0.75  # Reduce VIRAL bias
-    if probs[0] > 0.20:
-        probs[0] *= 1.3  # Boost NORMAL
-    probs = probs / np.sum(probs)
-    pred_idx = int(np.argmax(probs))
-    if pred_idx == 2 and probs[2] < 0.70:
-        pred_idx = 0 if probs[0] > probs[1] else 1
-    return pred_idx, probs
-
 st.set_page_config(page_title="Pneumonia Classifier", layout="centered")
 
 st.title("🩻 Pneumonia Classification Demo")
@@ -45,12 +34,20 @@ pneumonia_min_conf = st.slider(
     step=0.01
 )
 
-# Load model once
-@st.cache_resource
-def load_model():
-    return tf.keras.models.load_model(MODEL_PATH)
-
-model = load_model()
+# Load each model version once, traced for single images and warmed up. The
+# cache key includes the file's mtime and size, so replacing the model file
+# loads the new version on the next rerun without restarting the app.
+@st.cache_resource(max_entries=2)
+def load_model(model_path, mtime_ns, size):
+    version = read_version(model_path)
+    compiled = CompiledKerasModel(tf.keras.models.load_model(model_path), buckets=(1,))
+    latencies = warmup(compiled, buckets=(1,))
+    print(f"🔥 {version.id} warm single-image latency: {latencies[1]:.1f}ms")
+    return compiled, version.id
+
+model_stat = os.stat(MODEL_PATH)
+model, model_version = load_model(MODEL_PATH, model_stat.st_mtime_ns, model_stat.st_size)
+st.caption(f"Model version: {model_version}")
 
 uploaded = st.file_uploader("Upload X-ray Image", type=["jpg","jpeg","png"])
 
@@ -0,0 +1,87 @@
+"""
+Cold-start benchmark for the API server.
+
+Starts `uvicorn src.api.main:app` in a fresh process and polls /health
+(liveness: port bound) and /ready (model loaded and warmed), reporting
+wall-clock time to each plus the per-phase breakdown the server records
+in /ready. Also times a bare `import tensorflow` for reference.
+
+Usage:
+    python -m src.api.bench_startup
+    python -m src.api.bench_startup --runs 3 --port 8765
+(MODEL_PATH / INFERENCE_BACKEND etc. are passed through to the server)
+"""
+import sys
+import json
+import time
+import argparse
+import subprocess
+import urllib.request
+import urllib.error
+
+POLL_INTERVAL_S = 0.02
+
+
+def _get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None, None
+
+
+def measure(port, timeout):
+    """One cold start: seconds until /health answers and until /ready returns 200."""
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.api.main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    health_s = ready_s = body = None
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}")
+            if health_s is None:
+                status, _ = _get(f"http://127.0.0.1:{port}/health")
+                if status == 200:
+                    health_s = time.perf_counter() - start
+            else:
+                status, body = _get(f"http://127.0.0.1:{port}/ready")
+                if status == 200:
+                    ready_s = time.perf_counter() - start
+                    break
+                if body and body.get("state") == "failed":
+                    raise RuntimeError(f"Model load failed: {body.get('error')}")
+            time.sleep(POLL_INTERVAL_S)
+    finally:
+        server.terminate()
+        server.wait()
+    return health_s, ready_s, (body or {}).get("startup_seconds", {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import tensorflow"], check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    tf_import_s = time.perf_counter() - start
+    print(f"Reference: python + import tensorflow = {tf_import_s:.2f}s")
+
+    for run in range(1, args.runs + 1):
+        health_s, ready_s, phases = measure(args.port, args.timeout)
+        ready = f"{ready_s:.2f}s" if ready_s is not None else "timed out"
+        print(f"Run {run}: /health after {health_s:.2f}s, /ready after {ready}")
+        if phases:
+            print("   " + ", ".join(f"{phase}={seconds:.2f}s" for phase, seconds in phases.items()))
+
+
+if __name__ == "__main__":
+    main()
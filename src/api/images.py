@@ -0,0 +1,239 @@
+"""
+Content-addressed on-disk store for uploaded X-rays, with cached thumbnails.
+
+Each image is written once under IMAGE_STORE_DIR as blobs/<ab>/<sha256>,
+where the SHA-256 of its bytes is the image ID. Uploading the same bytes
+again reuses the stored file. Records (e.g. triage patients) keep only the
+ID; blobs no record refers to are deleted by a periodic sweep
+(triage.collect_images) once they are older than a grace period, so an
+upload is never collected before the record that uses it is added.
+Thumbnails are generated on first request with a reduced-resolution
+decode, then kept as JPEGs under thumbs/<size>/. Content never changes
+for an ID, so responses carry an ETag and a long immutable Cache-Control,
+and clients revalidate with If-None-Match (304).
+"""
+import os
+import re
+import uuid
+import asyncio
+
+import cv2
+from fastapi import APIRouter, File, HTTPException, Query, Request, Response, UploadFile
+from fastapi.responses import FileResponse
+
+from src.data.decode import decode_grayscale, ImageTooLarge, MAX_IMAGE_BYTES
+from src.data.dicom import is_dicom, decode_dicom_gray
+from src.inference.cache import content_hash
+
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "data/images")
+THUMBNAIL_SIZES = (96, 160, 320)
+DEFAULT_THUMBNAIL_SIZE = 160
+THUMBNAIL_QUALITY = 80
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+_IMAGE_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+def sniff_media_type(head):
+    """Media type from the first bytes of a file, or None if it is not a supported image."""
+    head = bytes(head[:132])
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if is_dicom(head):
+        return "application/dicom"
+    return None
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class ImageStore:
+    """Images on disk keyed by the SHA-256 of their bytes."""
+
+    def __init__(self, root=IMAGE_STORE_DIR):
+        self.root = root
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+
+    @staticmethod
+    def valid_id(image_id):
+        return bool(_IMAGE_ID.match(image_id))
+
+    def path(self, image_id):
+        return os.path.join(self.root, "blobs", image_id[:2], image_id)
+
+    def thumbnail_path(self, image_id, size):
+        return os.path.join(self.root, "thumbs", str(size), image_id[:2], f"{image_id}.jpg")
+
+    def exists(self, image_id):
+        return self.valid_id(image_id) and os.path.exists(self.path(image_id))
+
+    def put(self, contents):
+        """Store image bytes once; returns (image_id, media_type). Raises ValueError for non-images."""
+        media_type = sniff_media_type(contents)
+        if media_type is None:
+            raise ValueError("Not a PNG, JPEG or DICOM image")
+        image_id = content_hash(contents)
+        path = self.path(image_id)
+        try:
+            # Re-uploads restart the garbage-collection grace period
+            os.utime(path)
+        except FileNotFoundError:
+            _write_atomic(path, contents)
+        return image_id, media_type
+
+    def stored_before(self, cutoff):
+        """IDs of images last uploaded before `cutoff` (epoch seconds)."""
+        blobs = os.path.join(self.root, "blobs")
+        for prefix in os.listdir(blobs):
+            for entry in os.scandir(os.path.join(blobs, prefix)):
+                if self.valid_id(entry.name) and entry.stat().st_mtime < cutoff:
+                    yield entry.name
+
+    def media_type(self, image_id):
+        with open(self.path(image_id), "rb") as f:
+            return sniff_media_type(f.read(132)) or "application/octet-stream"
+
+    def thumbnail(self, image_id, size=DEFAULT_THUMBNAIL_SIZE):
+        """
+        Path of the JPEG thumbnail (longest side `size`), generated on first
+        use. Returns None if the stored image cannot be decoded.
+        """
+        path = self.thumbnail_path(image_id, size)
+        if os.path.exists(path):
+            return path
+
+        with open(self.path(image_id), "rb") as f:
+            contents = f.read()
+        decode = decode_dicom_gray if is_dicom(contents) else decode_grayscale
+        # Reduced decode: large JPEGs are decoded at 1/2-1/8 scale, never below `size`
+        gray = decode(contents, (size, size), reduced=True, max_bytes=None)
+        if gray is None:
+            return None
+
+        h, w = gray.shape[:2]
+        scale = size / max(h, w)
+        if scale < 1:
+            gray = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", gray, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])
+        if not ok:
+            return None
+        _write_atomic(path, encoded.tobytes())
+        return path
+
+    def delete(self, image_id):
+        """Remove an image and its thumbnails (the caller checks it is no longer referenced)."""
+        paths = [self.path(image_id)] + [self.thumbnail_path(image_id, size) for size in THUMBNAIL_SIZES]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+store = None
+
+
+def open_store(root=IMAGE_STORE_DIR):
+    global store
+    if store is None:
+        store = ImageStore(root)
+        print(f"✅ Image store ready ({root})")
+    return store
+
+
+def image_urls(image_id):
+    """URLs a record exposes for a stored image."""
+    if image_id is None:
+        return {"imageId": None, "imageUrl": None, "thumbnailUrl": None}
+    return {
+        "imageId": image_id,
+        "imageUrl": f"/images/{image_id}",
+        "thumbnailUrl": f"/images/{image_id}/thumbnail",
+    }
+
+
+def _store():
+    if store is None:
+        raise HTTPException(status_code=503, detail="Image store not available")
+    return store
+
+
+def _existing(image_id):
+    images = _store()
+    if not images.exists(image_id):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return images
+
+
+def save_upload(contents):
+    """Store uploaded bytes; returns (image_id, media_type) or raises 413/415."""
+    if len(contents) > MAX_IMAGE_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {MAX_IMAGE_BYTES} bytes")
+    try:
+        return _store().put(contents)
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+
+def is_stored(image_id):
+    return _store().exists(image_id)
+
+
+def _not_modified(request, etag):
+    # Content is immutable per ID, so a matching ETag is always still valid
+    if etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    return None
+
+
+router = APIRouter(prefix="/images", tags=["images"])
+
+
+@router.post("", status_code=201)
+async def upload_image(file: UploadFile = File(...)):
+    """Store an X-ray once; returns its ID (SHA-256 of the bytes) and URLs."""
+    contents = await file.read()
+    # Hashing and the write run off the event loop
+    image_id, media_type = await asyncio.to_thread(save_upload, contents)
+    return {**image_urls(image_id), "mediaType": media_type, "bytes": len(contents)}
+
+
+@router.get("/{image_id}")
+def get_image(image_id: str, request: Request):
+    """Full-resolution image as uploaded."""
+    images = _existing(image_id)
+    etag = f'"{image_id}"'
+    cached = _not_modified(request, etag)
+    if cached is not None:
+        return cached
+    return FileResponse(
+        images.path(image_id),
+        media_type=images.media_type(image_id),
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
+    )
+
+
+@router.get("/{image_id}/thumbnail")
+def get_thumbnail(image_id: str, request: Request, size: int = Query(DEFAULT_THUMBNAIL_SIZE)):
+    """Grayscale JPEG thumbnail, longest side `size` (one of THUMBNAIL_SIZES)."""
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {THUMBNAIL_SIZES}")
+    images = _existing(image_id)
+    etag = f'"{image_id}-{size}"'
+    cached = _not_modified(request, etag)
+    if cached is not None:
+        return cached
+    try:
+        path = images.thumbnail(image_id, size)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if path is None:
+        raise HTTPException(status_code=415, detail="Stored image could not be decoded")
+    return FileResponse(path, media_type="image/jpeg", headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
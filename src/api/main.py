@@ -1,21 +1,48 @@
 import os
 import sys
+import io
+import time
+import hmac
+import json
+import asyncio
+import zipfile
+import functools
 from pathlib import Path
+from typing import List, Optional
+
+# Cold start is measured from here: module imports, then the background model load
+IMPORT_START = time.perf_counter()
 
 # Add project root to path
 ROOT_DIR = Path(__file__).resolve().parents[2]
 sys.path.insert(0, str(ROOT_DIR))
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import tensorflow as tf
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 import numpy as np
 import cv2
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
-from src.data.loader import CLASS_NAMES, IMG_SIZE
-from src.inference.severity import compute_severity_1_to_10
-from src.data.xray_preprocess import apply_clahe
+from src.data.constants import CLASS_NAMES
+from src.inference.batching import MicroBatcher
+from src.inference.executor import StageExecutor, PREPROCESS_STAGE, INFERENCE_STAGE
+from src.inference.predict import (
+    build_prediction, build_predictions, decode_and_enhance_timed, to_model_input, BatchBuffer,
+)
+from src.data.decode import ImageTooLarge
+from src.data.dicom import DICOM_EXTENSIONS, DICOM_CONTENT_TYPES, is_dicom_path
+from src.inference.cache import PredictionCache, content_hash, model_fingerprint
+from src.inference.workers import InferenceWorkerPool, WorkerPoolFull
+from src.inference.registry import ModelRegistry
+from src.inference.cascade import CascadeModel, CASCADE_MAX_ENTROPY, CASCADE_MIN_MARGIN, load_test_set_results
+# TensorFlow (src.inference.backends, src.explainability.gradcam) is imported
+# in the background model load, so the server binds its port immediately
+from src.api.metrics import (
+    registry, MetricsMiddleware, CallbackMetric, CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    ERRORS, IMAGES, STAGE_LATENCY, STARTUP, MODEL_PREDICTIONS, SHADOW_PREDICTIONS, MODEL_SWAPS,
+    observe_stages,
+)
+from src.api.profiling import Profiler, ProfilingMiddleware
+from src.api import triage, images
 
 app = FastAPI(title="Pneumonia Classification API", version="1.0.0")
 
@@ -28,20 +55,455 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load model globally
-MODEL_PATH = "models/final/best_model.keras"
-model = None
+# Per-endpoint request counts, bytes, latency and in-flight gauges (/metrics)
+app.add_middleware(
+    MetricsMiddleware,
+    endpoints=[
+        "/predict", "/predict/batch", "/explain", "/health", "/ready", "/stats", "/metrics",
+        "/triage/queue", "/triage/stats", "/triage/patients", "/triage/patients/{patient_id}",
+        "/images", "/images/{image_id}", "/images/{image_id}/thumbnail",
+    ],
+)
 
+# Triage queue (SQLite, TRIAGE_DB_PATH) under /triage
+app.include_router(triage.router)
+# Content-addressed X-ray store with thumbnails (IMAGE_STORE_DIR) under /images
+app.include_router(images.router)
 
-@app.on_event("startup")
-async def load_model_on_startup():
-    global model
+# On-demand profiling; the /admin endpoints are disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "outputs/profiles")
+PROFILE_MAX_SECONDS = 600
+PROFILE_MAX_REQUESTS = 100_000
+profiler = Profiler(PROFILE_DIR)
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# Served models: the registry's active version is set only once it is loaded and
+# warmed (see /ready); new versions are loaded next to it and swapped in (/admin/models)
+MODEL_PATH = os.getenv("MODEL_PATH", "models/final/best_model.keras")
+MODEL_KEEP_PREVIOUS = int(os.getenv("MODEL_KEEP_PREVIOUS", "1"))
+# Poll the active model file and hot-swap when it changes (0 = off)
+MODEL_WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "0"))
+model_registry = None
+watch_task = None
+image_gc_task = None
+shadow_tasks = set()
+
+# Background model load: "loading" -> "ready" or "failed"
+readiness = {"state": "starting", "error": None, "timings": {}}
+model_task = None
+
+# Serving backend: "keras" (MODEL_PATH) or "tflite" (TFLITE_MODEL_PATH, see src/models/export_tflite.py)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "keras")
+TFLITE_MODEL_PATH = os.getenv("TFLITE_MODEL_PATH", "models/final/best_model_int8.tflite")
+# Batch sizes the serving function is traced and warmed for
+SERVING_BUCKETS = tuple(int(b) for b in os.getenv("SERVING_BUCKETS", "1,4,8,16").split(","))
+
+# Micro-batching: concurrent /predict calls share one forward pass
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+
+# Blocking stages (decode/CLAHE/resize, model calls) run off the event loop
+EXECUTOR_KIND = os.getenv("EXECUTOR_KIND", "thread")  # "thread" or "process"
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", "0")) or None
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+executor = None
+
+# Multi-replica serving: with INFERENCE_REPLICAS > 0 the model runs in that many
+# worker processes (one replica each, pinned to disjoint CPUs) instead of here
+INFERENCE_REPLICAS = int(os.getenv("INFERENCE_REPLICAS", "0"))
+INFERENCE_INTRA_OP_THREADS = int(os.getenv("INFERENCE_INTRA_OP_THREADS", "0")) or None
+INFERENCE_INTER_OP_THREADS = int(os.getenv("INFERENCE_INTER_OP_THREADS", "1"))
+INFERENCE_PIN_CPUS = os.getenv("INFERENCE_PIN_CPUS", "1") == "1"
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "0")) or None
+
+# Cascade: a small screening model (src/models/train_screening.py) scores every image
+# and only uncertain ones go to the full model (in-process serving only, not with replicas)
+CASCADE_MODEL_PATH = os.getenv("CASCADE_MODEL_PATH", "")
+# Test-set measurements from python -m src.models.eval_cascade, exposed in /metrics
+CASCADE_REPORT_PATH = os.getenv("CASCADE_REPORT_PATH", "outputs/reports/cascade.json")
+cascade_test_set = None
+
+# Decode budgets; large images are decoded at reduced resolution straight to grayscale
+DECODE_MAX_BYTES = int(os.getenv("DECODE_MAX_BYTES", str(50 * 1024 * 1024)))
+DECODE_MAX_PIXELS = int(os.getenv("DECODE_MAX_PIXELS", "50000000"))
+REDUCED_DECODE = os.getenv("REDUCED_DECODE", "1") == "1"
+decode_image = functools.partial(
+    decode_and_enhance_timed,
+    reduced=REDUCED_DECODE,
+    max_bytes=DECODE_MAX_BYTES,
+    max_pixels=DECODE_MAX_PIXELS,
+)
+
+# /predict/batch: images per forward pass and per request
+BATCH_PREDICT_SIZE = int(os.getenv("BATCH_PREDICT_SIZE", "16"))
+BATCH_PREDICT_MAX_FILES = int(os.getenv("BATCH_PREDICT_MAX_FILES", "1000"))
+# Uncompressed bytes per request, zip members counted from their declared size
+BATCH_PREDICT_MAX_BYTES = int(os.getenv("BATCH_PREDICT_MAX_BYTES", str(512 * 1024 * 1024)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png") + DICOM_EXTENSIONS
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+
+# /explain output images
+EXPLAIN_OUTPUTS = ("overlay", "heatmap", "red")
+
+# Repeat uploads of the same bytes reuse the cached prediction
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "4096")),
+    max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    ttl_seconds=float(os.getenv("CACHE_TTL_SECONDS", "3600")),
+)
+
+
+def predict_batch(model, x):
+    """Run a loaded model on a stacked (N, 224, 224, 3) batch."""
+    with STAGE_LATENCY.time(stage="model"):
+        return model.predict(x, verbose=0)
+
+
+async def pool_predict(pool, images):
+    """Run a stacked grayscale (N, 224, 224) batch on the next free replica of a worker pool."""
+    with STAGE_LATENCY.time(stage="model"):
+        return await pool.submit(images)
+
+
+def _active():
+    return model_registry.active if model_registry is not None else None
+
+
+def _active_pool():
+    """Worker pool of the active model version (INFERENCE_REPLICAS > 0), else None."""
+    active = _active()
+    return active.model if active is not None and isinstance(active.model, InferenceWorkerPool) else None
+
+
+def _active_cascade():
+    """Cascade of the active model version (CASCADE_MODEL_PATH), else None."""
+    active = _active()
+    return active.model if active is not None and isinstance(active.model, CascadeModel) else None
+
+
+def _serving_version(endpoint):
+    """(version to serve this request, version to shadow it on or None); 503 until a model is ready."""
+    if model_registry is None or model_registry.active is None:
+        raise _error(endpoint, 503, "model_not_loaded", "Model not loaded")
+    return model_registry.route()
+
+
+async def preprocess(contents):
+    """Decode + CLAHE + resize on the preprocess pool, recording each stage's latency."""
+    image, timings = await executor.run(PREPROCESS_STAGE, decode_image, contents)
+    observe_stages(timings)
+    return image
+
+
+def _error(endpoint, status_code, cause, detail):
+    """HTTPException counted in xray_errors_total{endpoint, cause}."""
+    ERRORS.inc(endpoint=endpoint, cause=cause)
+    return HTTPException(status_code=status_code, detail=detail)
+
+
+def _executor_gauge(field):
+    def read():
+        if executor is None:
+            return None
+        return {(stage,): counters[field] for stage, counters in executor.stats()["stages"].items()}
+    return read
+
+
+# Scrape-time views of state owned by the batcher, executor and cache
+def _loaded_versions():
+    if model_registry is None:
+        return []
+    return [v for v in [model_registry.active, model_registry.canary] + model_registry.previous if v is not None]
+
+
+registry.register(CallbackMetric(
+    "xray_batch_queue_depth", "Images waiting for the micro-batcher of the active model",
+    lambda: _active().batcher.stats()["queued"] if _active() is not None else None,
+))
+registry.register(CallbackMetric(
+    "xray_model_in_flight", "Requests being served per loaded model version",
+    lambda: {(v.id,): v.in_flight for v in _loaded_versions()}, ("version",),
+))
+registry.register(CallbackMetric(
+    "xray_executor_in_flight", "Tasks running or queued per executor stage",
+    _executor_gauge("in_flight"), ("stage",),
+))
+registry.register(CallbackMetric(
+    "xray_executor_queue_depth", "Tasks waiting for a worker per executor stage",
+    _executor_gauge("queue_depth"), ("stage",),
+))
+registry.register(CallbackMetric(
+    "xray_workers_busy", "Inference replicas running a batch (INFERENCE_REPLICAS > 0)",
+    lambda: _active_pool().stats()["busy"] if _active_pool() is not None else None,
+))
+registry.register(CallbackMetric(
+    "xray_worker_queue_depth", "Batches waiting for a free inference replica",
+    lambda: _active_pool().stats()["queue_depth"] if _active_pool() is not None else None,
+))
+registry.register(CallbackMetric(
+    "xray_worker_rejected_total", "Batches rejected because the replica queue was full",
+    lambda: _active_pool().rejected if _active_pool() is not None else None,
+    kind="counter",
+))
+registry.register(CallbackMetric(
+    "xray_cascade_images_total", "Images scored by the cascade, by route (screened: screening model only, escalated)",
+    lambda: {
+        ("screened",): _active_cascade().images - _active_cascade().escalated,
+        ("escalated",): _active_cascade().escalated,
+    } if _active_cascade() is not None else None,
+    ("route",), kind="counter",
+))
+registry.register(CallbackMetric(
+    "xray_cascade_escalated_agree_total",
+    "Escalated images where the screening model's class matched the full model's",
+    lambda: _active_cascade().escalated_agreed if _active_cascade() is not None else None,
+    kind="counter",
+))
+registry.register(CallbackMetric(
+    "xray_cascade_model_seconds_total", "Time spent in each model of the cascade",
+    lambda: {
+        ("screen",): _active_cascade().screen_seconds,
+        ("full",): _active_cascade().full_seconds,
+    } if _active_cascade() is not None else None,
+    ("model",), kind="counter",
+))
+registry.register(CallbackMetric(
+    "xray_cascade_test_set",
+    "Test-set escalation_rate, latency_saved (measured end to end), agreement (with the full model) "
+    "and macro_recall at the serving thresholds (CASCADE_REPORT_PATH)",
+    lambda: {
+        (metric,): cascade_test_set[metric]
+        for metric in ("escalation_rate", "latency_saved", "agreement", "macro_recall")
+        if metric in cascade_test_set
+    } if cascade_test_set is not None and _active_cascade() is not None else None,
+    ("metric",),
+))
+registry.register(CallbackMetric(
+    "xray_cache_entries", "Predictions held in the cache", lambda: prediction_cache.stats()["entries"],
+))
+registry.register(CallbackMetric(
+    "xray_cache_bytes", "Approximate size of the prediction cache", lambda: prediction_cache.stats()["bytes"],
+))
+registry.register(CallbackMetric(
+    "xray_cache_evictions_total", "Predictions evicted from the cache (LRU or TTL)",
+    lambda: prediction_cache.stats()["evictions"] + prediction_cache.stats()["expirations"],
+    kind="counter",
+))
+
+
+def _record_phase(phase, seconds):
+    readiness["timings"][phase] = round(seconds, 3)
+    STARTUP.set(seconds, phase=phase)
+
+
+def _phase_recorder(version):
+    """Load phases go to version.timings, and to the startup gauges for the first model."""
+    first = model_registry.active is None
+
+    def record(phase, seconds):
+        version.timings[phase] = round(seconds, 3)
+        if first:
+            _record_phase(phase, seconds)
+    return record
+
+
+def _start_worker_pool(model_path, record):
+    """Spawn the inference replicas; each imports TensorFlow, loads and warms its model in parallel."""
+    start = time.perf_counter()
+    pool = InferenceWorkerPool(
+        INFERENCE_BACKEND,
+        model_path,
+        INFERENCE_REPLICAS,
+        buckets=SERVING_BUCKETS,
+        intra_op_threads=INFERENCE_INTRA_OP_THREADS,
+        inter_op_threads=INFERENCE_INTER_OP_THREADS,
+        pin_cpus=INFERENCE_PIN_CPUS,
+        max_queue=INFERENCE_QUEUE_SIZE,
+        max_batch=max(BATCH_MAX_SIZE, BATCH_PREDICT_SIZE),
+    )
+    latencies = pool.start()
+    record("model_load", time.perf_counter() - start)
+    print(f"✅ {INFERENCE_REPLICAS} inference replicas loaded from {model_path} ({INFERENCE_BACKEND} backend, "
+          f"{pool.intra_op_threads} intra-op threads each)")
+    for index, worker_latencies in latencies.items():
+        cpus = pool.stats()["workers"][index]["cpus"]
+        print(f"🔥 Replica {index} (CPUs {cpus if cpus else 'unpinned'}): " + ", ".join(
+            f"{b}={ms:.1f}ms" for b, ms in worker_latencies.items()
+        ))
+    return pool
+
+
+def _load_model_blocking(model_path, record):
+    """Import TensorFlow, load the model and warm every serving bucket (runs in a thread)."""
+    start = time.perf_counter()
+    from src.inference.backends import load_inference_model, warmup
+    record("import_tensorflow", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    loaded = load_inference_model(INFERENCE_BACKEND, model_path, buckets=SERVING_BUCKETS)
+    screen = None
+    if CASCADE_MODEL_PATH:
+        screen = load_inference_model(INFERENCE_BACKEND, CASCADE_MODEL_PATH, buckets=SERVING_BUCKETS)
+    record("model_load", time.perf_counter() - start)
+    print(f"✅ Model loaded successfully from {model_path} ({INFERENCE_BACKEND} backend)")
+
+    # Pay tracing cost now rather than on the first real request
+    start = time.perf_counter()
+    latencies = warmup(loaded, SERVING_BUCKETS)
+    screen_latencies = warmup(screen, SERVING_BUCKETS) if screen is not None else None
+    record("warmup", time.perf_counter() - start)
+    print("🔥 Warm latency per batch bucket: " + ", ".join(
+        f"{b}={ms:.1f}ms" for b, ms in latencies.items()
+    ))
+    if screen is None:
+        return loaded
+
+    print(f"✅ Cascade enabled: screening model {CASCADE_MODEL_PATH}, escalating at normalized entropy > "
+          f"{CASCADE_MAX_ENTROPY} or margin < {CASCADE_MIN_MARGIN}")
+    print("🔥 Screening model warm latency per batch bucket: " + ", ".join(
+        f"{b}={ms:.1f}ms" for b, ms in screen_latencies.items()
+    ))
+    return CascadeModel(screen, loaded, CASCADE_MAX_ENTROPY, CASCADE_MIN_MARGIN)
+
+
+async def _load_version(version):
+    """Registry load_fn: load + warm a model version off the event loop and start its micro-batcher."""
+    record = _phase_recorder(version)
+    if INFERENCE_REPLICAS:
+        loaded = await asyncio.to_thread(_start_worker_pool, version.model_path, record)
+        # One batch in flight per replica; grayscale batches are stacked as uint8
+        batcher = MicroBatcher(
+            functools.partial(pool_predict, loaded),
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait_ms=BATCH_MAX_WAIT_MS,
+            max_concurrency=INFERENCE_REPLICAS,
+        )
+    else:
+        loaded = await asyncio.to_thread(_load_model_blocking, version.model_path, record)
+        batcher = MicroBatcher(
+            functools.partial(predict_batch, loaded),
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait_ms=BATCH_MAX_WAIT_MS,
+            executor=executor,
+            # Grayscale images are broadcast to 3 channels straight into a reused buffer
+            collate_fn=BatchBuffer(BATCH_MAX_SIZE).fill,
+        )
+    await batcher.start()
+    version.batcher = batcher
+    version.model = loaded
+
+
+async def _unload_version(version):
+    """Registry unload_fn: drain the version's micro-batcher and release its model (or replicas)."""
+    if version.batcher is not None:
+        await version.batcher.stop()
+    if isinstance(version.model, InferenceWorkerPool):
+        await asyncio.to_thread(version.model.shutdown)
+    version.model = version.batcher = version.explain_model = None
+    version.explain_engines = {}
+
+
+async def _swap(event, action, *args):
+    """Run a registry change; the prediction cache follows the active version."""
+    version = await action(*args)
+    MODEL_SWAPS.inc(event=event)
+    prediction_cache.set_model_version(model_registry.active.id)
+    return version
+
+
+async def _load_model_in_background():
+    readiness["state"] = "loading"
+    model_path = TFLITE_MODEL_PATH if INFERENCE_BACKEND == "tflite" else MODEL_PATH
     try:
-        model = tf.keras.models.load_model(MODEL_PATH)
-        print(f"✅ Model loaded successfully from {MODEL_PATH}")
+        version = await _swap("activate", model_registry.activate, model_path)
+        print(f"✅ Micro-batching enabled (max batch {BATCH_MAX_SIZE}, max wait {BATCH_MAX_WAIT_MS} ms)")
     except Exception as e:
+        readiness.update(state="failed", error=str(e))
         print(f"❌ Error loading model: {e}")
-        raise
+        return
+
+    readiness["state"] = "ready"
+    _record_phase("ready", time.perf_counter() - IMPORT_START)
+    print(f"✅ Ready {readiness['timings']['ready']:.1f}s after import, serving {version.id} "
+          f"({readiness['timings']})")
+
+
+def _file_state(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+async def _watch_active_model():
+    """Hot-swap when the active model file is replaced (MODEL_WATCH_SECONDS)."""
+    last_state = {}  # path -> file state at the last poll
+    checked_state = {}  # path -> file state last compared with the active model
+    while True:
+        await asyncio.sleep(MODEL_WATCH_SECONDS)
+        active = _active()
+        if active is None:
+            continue
+        path = active.model_path
+        state = _file_state(path)
+        previous, last_state[path] = last_state.get(path), state
+        # Only look at a file once it has stopped changing for one poll (no half-written models)
+        if state is None or state != previous or state == checked_state.get(path):
+            continue
+        checked_state[path] = state
+        if await asyncio.to_thread(model_fingerprint, path) == active.fingerprint:
+            continue
+        try:
+            await _swap("activate", model_registry.activate, path)
+        except Exception as e:
+            # Not retried until the file changes again
+            print(f"❌ Could not reload {path}: {e}")
+
+
+@app.on_event("startup")
+async def start_on_startup():
+    """Open the stores and executor, then load the model in the background so the port binds now."""
+    global executor, model_registry, model_task, watch_task, image_gc_task, cascade_test_set
+    images.open_store()
+    triage.open_store()
+    image_gc_task = asyncio.create_task(triage.collect_images_periodically())
+
+    executor = StageExecutor(
+        kind=EXECUTOR_KIND,
+        preprocess_workers=PREPROCESS_WORKERS,
+        inference_workers=INFERENCE_WORKERS,
+    )
+    print(f"✅ Executor ready ({EXECUTOR_KIND} pool for preprocessing)")
+
+    if CASCADE_MODEL_PATH and INFERENCE_REPLICAS:
+        print("⚠️ CASCADE_MODEL_PATH is ignored with INFERENCE_REPLICAS > 0 (the cascade runs in-process)")
+    elif CASCADE_MODEL_PATH:
+        cascade_test_set = load_test_set_results(CASCADE_REPORT_PATH, CASCADE_MAX_ENTROPY, CASCADE_MIN_MARGIN)
+        if cascade_test_set is None:
+            print(f"⚠️ No test-set cascade results for these thresholds in {CASCADE_REPORT_PATH} "
+                  "(python -m src.models.eval_cascade)")
+
+    model_registry = ModelRegistry(_load_version, _unload_version, keep_previous=MODEL_KEEP_PREVIOUS)
+    model_task = asyncio.create_task(_load_model_in_background())
+    if MODEL_WATCH_SECONDS > 0:
+        watch_task = asyncio.create_task(_watch_active_model())
+    _record_phase("startup", time.perf_counter() - IMPORT_START)
+    print(f"✅ Serving /health {readiness['timings']['startup']:.1f}s after import; model loading in the background")
+
+
+@app.on_event("shutdown")
+async def stop_batcher_on_shutdown():
+    for task in (model_task, watch_task, image_gc_task):
+        if task is not None and not task.done():
+            # A load thread itself cannot be interrupted; stop waiting on it
+            task.cancel()
+    if model_registry is not None:
+        await model_registry.unload_all()
+    if executor is not None:
+        executor.shutdown(wait=False)
+    triage.close_store()
 
 
 @app.get("/")
@@ -51,67 +513,557 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "model_loaded": model is not None}
+    """Liveness: the process is up and serving requests, whether or not the model is loaded yet."""
+    active = _active()
+    return {
+        "status": "healthy",
+        "model_loaded": active is not None,
+        "model_version": active.id if active is not None else None,
+        "backend": INFERENCE_BACKEND,
+    }
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the model is loaded and warmed, 503 while loading or after a failed load."""
+    active = _active()
+    body = {
+        "ready": active is not None,
+        "state": readiness["state"],
+        "model_version": active.id if active is not None else None,
+        "backend": INFERENCE_BACKEND,
+        "startup_seconds": readiness["timings"],
+    }
+    if readiness["error"]:
+        body["error"] = readiness["error"]
+    return JSONResponse(body, status_code=200 if active is not None else 503)
+
+
+@app.get("/stats")
+async def stats():
+    """Serving statistics: batching, per-stage queue depth, prediction cache, cascade and model versions."""
+    active, pool, cascade = _active(), _active_pool(), _active_cascade()
+    return {
+        "batching": active.batcher.stats() if active is not None else None,
+        "executor": executor.stats() if executor is not None else None,
+        "cache": prediction_cache.stats(),
+        "workers": pool.stats() if pool is not None else None,
+        "cascade": {**cascade.stats(), "test_set": cascade_test_set} if cascade is not None else None,
+        "models": {
+            "active": active.id if active is not None else None,
+            "canary": model_registry.canary.id if model_registry and model_registry.canary else None,
+            "previous": [v.id for v in model_registry.previous] if model_registry else [],
+        },
+        "startup": {"state": readiness["state"], "seconds": readiness["timings"]},
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text-format metrics: per-stage latency histograms, request/byte/error counters, gauges."""
+    return Response(content=registry.render(), media_type=METRICS_CONTENT_TYPE)
 
 
 @app.post("/predict")
 async def predict_image(file: UploadFile = File(...)):
     """
     Predict pneumonia classification from uploaded X-ray image.
-    Returns: classification, confidence, probabilities, and base severity score.
+    Returns: classification, confidence, probabilities, base severity score and
+    the model version that produced them (also in the X-Model-Version header).
     """
-    if model is None:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+    served, shadow = _serving_version("/predict")
+
+    if not _is_image_upload(file):
+        raise _error("/predict", 400, "not_an_image", "File must be an image")
+
+    if file.size is not None and file.size > DECODE_MAX_BYTES:
+        raise _error("/predict", 413, "too_large", f"Image exceeds {DECODE_MAX_BYTES} bytes")
+
+    # The version stays loaded until this request is done with it, even if it is swapped out meanwhile
+    with served.use():
+        try:
+            contents = await file.read()
+            digest = content_hash(contents)
+            cached = prediction_cache.get(digest, served.id)
+            if cached is not None:
+                IMAGES.inc(endpoint="/predict", cache="hit")
+                return _prediction_response(cached, served, "HIT")
+
+            x = await preprocess(contents)
+
+            if x is None:
+                raise _error("/predict", 400, "decode_failed", "Could not decode image")
+
+            # Batched with any concurrent requests
+            with STAGE_LATENCY.time(stage="inference"):
+                probs = await served.batcher.submit(x)
+
+            with STAGE_LATENCY.time(stage="severity"):
+                prediction = build_prediction(probs)
+            prediction_cache.put(digest, prediction, served.id)
+            IMAGES.inc(endpoint="/predict", cache="miss")
+            MODEL_PREDICTIONS.inc(version=served.id)
+            if shadow is not None:
+                _start_shadow(shadow, x, prediction)
+            return _prediction_response(prediction, served, "MISS")
+
+        except HTTPException:
+            raise
+        except ImageTooLarge as e:
+            raise _error("/predict", 413, "too_large", str(e))
+        except WorkerPoolFull as e:
+            raise _error("/predict", 503, "overloaded", str(e))
+        except Exception as e:
+            raise _error("/predict", 500, "internal", f"Prediction error: {str(e)}")
+
+
+def _prediction_response(prediction, version, cache):
+    return JSONResponse(
+        {**prediction, "model_version": version.id},
+        headers={"X-Cache": cache, "X-Model-Version": version.id},
+    )
 
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
 
+async def _shadow_predict(shadow, x, prediction):
+    """Run an image on the shadow version and record whether it agrees with the served prediction."""
     try:
+        probs = await shadow.batcher.submit(x)
+    except Exception as e:
+        ERRORS.inc(endpoint="/predict", cause="shadow")
+        print(f"❌ Shadow prediction on {shadow.id} failed: {e}")
+        return
+    finally:
+        shadow.release()
+    agree = build_prediction(probs)["classification"] == prediction["classification"]
+    SHADOW_PREDICTIONS.inc(version=shadow.id, agree=str(agree).lower())
+
+
+def _start_shadow(shadow, x, prediction):
+    # Fire and forget: the response never waits on the shadow model
+    shadow.acquire()
+    task = asyncio.create_task(_shadow_predict(shadow, x, prediction))
+    shadow_tasks.add(task)
+    task.add_done_callback(shadow_tasks.discard)
+
+
+
+def _is_image_upload(file: UploadFile):
+    """JPEG/PNG by content type, DICOM by content type or .dcm/.dicom name (PACS clients often send octet-stream)."""
+    content_type = file.content_type or ""
+    return (
+        content_type.startswith("image/")
+        or content_type in DICOM_CONTENT_TYPES
+        or is_dicom_path(file.filename or "")
+    )
+
+
+def _is_zip_upload(file: UploadFile):
+    return file.content_type in ZIP_CONTENT_TYPES or (file.filename or "").lower().endswith(".zip")
+
+
+class BatchTooLarge(ValueError):
+    """Upload over a /predict/batch limit; args are (cause, detail)."""
+
+
+def _read_zip_images(contents, max_files, max_bytes):
+    """
+    Return [(name, bytes)] for every image member of a zip archive. Limits are
+    checked against the central directory before any member is inflated
+    (zipfile never inflates a member past its declared size).
+    """
+    with zipfile.ZipFile(io.BytesIO(contents)) as archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+        if len(members) > max_files:
+            raise BatchTooLarge("too_many_images", f"Too many images (max {BATCH_PREDICT_MAX_FILES} per request)")
+        for info in members:
+            if info.file_size > DECODE_MAX_BYTES:
+                raise BatchTooLarge("too_large", f"{info.filename} exceeds {DECODE_MAX_BYTES} bytes")
+        if sum(info.file_size for info in members) > max_bytes:
+            raise BatchTooLarge("batch_too_large", f"Upload exceeds {BATCH_PREDICT_MAX_BYTES} bytes uncompressed")
+        return [(info.filename, archive.read(info)) for info in members]
+
+
+async def _collect_batch_uploads(files: List[UploadFile]):
+    """Expand multipart images and zip archives into a flat [(name, bytes)] list."""
+    images = []
+    total_bytes = 0
+    for file in files:
         contents = await file.read()
-        file_bytes = np.asarray(bytearray(contents), dtype=np.uint8)
-        img_bgr = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-
-        if img_bgr is None:
-            raise HTTPException(status_code=400, detail="Could not decode image")
-
-        # Convert BGR to RGB first
-        img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-        
-        # Apply CLAHE enhancement (improves X-ray contrast)
-        enhanced = apply_clahe(img_rgb)
-        
-        # Resize
-        resized = cv2.resize(enhanced, IMG_SIZE, interpolation=cv2.INTER_LANCZOS4)
-
-        # Prepare for model
-        x = resized.astype(np.float32)
-        x = np.expand_dims(x, axis=0)
-        x = preprocess_input(x)
-
-        probs = model.predict(x, verbose=0)[0]
-        
-        # Get prediction from raw probabilities
-        pred_idx = int(np.argmax(probs))
-        pred_label = CLASS_NAMES[pred_idx]
-        confidence = float(probs[pred_idx])
-
-        base_severity = compute_severity_1_to_10(probs, pred_idx)
-
-        # Return probabilities
-        probabilities = {
-            CLASS_NAMES[i]: float(probs[i]) for i in range(len(CLASS_NAMES))
-        }
-
-        return JSONResponse({
-            "classification": pred_label,
-            "confidence": confidence,
-            "probabilities": probabilities,
-            "base_severity": base_severity,
-            "class_index": pred_idx
-        })
+        if _is_zip_upload(file):
+            try:
+                members = await executor.run(
+                    PREPROCESS_STAGE, _read_zip_images, contents,
+                    BATCH_PREDICT_MAX_FILES - len(images), BATCH_PREDICT_MAX_BYTES - total_bytes,
+                )
+            except zipfile.BadZipFile:
+                raise _error("/predict/batch", 400, "bad_zip", f"Invalid zip archive: {file.filename}")
+            except BatchTooLarge as e:
+                raise _error("/predict/batch", 413, *e.args)
+        elif _is_image_upload(file):
+            members = [(file.filename, contents)]
+        else:
+            raise _error(
+                "/predict/batch", 400, "not_an_image", f"File must be an image or zip archive: {file.filename}"
+            )
+
+        images.extend(members)
+        total_bytes += sum(len(data) for _, data in members)
+        if len(images) > BATCH_PREDICT_MAX_FILES:
+            raise _error(
+                "/predict/batch", 413, "too_many_images",
+                f"Too many images (max {BATCH_PREDICT_MAX_FILES} per request)"
+            )
+        if total_bytes > BATCH_PREDICT_MAX_BYTES:
+            raise _error(
+                "/predict/batch", 413, "batch_too_large", f"Upload exceeds {BATCH_PREDICT_MAX_BYTES} bytes"
+            )
+    return images
+
+
+def _start_chunk(chunk, served):
+    """Look up a chunk in the prediction cache and start preprocessing the misses in parallel."""
+    digests = [content_hash(data) for _, data in chunk]
+    results = [prediction_cache.get(digest, served.id) for digest in digests]
+    pending = asyncio.gather(
+        *(
+            preprocess(data)
+            for (_, data), cached in zip(chunk, results) if cached is None
+        ),
+        return_exceptions=True,
+    )
+    return digests, results, pending
+
+
+async def _stream_batch_predictions(images, served):
+    """NDJSON lines for every image, all served by one model version (released when the stream ends)."""
+    try:
+        async for line in _batch_prediction_lines(images, served):
+            yield line
+    finally:
+        served.release()
+
+
+async def _batch_prediction_lines(images, served):
+    chunks = [images[i:i + BATCH_PREDICT_SIZE] for i in range(0, len(images), BATCH_PREDICT_SIZE)]
+    offset = 0
+    started = _start_chunk(chunks[0], served) if chunks else None
+
+    for n, chunk in enumerate(chunks):
+        digests, results, pending = started
+        xs = await pending
+        # Overlap preprocessing of the next chunk with inference on this one
+        started = _start_chunk(chunks[n + 1], served) if n + 1 < len(chunks) else None
+
+        misses = [i for i, cached in enumerate(results) if cached is None]
+        valid = []
+        IMAGES.inc(len(chunk) - len(misses), endpoint="/predict/batch", cache="hit")
+        for i, x in zip(misses, xs):
+            if isinstance(x, ImageTooLarge):
+                results[i] = {"error": str(x)}
+                ERRORS.inc(endpoint="/predict/batch", cause="too_large")
+            elif isinstance(x, Exception):
+                results[i] = {"error": f"Prediction error: {str(x)}"}
+                ERRORS.inc(endpoint="/predict/batch", cause="internal")
+            elif x is None:
+                results[i] = {"error": "Could not decode image"}
+                ERRORS.inc(endpoint="/predict/batch", cause="decode_failed")
+            else:
+                valid.append((i, x))
+
+        if valid:
+            try:
+                batch = np.stack([x for _, x in valid], axis=0)
+                with STAGE_LATENCY.time(stage="inference"):
+                    if isinstance(served.model, InferenceWorkerPool):
+                        probs = await pool_predict(served.model, batch)
+                    else:
+                        probs = await executor.run(
+                            INFERENCE_STAGE, predict_batch, served.model, to_model_input(batch)
+                        )
+                with STAGE_LATENCY.time(stage="severity"):
+                    predictions = build_predictions(probs)
+                for (i, _), prediction in zip(valid, predictions):
+                    results[i] = prediction
+                    prediction_cache.put(digests[i], prediction, served.id)
+                IMAGES.inc(len(valid), endpoint="/predict/batch", cache="miss")
+                MODEL_PREDICTIONS.inc(len(valid), version=served.id)
+            except Exception as e:
+                for i, _ in valid:
+                    results[i] = {"error": f"Prediction error: {str(e)}"}
+                cause = "overloaded" if isinstance(e, WorkerPoolFull) else "internal"
+                ERRORS.inc(len(valid), endpoint="/predict/batch", cause=cause)
+
+        for i, (name, _) in enumerate(chunk):
+            line = {"index": offset + i, "filename": name, **results[i], "model_version": served.id}
+            yield json.dumps(line) + "\n"
+        offset += len(chunk)
+
+
+@app.post("/predict/batch")
+async def predict_batch_images(files: List[UploadFile] = File(...)):
+    """
+    Predict many X-rays in one request.
+    Accepts several image files and/or zip archives of images. Results are
+    streamed as NDJSON, one line per image in upload order, using the same
+    schema as /predict plus `index` and `filename` (or `error` if the image
+    could not be processed). One model version serves the whole request.
+    """
+    served, _ = _serving_version("/predict/batch")
+    # Held from routing on, so a swap during the upload cannot unload the version
+    served.acquire()
+    try:
+        images = await _collect_batch_uploads(files)
+        if not images:
+            raise _error("/predict/batch", 400, "no_images", "No images found in upload")
+    except BaseException:
+        served.release()
+        raise
+
+    return StreamingResponse(
+        _stream_batch_predictions(images, served),
+        media_type="application/x-ndjson",
+        headers={"X-Model-Version": served.id},
+    )
+
+
+
+def _get_explain_model(version):
+    """
+    Keras model for Grad-CAM: the version's serving model, or (TFLite backend,
+    worker replicas) the .keras file of that version loaded here.
+    """
+    if version.explain_model is None:
+        import tensorflow as tf
+        from src.inference.backends import CompiledKerasModel
+        # Explanations always come from the full model, also behind a cascade
+        served = version.model.full if isinstance(version.model, CascadeModel) else version.model
+        if isinstance(served, CompiledKerasModel):
+            version.explain_model = served.model
+        else:
+            keras_path = version.model_path
+            if INFERENCE_BACKEND == "tflite":
+                keras_path = os.path.join(version.model_dir, os.path.basename(MODEL_PATH))
+            version.explain_model = tf.keras.models.load_model(keras_path)
+    return version.explain_model
+
+
+def _render_explanation(version, image_gray, output, class_index, layer):
+    from src.explainability.gradcam import get_gradcam_engine, overlay_heatmap_bgr, overlay_red_only
+
+    engine = get_gradcam_engine(
+        _get_explain_model(version), last_conv_layer_name=layer, cache=version.explain_engines
+    )
+    x = to_model_input(image_gray[np.newaxis, ...])
+    heatmaps, probs, target = engine.explain(x, class_index)
+
+    image_bgr = cv2.cvtColor(image_gray, cv2.COLOR_GRAY2BGR)
+    if output == "heatmap":
+        _, png_source, _ = overlay_heatmap_bgr(image_bgr, heatmaps[0])
+    elif output == "red":
+        png_source, _ = overlay_red_only(image_bgr, heatmaps[0], alpha=0.5, percentile=85)
+    else:
+        png_source, _, _ = overlay_heatmap_bgr(image_bgr, heatmaps[0], alpha=0.35)
+
+    ok, png = cv2.imencode(".png", png_source)
+    if not ok:
+        raise RuntimeError("Could not encode PNG")
+    return png.tobytes(), probs[0], int(target[0])
+
 
+@app.post("/explain")
+async def explain_image(
+    file: UploadFile = File(...),
+    output: str = "overlay",
+    class_index: Optional[int] = None,
+    layer: Optional[str] = None,
+):
+    """
+    Grad-CAM explanation for an uploaded X-ray, returned as a PNG.
+
+    output: "overlay" (JET heatmap over the image), "heatmap" (colour heatmap only)
+            or "red" (top activations in red)
+    class_index: class to explain (defaults to the predicted class)
+    layer: backbone conv layer (defaults to the last conv block of the backbone)
+    """
+    served, _ = _serving_version("/explain")
+
+    if not _is_image_upload(file):
+        raise _error("/explain", 400, "not_an_image", "File must be an image")
+
+    if output not in EXPLAIN_OUTPUTS:
+        raise _error("/explain", 400, "bad_request", f"output must be one of {EXPLAIN_OUTPUTS}")
+
+    if class_index is not None and not 0 <= class_index < len(CLASS_NAMES):
+        raise _error("/explain", 400, "bad_request", "Invalid class_index")
+
+    with served.use():
+        try:
+            contents = await file.read()
+            image = await preprocess(contents)
+
+            if image is None:
+                raise _error("/explain", 400, "decode_failed", "Could not decode image")
+
+            with STAGE_LATENCY.time(stage="explain"):
+                png, probs, target = await executor.run(
+                    INFERENCE_STAGE, _render_explanation, served, image, output, class_index, layer
+                )
+            prediction = build_prediction(probs)
+
+            return Response(
+                content=png,
+                media_type="image/png",
+                headers={
+                    "X-Classification": prediction["classification"],
+                    "X-Confidence": f"{prediction['confidence']:.4f}",
+                    "X-Explained-Class": CLASS_NAMES[target],
+                    "X-Model-Version": served.id,
+                },
+            )
+
+        except HTTPException:
+            raise
+        except ImageTooLarge as e:
+            raise _error("/explain", 413, "too_large", str(e))
+        except ValueError as e:
+            # Unknown layer / unsupported architecture
+            raise _error("/explain", 400, "bad_request", f"Explain error: {str(e)}")
+        except Exception as e:
+            raise _error("/explain", 500, "internal", f"Explain error: {str(e)}")
+
+
+def _check_admin(token):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if token is None or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.post("/admin/profile")
+async def start_profile(
+    requests: Optional[int] = None,
+    seconds: Optional[float] = None,
+    tensorflow: bool = True,
+    x_admin_token: Optional[str] = Header(None),
+):
+    """
+    Profile the next `requests` requests and/or the next `seconds` seconds
+    (whichever ends first): Python sampling profile, TensorFlow profiler
+    trace and tracemalloc peak allocations, written under PROFILE_DIR.
+    Requires the X-Admin-Token header.
+    """
+    _check_admin(x_admin_token)
+
+    if requests is not None and not 0 < requests <= PROFILE_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"requests must be in 1..{PROFILE_MAX_REQUESTS}")
+    if seconds is not None and not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS}]")
+    if requests is None and seconds is None:
+        raise HTTPException(status_code=400, detail="Give requests and/or seconds")
+
+    try:
+        return await asyncio.to_thread(profiler.start, requests, seconds, tensorflow=tensorflow)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/admin/profile")
+async def profile_status(x_admin_token: Optional[str] = Header(None)):
+    """State of the running capture, or a summary of the last one."""
+    _check_admin(x_admin_token)
+    return profiler.status()
+
+
+@app.post("/admin/profile/stop")
+async def stop_profile(x_admin_token: Optional[str] = Header(None)):
+    """End the running capture early and write its results."""
+    _check_admin(x_admin_token)
+    return await asyncio.to_thread(profiler.stop)
+
+
+async def _admin_swap(event, action, *args):
+    """Registry change for an /admin/models endpoint, with errors mapped to HTTP status codes."""
+    try:
+        await _swap(event, action, *args)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Model load failed: {str(e)}")
+    return model_registry.status()
+
+
+def _check_registry():
+    if model_registry is None or model_registry.active is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+
+
+@app.get("/admin/models")
+async def model_status(x_admin_token: Optional[str] = Header(None)):
+    """Active, canary and warm previous model versions, with in-flight counts and swap history."""
+    _check_admin(x_admin_token)
+    _check_registry()
+    return model_registry.status()
+
+
+@app.post("/admin/models/activate")
+async def activate_model(path: str = MODEL_PATH, x_admin_token: Optional[str] = Header(None)):
+    """
+    Load and warm the model at `path` (metadata.json next to it names the
+    version) while the current one keeps serving, then swap it in. Requests
+    in flight finish on the old version; it stays warm for rollback.
+    """
+    _check_admin(x_admin_token)
+    _check_registry()
+    return await _admin_swap("activate", model_registry.activate, path)
+
+
+@app.post("/admin/models/rollback")
+async def rollback_model(x_admin_token: Optional[str] = Header(None)):
+    """Swap back to the previous model version."""
+    _check_admin(x_admin_token)
+    _check_registry()
+    return await _admin_swap("rollback", model_registry.rollback)
+
+
+@app.post("/admin/models/canary")
+async def set_canary_model(
+    path: str,
+    percent: float = 10.0,
+    mode: str = "canary",
+    x_admin_token: Optional[str] = Header(None),
+):
+    """
+    Load the model at `path` next to the active one and send it `percent` of
+    /predict, /predict/batch and /explain requests. mode "shadow" instead
+    runs that share of /predict images on it in the background, responses
+    still coming from the active model (see xray_shadow_predictions_total).
+    """
+    _check_admin(x_admin_token)
+    _check_registry()
+    return await _admin_swap(mode, model_registry.set_canary, path, percent, mode)
+
+
+@app.delete("/admin/models/canary")
+async def clear_canary_model(x_admin_token: Optional[str] = Header(None)):
+    """Stop routing to the canary and unload it once its requests finish."""
+    _check_admin(x_admin_token)
+    _check_registry()
+    return await _admin_swap("canary_cleared", model_registry.clear_canary)
+
+
+@app.post("/admin/models/canary/promote")
+async def promote_canary_model(x_admin_token: Optional[str] = Header(None)):
+    """Make the canary the active version."""
+    _check_admin(x_admin_token)
+    _check_registry()
+    return await _admin_swap("promote", model_registry.promote_canary)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,335 @@
+"""
+Low-overhead serving metrics exported in Prometheus text format (/metrics).
+
+Counters, gauges and fixed-bucket histograms are plain Python objects
+guarded by one uncontended lock each; recording a sample is a dict lookup,
+a bisect and a few additions (a few µs), cheap enough to leave on in
+production. Values owned by other components (batch queue, executor
+pools, prediction cache) are read through callbacks only when scraped.
+"""
+import re
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans sub-millisecond CLAHE up to multi-second batch requests
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonic count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down (e.g. requests in flight)."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative fixed-bucket histogram with _sum and _count, per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """
+    Value owned elsewhere, read at scrape time: fn() returns a number or
+    {label tuple: number}. kind is "gauge" or "counter".
+    """
+
+    def __init__(self, name, documentation, fn, labelnames=(), kind="gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+        self.kind = kind
+
+    def render(self):
+        try:
+            values = self.fn()
+        except Exception:
+            return []
+        if values is None:
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "xray_http_requests_total", "HTTP requests by endpoint and status code", ("endpoint", "status")
+))
+REQUEST_BYTES = registry.register(Counter(
+    "xray_http_request_bytes_total", "Request body bytes received by endpoint", ("endpoint",)
+))
+REQUEST_LATENCY = registry.register(Histogram(
+    "xray_http_request_duration_seconds", "End-to-end request latency by endpoint", ("endpoint",)
+))
+IN_FLIGHT = registry.register(Gauge(
+    "xray_http_requests_in_flight", "Requests currently being handled by endpoint", ("endpoint",)
+))
+ERRORS = registry.register(Counter(
+    "xray_errors_total", "Failed requests and batch items by endpoint and cause", ("endpoint", "cause")
+))
+IMAGES = registry.register(Counter(
+    "xray_images_total", "Images classified by endpoint and cache result", ("endpoint", "cache")
+))
+STAGE_LATENCY = registry.register(Histogram(
+    "xray_stage_duration_seconds",
+    "Latency of each serving stage: decode, clahe, resize, inference (queue + model), "
+    "model (one forward pass per batch), severity, explain",
+    ("stage",),
+))
+STARTUP = registry.register(Gauge(
+    "xray_startup_seconds",
+    "Cold start by phase: startup (import to port bound), import_tensorflow, model_load, warmup, "
+    "ready (import to model loaded and warmed)",
+    ("phase",),
+))
+MODEL_PREDICTIONS = registry.register(Counter(
+    "xray_model_predictions_total", "Images classified by the model version that served them", ("version",)
+))
+SHADOW_PREDICTIONS = registry.register(Counter(
+    "xray_shadow_predictions_total",
+    "Shadowed images by shadow model version and whether it agreed with the active model's class",
+    ("version", "agree"),
+))
+MODEL_SWAPS = registry.register(Counter(
+    "xray_model_swaps_total", "Model registry changes by event (activate, rollback, canary)", ("event",)
+))
+
+
+def observe_stages(timings):
+    """Record a {stage: seconds} dict, e.g. from decode_and_enhance_timed."""
+    for stage, seconds in timings.items():
+        STAGE_LATENCY.observe(seconds, stage=stage)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests, request bytes, status codes, latency
+    and in-flight requests per endpoint. `endpoints` are paths or route
+    templates ("/images/{image_id}"); requests are labelled with the
+    template they match, and paths matching none are grouped as "other",
+    to keep label cardinality bounded. Latency covers the whole response,
+    including streamed bodies.
+    """
+
+    def __init__(self, app, endpoints):
+        self.app = app
+        self.endpoints = {e for e in endpoints if "{" not in e}
+        self.templates = [(self._template_pattern(e), e) for e in endpoints if "{" in e]
+
+    @staticmethod
+    def _template_pattern(template):
+        # "{param}" matches one path segment
+        return re.compile("/".join(
+            "[^/]+" if part.startswith("{") else re.escape(part) for part in template.split("/")
+        ) + "$")
+
+    def endpoint(self, path):
+        if path in self.endpoints:
+            return path
+        for pattern, template in self.templates:
+            if pattern.match(path):
+                return template
+        return "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self.endpoint(scope["path"])
+        status = {"code": 500}
+
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length":
+                # A malformed header is the app's to reject, not a 500 from here
+                try:
+                    REQUEST_BYTES.inc(int(value), endpoint=endpoint)
+                except ValueError:
+                    pass
+                break
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        IN_FLIGHT.inc(endpoint=endpoint)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec(endpoint=endpoint)
+            REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+            REQUESTS.inc(endpoint=endpoint, status=str(status["code"]))
+
+
+if __name__ == "__main__":
+    # Recording overhead: python -m src.api.metrics (correctness: tests/test_metrics.py)
+    n = 200_000
+    start = time.perf_counter()
+    for i in range(n):
+        STAGE_LATENCY.observe(0.003, stage="decode")
+    observe_us = (time.perf_counter() - start) / n * 1e6
+
+    start = time.perf_counter()
+    for i in range(n):
+        ERRORS.inc(endpoint="/predict", cause="decode_failed")
+    inc_us = (time.perf_counter() - start) / n * 1e6
+
+    print(f"histogram observe: {observe_us:.2f} µs, counter inc: {inc_us:.2f} µs")
+    print(registry.render()[:600])
@@ -0,0 +1,235 @@
+"""
+On-demand profiling of the serving path.
+
+A capture runs for the next N requests and/or T seconds and writes to its
+own directory:
+    stacks.folded   Python sampling profile of every thread (collapsed stacks,
+                    load into speedscope or flamegraph.pl)
+    top_functions.txt  self/total sample counts per function
+    tensorflow/     TensorFlow profiler trace of the model calls (TensorBoard)
+    tracemalloc.txt peak traced memory and the top allocation sites
+    capture.json    what was captured and for how long
+
+When no capture is active, the only cost on a request is one attribute
+check in ProfilingMiddleware.
+"""
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from collections import Counter
+
+SAMPLE_INTERVAL_S = 0.005
+TRACEMALLOC_FRAMES = 16
+TOP_N = 40
+
+
+class StackSampler(threading.Thread):
+    """Samples sys._current_frames() every `interval` seconds into collapsed stacks."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL_S):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, out_dir):
+        with open(os.path.join(out_dir, "stacks.folded"), "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]  # drop the thread name
+            if not frames:
+                continue
+            self_counts[frames[-1]] += count
+            for frame in set(frames):
+                total_counts[frame] += count
+
+        total = sum(self.stacks.values()) or 1
+        with open(os.path.join(out_dir, "top_functions.txt"), "w") as f:
+            f.write(f"{self.samples} sampling rounds, {total} thread samples\n\n")
+            f.write(f"{'self %':>8}{'total %':>9}  function\n")
+            for frame, count in self_counts.most_common(TOP_N):
+                f.write(f"{100.0 * count / total:>7.1f}%{100.0 * total_counts[frame] / total:>8.1f}%  {frame}\n")
+
+
+class Profiler:
+    """
+    One capture at a time. start() begins the sampling profiler, the
+    TensorFlow profiler and tracemalloc; the capture ends after `requests`
+    completed requests or `seconds`, whichever comes first.
+    """
+
+    def __init__(self, base_dir="outputs/profiles"):
+        self.base_dir = base_dir
+        self.active = False
+        self._lock = threading.Lock()
+        self._session = None
+        self._captures = 0
+        self.last_capture = None
+
+    def start(self, requests=None, seconds=None, interval=SAMPLE_INTERVAL_S, tensorflow=True):
+        if not requests and not seconds:
+            raise ValueError("Give a number of requests and/or seconds to capture")
+
+        with self._lock:
+            if self.active:
+                raise RuntimeError("A profile capture is already running")
+
+            self._captures += 1
+            out_dir = os.path.join(self.base_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{self._captures}")
+            os.makedirs(out_dir, exist_ok=True)
+
+            session = {
+                "out_dir": out_dir,
+                "requests": requests,
+                "seconds": seconds,
+                "remaining": requests,
+                "started": time.time(),
+                "tensorflow": False,
+                "tracemalloc_started": False,
+            }
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                session["tracemalloc_started"] = True
+            tracemalloc.reset_peak()
+
+            if tensorflow:
+                try:
+                    import tensorflow as tf
+                    tf.profiler.experimental.start(os.path.join(out_dir, "tensorflow"))
+                    session["tensorflow"] = True
+                except Exception as e:
+                    session["tensorflow_error"] = str(e)
+
+            session["sampler"] = StackSampler(interval)
+            session["sampler"].start()
+
+            if seconds:
+                session["timer"] = threading.Timer(seconds, self.stop)
+                session["timer"].daemon = True
+                session["timer"].start()
+
+            self._session = session
+            self.active = True
+            print(f"🔬 Profiling started -> {out_dir}")
+            return self.status()
+
+    def request_done(self):
+        """Called by the middleware after each profiled request."""
+        session = self._session
+        if session is None or session["remaining"] is None:
+            return
+        with self._lock:
+            session["remaining"] -= 1
+            done = session["remaining"] == 0
+        if done:
+            # Writing the profile is slow; keep it off the event loop
+            threading.Thread(target=self.stop, daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            session = self._session
+            if session is None:
+                return self.last_capture
+            self._session = None
+            self.active = False
+
+        if session.get("timer") is not None:
+            session["timer"].cancel()
+        out_dir = session["out_dir"]
+
+        session["sampler"].stop()
+        session["sampler"].write(out_dir)
+
+        if session["tensorflow"]:
+            import tensorflow as tf
+            tf.profiler.experimental.stop()
+
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        if session["tracemalloc_started"]:
+            tracemalloc.stop()
+        with open(os.path.join(out_dir, "tracemalloc.txt"), "w") as f:
+            f.write(f"peak traced: {peak / 1e6:.1f} MB, current: {current / 1e6:.1f} MB\n\n")
+            for stat in snapshot.statistics("lineno")[:TOP_N]:
+                f.write(f"{stat}\n")
+
+        requests = session["requests"]
+        capture = {
+            "out_dir": out_dir,
+            "requests_requested": requests,
+            "requests_captured": None if requests is None else requests - max(session["remaining"], 0),
+            "seconds_requested": session["seconds"],
+            "duration_s": time.time() - session["started"],
+            "sampling_rounds": session["sampler"].samples,
+            "tensorflow_trace": session["tensorflow"],
+            "tensorflow_error": session.get("tensorflow_error"),
+            "peak_traced_mb": peak / 1e6,
+        }
+        with open(os.path.join(out_dir, "capture.json"), "w") as f:
+            json.dump(capture, f, indent=2)
+
+        self.last_capture = capture
+        print(f"✓ Profile written to {out_dir}")
+        return capture
+
+    def status(self):
+        session = self._session
+        if session is None:
+            return {"active": False, "last_capture": self.last_capture}
+        return {
+            "active": True,
+            "out_dir": session["out_dir"],
+            "requests_remaining": session["remaining"],
+            "seconds": session["seconds"],
+            "elapsed_s": time.time() - session["started"],
+        }
+
+
+class ProfilingMiddleware:
+    """
+    Counts finished requests towards an active capture. Paths under
+    `exclude_prefixes` (admin calls, probes and scrapes) are ignored, so they
+    do not use up a `requests=N` capture.
+    """
+
+    def __init__(self, app, profiler, exclude_prefixes=("/admin", "/health", "/ready", "/metrics")):
+        self.app = app
+        self.profiler = profiler
+        self.exclude_prefixes = tuple(exclude_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if not self.profiler.active or scope["type"] != "http" or scope["path"].startswith(self.exclude_prefixes):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.request_done()
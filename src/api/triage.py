@@ -0,0 +1,384 @@
+"""
+Server-side triage queue backed by SQLite.
+
+Patients are ordered by compute_combined_severity (highest first), then
+arrival time (earliest first), through a B-tree index, so inserts and
+status updates are O(log n) and a queue page is an index range scan.
+Statistics (counts by status, waiting patients by risk level, average
+wait) are kept in memory and updated incrementally on every change; they
+are rebuilt from the table once when the store opens. X-ray images live
+in the content-addressed image store (src.api.images); records hold only
+the image ID and URLs, so queue pages stay small. Images no patient refers
+to are deleted by a periodic sweep (collect_images), never while removing a
+patient: the dashboard uploads an image before adding the patient that uses
+it, and the same bytes may belong to a patient being discharged meanwhile.
+"""
+import os
+import json
+import asyncio
+import time
+import uuid
+import base64
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Response
+from pydantic import BaseModel
+
+from src.api import images
+from src.data.constants import CLASS_NAMES
+from src.inference.severity import compute_combined_severity, compute_curb65, risk_level
+
+TRIAGE_DB_PATH = os.getenv("TRIAGE_DB_PATH", "data/triage.sqlite3")
+STATUSES = ("waiting", "in-treatment", "completed")
+RISK_LEVELS = ("low", "moderate", "high")
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+# Unreferenced images are deleted once this old (since their last upload)
+IMAGE_GC_GRACE_SECONDS = float(os.getenv("IMAGE_GC_GRACE_SECONDS", "3600"))
+IMAGE_GC_INTERVAL_SECONDS = float(os.getenv("IMAGE_GC_INTERVAL_SECONDS", "600"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id TEXT PRIMARY KEY,
+    arrival REAL NOT NULL,
+    status TEXT NOT NULL,
+    severity INTEGER NOT NULL,
+    risk_level TEXT NOT NULL,
+    classification TEXT NOT NULL,
+    curb65_score INTEGER NOT NULL,
+    image_id TEXT,
+    record TEXT NOT NULL
+);
+-- Priority order for the whole queue and per status
+CREATE INDEX IF NOT EXISTS patients_priority ON patients (severity DESC, arrival, id);
+CREATE INDEX IF NOT EXISTS patients_status_priority ON patients (status, severity DESC, arrival, id);
+CREATE INDEX IF NOT EXISTS patients_image ON patients (image_id);
+"""
+
+_COLUMNS = "id, arrival, status, severity, risk_level, classification, curb65_score, image_id, record"
+
+
+class TriageStats:
+    """Incrementally maintained queue statistics."""
+
+    def __init__(self):
+        self.by_status = dict.fromkeys(STATUSES, 0)
+        self.waiting_by_risk = dict.fromkeys(RISK_LEVELS, 0)
+        self.waiting_arrival_sum = 0.0
+
+    def apply(self, status, risk, arrival, sign):
+        """Add (sign=1) or remove (sign=-1) one patient."""
+        self.by_status[status] += sign
+        if status == "waiting":
+            self.waiting_by_risk[risk] += sign
+            self.waiting_arrival_sum += sign * arrival
+
+    def as_dict(self, now=None):
+        now = time.time() if now is None else now
+        waiting = self.by_status["waiting"]
+        avg_wait_s = (now * waiting - self.waiting_arrival_sum) / waiting if waiting else 0.0
+        return {
+            "total": sum(self.by_status.values()),
+            "waiting": waiting,
+            "inTreatment": self.by_status["in-treatment"],
+            "completed": self.by_status["completed"],
+            "highSeverity": self.waiting_by_risk["high"],
+            "moderateSeverity": self.waiting_by_risk["moderate"],
+            "lowSeverity": self.waiting_by_risk["low"],
+            "avgWaitTime": int(max(avg_wait_s, 0.0) // 60),  # minutes
+        }
+
+
+class TriageStore:
+    """SQLite-backed priority queue of triage records (thread-safe)."""
+
+    def __init__(self, path=TRIAGE_DB_PATH, image_store=None):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.images = image_store
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self.stats = self._rebuild_stats()
+
+    def _rebuild_stats(self):
+        stats = TriageStats()
+        rows = self._db.execute(
+            "SELECT status, risk_level, COUNT(*), SUM(arrival) FROM patients GROUP BY status, risk_level"
+        )
+        for status, risk, count, arrival_sum in rows:
+            stats.by_status[status] += count
+            if status == "waiting":
+                stats.waiting_by_risk[risk] += count
+                stats.waiting_arrival_sum += arrival_sum
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def _to_record(row):
+        pid, arrival, status, severity, risk, classification, curb65_score, image_id, record = row
+        record = json.loads(record)
+        record.update({
+            "id": pid,
+            "timestamp": datetime.fromtimestamp(arrival, tz=timezone.utc).isoformat(),
+            "status": status,
+            **images.image_urls(image_id),
+        })
+        record["severityResult"] = {
+            **record.get("severityResult", {}),
+            "finalSeverity": severity,
+            "curb65Score": curb65_score,
+            "riskLevel": risk,
+        }
+        return record
+
+    def add(self, classification, curb65_score, record, image_id=None, arrival=None):
+        """
+        Insert a waiting patient; severity comes from compute_combined_severity.
+        Raises LookupError if image_id is not (or no longer) in the image store.
+        """
+        severity = compute_combined_severity(classification, curb65_score)
+        risk = risk_level(severity)
+        pid = f"patient-{uuid.uuid4().hex[:16]}"
+        arrival = time.time() if arrival is None else arrival
+
+        with self._lock, self._db:
+            # Checked under the lock collect_images holds, so a sweep cannot delete it in between
+            if image_id is not None and self.images is not None and not self.images.exists(image_id):
+                raise LookupError(image_id)
+            self._db.execute(
+                f"INSERT INTO patients ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (pid, arrival, "waiting", severity, risk, classification, curb65_score,
+                 image_id, json.dumps(record)),
+            )
+            self.stats.apply("waiting", risk, arrival, +1)
+        return self.get(pid)
+
+    def get(self, pid):
+        with self._lock:
+            row = self._db.execute(f"SELECT {_COLUMNS} FROM patients WHERE id = ?", (pid,)).fetchone()
+        return self._to_record(row) if row else None
+
+    def queue(self, offset=0, limit=DEFAULT_PAGE_SIZE, status=None):
+        """One page of the queue in priority order, plus the total matching count."""
+        where, params = ("WHERE status = ?", (status,)) if status else ("", ())
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {_COLUMNS} FROM patients {where} "
+                "ORDER BY severity DESC, arrival, id LIMIT ? OFFSET ?",
+                params + (limit, offset),
+            ).fetchall()
+            total = self.stats.by_status[status] if status else sum(self.stats.by_status.values())
+        return [self._to_record(row) for row in rows], total
+
+    def update_status(self, pid, status):
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT status, risk_level, arrival FROM patients WHERE id = ?", (pid,)
+            ).fetchone()
+            if row is None:
+                return None
+            old_status, risk, arrival = row
+            if old_status != status:
+                self._db.execute("UPDATE patients SET status = ? WHERE id = ?", (status, pid))
+                self.stats.apply(old_status, risk, arrival, -1)
+                self.stats.apply(status, risk, arrival, +1)
+        return self.get(pid)
+
+    def remove(self, pid):
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT status, risk_level, arrival FROM patients WHERE id = ?", (pid,)
+            ).fetchone()
+            if row is None:
+                return False
+            status, risk, arrival = row
+            self._db.execute("DELETE FROM patients WHERE id = ?", (pid,))
+            self.stats.apply(status, risk, arrival, -1)
+        return True
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM patients")
+            self.stats = TriageStats()
+
+    def collect_images(self, grace_seconds=IMAGE_GC_GRACE_SECONDS, now=None):
+        """
+        Delete stored images no patient refers to and not uploaded within
+        grace_seconds (uploads waiting for their patient). Returns the count.
+        """
+        if self.images is None:
+            return 0
+        cutoff = (time.time() if now is None else now) - grace_seconds
+        with self._lock:
+            referenced = {row[0] for row in self._db.execute("SELECT DISTINCT image_id FROM patients")}
+        # The directory walk runs without the lock, so the queue stays usable during a sweep
+        candidates = [image_id for image_id in self.images.stored_before(cutoff) if image_id not in referenced]
+
+        deleted = 0
+        for image_id in candidates:
+            # Re-checked under the lock: a patient added since the snapshot may use it
+            with self._lock:
+                if self._db.execute("SELECT 1 FROM patients WHERE image_id = ? LIMIT 1", (image_id,)).fetchone():
+                    continue
+                self.images.delete(image_id)
+            deleted += 1
+        return deleted
+
+
+store = None
+
+
+def open_store(path=TRIAGE_DB_PATH):
+    global store
+    if store is None:
+        store = TriageStore(path, image_store=images.open_store())
+        print(f"✅ Triage store ready ({path}, {store.stats.as_dict()['total']} patients)")
+    return store
+
+
+async def collect_images_periodically(interval=IMAGE_GC_INTERVAL_SECONDS):
+    """Run collect_images every `interval` seconds (started with the API)."""
+    while True:
+        await asyncio.sleep(interval)
+        if store is None:
+            continue
+        try:
+            deleted = await asyncio.to_thread(store.collect_images)
+        except Exception as e:
+            print(f"❌ Image garbage collection failed: {e}")
+            continue
+        if deleted:
+            print(f"✓ Deleted {deleted} unreferenced images")
+
+
+def close_store():
+    global store
+    if store is not None:
+        store.close()
+        store = None
+
+
+def _store():
+    if store is None:
+        raise HTTPException(status_code=503, detail="Triage store not available")
+    return store
+
+
+class CURB65Data(BaseModel):
+    age: Optional[float] = None
+    respiratoryRate: Optional[float] = None
+    systolicBP: Optional[float] = None
+    diastolicBP: Optional[float] = None
+    confusion: bool = False
+    urea: Optional[float] = None
+
+
+class NewPatient(BaseModel):
+    prediction: dict
+    curb65Data: CURB65Data = CURB65Data()
+    severityResult: dict = {}
+    imageId: Optional[str] = None  # from POST /images
+    imageData: Optional[str] = None  # or a data URL, e.g. "data:image/png;base64,..."
+    patientName: Optional[str] = None
+    patientAge: Optional[int] = None
+    notes: Optional[str] = None
+
+
+class StatusUpdate(BaseModel):
+    status: Literal["waiting", "in-treatment", "completed"]
+
+
+def _store_data_url(data_url):
+    """Put a 'data:<media type>;base64,<data>' (or bare base64) image in the image store; returns its ID."""
+    if data_url.startswith("data:"):
+        data_url = data_url.partition(",")[2]
+    try:
+        image = base64.b64decode(data_url, validate=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="imageData is not valid base64")
+    return images.save_upload(image)[0]
+
+
+router = APIRouter(prefix="/triage", tags=["triage"])
+
+
+@router.post("/patients", status_code=201)
+def add_patient(patient: NewPatient):
+    """
+    Add a patient to the queue as "waiting". Severity is recomputed on the
+    server from the classification and CURB-65 data.
+    """
+    classification = patient.prediction.get("classification")
+    if classification not in CLASS_NAMES:
+        raise HTTPException(status_code=400, detail=f"prediction.classification must be one of {CLASS_NAMES}")
+
+    c = patient.curb65Data
+    curb65_score = compute_curb65(c.age, c.respiratoryRate, c.systolicBP, c.diastolicBP, c.confusion, c.urea)
+
+    image_id = patient.imageId
+    if image_id is not None and not images.is_stored(image_id):
+        raise HTTPException(status_code=400, detail="imageId does not refer to a stored image")
+    if image_id is None and patient.imageData:
+        image_id = _store_data_url(patient.imageData)
+
+    record = patient.model_dump(exclude={"imageId", "imageData"})
+    try:
+        return _store().add(classification, curb65_score, record, image_id=image_id)
+    except LookupError:
+        raise HTTPException(status_code=400, detail="imageId does not refer to a stored image")
+
+
+@router.get("/queue")
+def get_queue(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    status: Optional[Literal["waiting", "in-treatment", "completed"]] = None,
+):
+    """One page of the queue, highest severity first, then earliest arrival."""
+    items, total = _store().queue(offset, limit, status)
+    return {"items": items, "total": total, "offset": offset, "limit": limit}
+
+
+@router.get("/stats")
+def get_statistics():
+    """Counts by status and risk level and average wait, without scanning the queue."""
+    return _store().stats.as_dict()
+
+
+@router.get("/patients/{patient_id}")
+def get_patient(patient_id: str):
+    record = _store().get(patient_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return record
+
+
+@router.patch("/patients/{patient_id}")
+def update_patient_status(patient_id: str, update: StatusUpdate):
+    record = _store().update_status(patient_id, update.status)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return record
+
+
+@router.delete("/patients/{patient_id}", status_code=204)
+def remove_patient(patient_id: str):
+    if not _store().remove(patient_id):
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return Response(status_code=204)
+
+
+@router.delete("/queue", status_code=204)
+def clear_queue():
+    _store().clear()
+    return Response(status_code=204)
@@ -0,0 +1,114 @@
+"""
+Benchmark: legacy 3-channel X-ray preprocessing vs the grayscale-native fast path.
+
+Legacy:  BGR -> RGB -> gray -> new CLAHE object -> RGB -> 3-channel LANCZOS4 resize -> float32 batch
+Fast:    BGR -> gray -> cached CLAHE -> 1-channel LANCZOS4 resize -> broadcast into preallocated batch
+
+Also compares full-size BGR decoding with reduced grayscale decoding
+(src/data/decode.py) of the same images encoded as JPEG.
+
+Usage:
+    python -m src.data.bench_preprocess
+    python -m src.data.bench_preprocess --sizes 2000 3000 4000 --repeats 20
+"""
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from src.data.xray_preprocess import apply_clahe, preprocess_gray, write_model_input
+from src.data.decode import decode_grayscale
+
+IMG_SIZE = (224, 224)
+
+
+def _legacy_clahe(image_rgb):
+    """apply_clahe as it was before CLAHE objects were cached."""
+    gray = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2GRAY)
+    enhanced = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+    return cv2.cvtColor(enhanced, cv2.COLOR_GRAY2RGB)
+
+
+def legacy_path(img_bgr, out):
+    img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+    enhanced = _legacy_clahe(img_rgb)
+    resized = cv2.resize(enhanced, IMG_SIZE, interpolation=cv2.INTER_LANCZOS4)
+    x = resized.astype(np.float32)
+    # MobileNetV2 preprocess_input
+    x /= 127.5
+    x -= 1.0
+    out[...] = x
+    return out
+
+
+def fast_path(img_bgr, out):
+    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    return write_model_input(preprocess_gray(gray, IMG_SIZE), out)
+
+
+def synthetic_xray(size, seed=0):
+    """Smooth, X-ray-like 3-channel image with identical channels."""
+    rng = np.random.RandomState(seed)
+    small = rng.randint(0, 256, (size // 32, size // 32), dtype=np.uint8)
+    gray = cv2.resize(small, (size, size), interpolation=cv2.INTER_CUBIC)
+    gray = cv2.add(gray, rng.randint(0, 16, (size, size), dtype=np.uint8))
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def time_path(fn, img_bgr, out, repeats):
+    fn(img_bgr, out)  # warm caches / CLAHE object
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(img_bgr, out)
+        times.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark X-ray preprocessing paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 3000, 4000])
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    batch = np.empty((2, IMG_SIZE[1], IMG_SIZE[0], 3), dtype=np.float32)
+
+    print(f"{'source px':>10}{'legacy ms':>12}{'fast ms':>10}{'saving':>10}{'max |diff|':>12}")
+    for size in args.sizes:
+        img_bgr = synthetic_xray(size)
+        legacy_ms = time_path(legacy_path, img_bgr, batch[0], args.repeats)
+        fast_ms = time_path(fast_path, img_bgr, batch[1], args.repeats)
+        diff = float(np.abs(batch[0] - batch[1]).max())
+        print(
+            f"{size:>10}{legacy_ms:>12.2f}{fast_ms:>10.2f}"
+            f"{100.0 * (1 - fast_ms / legacy_ms):>9.1f}%{diff:>12.2g}"
+        )
+
+    print(f"\n{'JPEG px':>10}{'full BGR ms':>13}{'reduced ms':>12}{'saving':>10}{'decoded MB':>16}")
+    for size in args.sizes:
+        _, encoded = cv2.imencode(".jpg", synthetic_xray(size), [cv2.IMWRITE_JPEG_QUALITY, 95])
+        contents = encoded.tobytes()
+
+        def full(_, out):
+            return cv2.imdecode(np.asarray(bytearray(contents), dtype=np.uint8), cv2.IMREAD_COLOR)
+
+        def reduced(_, out):
+            return decode_grayscale(contents, IMG_SIZE)
+
+        full_ms = time_path(full, None, None, args.repeats)
+        reduced_ms = time_path(reduced, None, None, args.repeats)
+        full_mb = full(None, None).nbytes / 1e6
+        reduced_mb = reduced(None, None).nbytes / 1e6
+        print(
+            f"{size:>10}{full_ms:>13.2f}{reduced_ms:>12.2f}"
+            f"{100.0 * (1 - reduced_ms / full_ms):>9.1f}%{full_mb:>8.1f} -> {reduced_mb:.2f}"
+        )
+
+    # Sanity: the kept apply_clahe still matches the legacy behaviour
+    img_rgb = cv2.cvtColor(synthetic_xray(512), cv2.COLOR_BGR2RGB)
+    assert np.array_equal(apply_clahe(img_rgb), _legacy_clahe(img_rgb))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+"""
+Dataset constants shared by training and serving.
+
+Kept free of heavy imports so the API, post-processing and triage code can
+use them without loading TensorFlow (src.data.loader re-exports them).
+"""
+IMG_SIZE = (224, 224)
+CLASS_NAMES = ["NORMAL", "BACTERIAL_PNEUMONIA", "VIRAL_PNEUMONIA"]
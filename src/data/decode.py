@@ -0,0 +1,119 @@
+"""
+Reduced-resolution grayscale decoding for large radiographs.
+
+Hospital exports are often 3000x3000+ 16-bit PNGs or high-quality JPEGs
+that only end up as 224x224 model inputs. Decoding them at full size in
+BGR wastes memory and time. Here the header is inspected first, and the
+image is decoded straight to grayscale at the smallest power-of-two
+reduction (JPEG DCT scaling via IMREAD_REDUCED_GRAYSCALE_*) that still
+covers the target resolution. Upload buffers are read without copying,
+and byte/pixel budgets reject oversized inputs before decoding.
+"""
+import struct
+
+import cv2
+import numpy as np
+
+MAX_IMAGE_BYTES = 50 * 1024 * 1024
+MAX_IMAGE_PIXELS = 50_000_000
+
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+# JPEG start-of-frame markers (SOF0-SOF15 except DHT, JPG and DAC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class ImageTooLarge(ValueError):
+    """Image exceeds the configured byte or pixel budget."""
+
+
+def _png_size(buf):
+    # 8-byte signature, then the IHDR chunk: length, type, width, height
+    if len(buf) >= 24 and bytes(buf[:8]) == b"\x89PNG\r\n\x1a\n" and bytes(buf[12:16]) == b"IHDR":
+        width, height = struct.unpack(">II", bytes(buf[16:24]))
+        return width, height
+    return None
+
+
+def _jpeg_size(buf):
+    if len(buf) < 4 or buf[0] != 0xFF or buf[1] != 0xD8:
+        return None
+    i = 2
+    n = len(buf)
+    while i + 4 <= n:
+        if buf[i] != 0xFF:
+            i += 1
+            continue
+        marker = buf[i + 1]
+        # Fill bytes / standalone markers carry no length
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        if marker == 0xD9 or marker == 0xDA:
+            return None
+        length = (buf[i + 2] << 8) | buf[i + 3]
+        if marker in _JPEG_SOF_MARKERS and i + 9 <= n:
+            height = (buf[i + 5] << 8) | buf[i + 6]
+            width = (buf[i + 7] << 8) | buf[i + 8]
+            return width, height
+        i += 2 + length
+    return None
+
+
+def read_image_size(buf):
+    """(width, height) from a PNG or JPEG header without decoding, or None."""
+    return _png_size(buf) or _jpeg_size(buf)
+
+
+def reduced_decode_flag(width, height, target_size):
+    """
+    Largest IMREAD_REDUCED_GRAYSCALE_* factor whose output still covers
+    target_size on both axes; IMREAD_GRAYSCALE if no reduction fits.
+    """
+    target_w, target_h = target_size
+    for factor, flag in _REDUCED_FLAGS:
+        if width // factor >= target_w and height // factor >= target_h:
+            return flag
+    return cv2.IMREAD_GRAYSCALE
+
+
+def decode_grayscale(contents, target_size=(224, 224), reduced=True,
+                     max_bytes=MAX_IMAGE_BYTES, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Decode image bytes to a single-channel uint8 array.
+
+    contents: bytes / bytearray / memoryview (read without copying)
+    target_size: final model resolution; with reduced=True the decode is
+        downscaled by up to 8x while staying at least this large
+    max_bytes / max_pixels: budgets; exceeding them raises ImageTooLarge
+
+    Returns the grayscale image, or None if it could not be decoded.
+    16-bit inputs are reduced to 8-bit.
+    """
+    if max_bytes and len(contents) > max_bytes:
+        raise ImageTooLarge(f"Image is {len(contents)} bytes (max {max_bytes})")
+
+    buf = np.frombuffer(contents, dtype=np.uint8)
+
+    flag = cv2.IMREAD_GRAYSCALE
+    size = read_image_size(buf)
+    if size is not None:
+        width, height = size
+        if max_pixels and width * height > max_pixels:
+            raise ImageTooLarge(f"Image is {width}x{height} pixels (max {max_pixels})")
+        if reduced:
+            flag = reduced_decode_flag(width, height, target_size)
+
+    image = cv2.imdecode(buf, flag)
+
+    # Formats without a parsed header are checked after decoding
+    if size is None and image is not None and max_pixels and image.size > max_pixels:
+        raise ImageTooLarge(f"Image is {image.shape[1]}x{image.shape[0]} pixels (max {max_pixels})")
+    return image
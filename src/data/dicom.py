@@ -0,0 +1,325 @@
+"""
+Native DICOM ingestion for PACS exports.
+
+Only the header is parsed (cached per file, so re-scanning a study
+directory does not re-parse unchanged files). For uncompressed transfer
+syntaxes the pixel-data element is memory-mapped and reduced by a
+power-of-two factor that still covers the model resolution, averaging each
+factor x factor block (area downsampling, like the JPEG/PNG reduced decode)
+one band of rows at a time. Rescale slope/intercept and window/level are
+applied on the reduced pixels and MONOCHROME1 images are inverted, giving
+the same 8-bit grayscale the JPEG path decodes to.
+Compressed transfer syntaxes fall back to pydicom's pixel handlers.
+"""
+import io
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.data.decode import ImageTooLarge, MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS
+
+DICOM_EXTENSIONS = (".dcm", ".dicom")
+DICOM_CONTENT_TYPES = {"application/dicom", "application/dicom+octet-stream"}
+
+# pydicom is imported on first parse, not here, so importing this module stays cheap
+EXPLICIT_VR_LITTLE_ENDIAN = "1.2.840.10008.1.2.1"
+IMPLICIT_VR_LITTLE_ENDIAN = "1.2.840.10008.1.2"
+
+# Transfer syntaxes whose pixel data can be read in place
+_NATIVE_SYNTAXES = {EXPLICIT_VR_LITTLE_ENDIAN: False, IMPLICIT_VR_LITTLE_ENDIAN: True}  # -> implicit VR
+_PIXEL_DATA_TAG = b"\xe0\x7f\x10\x00"
+_LONG_VRS = {b"OB", b"OW", b"OF", b"OD", b"OL", b"OV", b"UN", b"UT", b"SQ", b"UC", b"UR"}
+_UNDEFINED_LENGTH = 0xFFFFFFFF
+
+
+def is_dicom(contents):
+    """True for DICOM Part 10 data (128-byte preamble followed by "DICM")."""
+    return len(contents) >= 132 and bytes(contents[128:132]) == b"DICM"
+
+
+def is_dicom_path(path):
+    return str(path).lower().endswith(DICOM_EXTENSIONS)
+
+
+def _first(value, default=None):
+    """First value of a possibly multi-valued element, as float."""
+    if value is None or value == "":
+        return default
+    from pydicom.multival import MultiValue  # already loaded by parse_header
+
+    if isinstance(value, (list, tuple, MultiValue)):
+        value = value[0] if len(value) else None
+    return default if value is None else float(value)
+
+
+def _pixel_value_offset(fp, element_offset, implicit_vr):
+    """Offset of the Pixel Data value, or None if it is encapsulated (compressed)."""
+    fp.seek(element_offset)
+    head = fp.read(12)
+    if len(head) < 8 or head[:4] != _PIXEL_DATA_TAG:
+        return None
+    if implicit_vr:
+        length, value_offset = struct.unpack("<I", head[4:8])[0], element_offset + 8
+    elif head[4:6] in _LONG_VRS:
+        length, value_offset = struct.unpack("<I", head[8:12])[0], element_offset + 12
+    else:
+        length, value_offset = struct.unpack("<H", head[6:8])[0], element_offset + 8
+    return None if length == _UNDEFINED_LENGTH else value_offset
+
+
+def parse_header(fp):
+    """
+    Parse everything up to (not including) Pixel Data from an open binary file.
+    Returns a plain dict with the fields needed to read and window the pixels.
+    """
+    import pydicom
+
+    ds = pydicom.dcmread(fp, stop_before_pixels=True, force=True)
+    element_offset = fp.tell()
+
+    transfer_syntax = str(getattr(getattr(ds, "file_meta", None), "TransferSyntaxUID", IMPLICIT_VR_LITTLE_ENDIAN))
+    header = {
+        "rows": int(ds.Rows),
+        "columns": int(ds.Columns),
+        "frames": int(getattr(ds, "NumberOfFrames", 1) or 1),
+        "samples_per_pixel": int(getattr(ds, "SamplesPerPixel", 1)),
+        "bits_allocated": int(getattr(ds, "BitsAllocated", 16)),
+        "bits_stored": int(getattr(ds, "BitsStored", getattr(ds, "BitsAllocated", 16))),
+        "pixel_representation": int(getattr(ds, "PixelRepresentation", 0)),
+        "photometric": str(getattr(ds, "PhotometricInterpretation", "MONOCHROME2")).strip(),
+        "rescale_slope": _first(getattr(ds, "RescaleSlope", None), 1.0),
+        "rescale_intercept": _first(getattr(ds, "RescaleIntercept", None), 0.0),
+        "window_center": _first(getattr(ds, "WindowCenter", None)),
+        "window_width": _first(getattr(ds, "WindowWidth", None)),
+        "transfer_syntax": transfer_syntax,
+        "pixel_offset": None,
+    }
+
+    native = (
+        transfer_syntax in _NATIVE_SYNTAXES
+        and header["samples_per_pixel"] == 1
+        and header["bits_allocated"] in (8, 16, 32)
+    )
+    if native:
+        header["pixel_offset"] = _pixel_value_offset(
+            fp, element_offset, _NATIVE_SYNTAXES[transfer_syntax]
+        )
+    return header
+
+
+class HeaderCache:
+    """
+    Thread-safe LRU of parsed headers keyed by (path, mtime, size), so a
+    file is re-parsed only when it changes.
+    """
+
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        st = os.stat(path)
+        key = (os.fspath(path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            header = self._entries.get(key)
+            if header is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return header
+            self.misses += 1
+
+        with open(path, "rb") as fp:
+            header = parse_header(fp)
+
+        with self._lock:
+            self._entries[key] = header
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return header
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+header_cache = HeaderCache()
+
+
+def reduction_step(rows, columns, target_size, reduced=True):
+    """Largest power-of-two reduction factor (up to 8) whose output still covers target_size."""
+    if not reduced:
+        return 1
+    target_w, target_h = target_size
+    for step in (8, 4, 2):
+        if columns // step >= target_w and rows // step >= target_h:
+            return step
+    return 1
+
+
+def _pixel_dtype(header):
+    kind = "i" if header["pixel_representation"] else "u"
+    return np.dtype(f"<{kind}{header['bits_allocated'] // 8}")
+
+
+# Rows of the reduced image produced per band, bounds the float32 working copy
+_BAND_ROWS = 64
+
+
+def _mask_unused_bits(pixels, header):
+    # Pixel data may carry overlay bits above BitsStored
+    bits_stored = header["bits_stored"]
+    unused = header["bits_allocated"] - bits_stored
+    if unused <= 0:
+        return pixels
+    if header["pixel_representation"]:
+        # Signed: sign-extend from bit BitsStored - 1 (arithmetic right shift)
+        pixels <<= unused
+        pixels >>= unused
+    else:
+        pixels &= (1 << bits_stored) - 1
+    return pixels
+
+
+def _block_mean(frame, step, prepare=None):
+    """
+    Mean over step x step blocks (trailing partial blocks are dropped), read
+    one band of rows at a time. prepare() is applied to each raw band copy.
+    """
+    rows, columns = frame.shape[0] // step, frame.shape[1] // step
+    out = np.empty((rows, columns), dtype=np.float32)
+    for r in range(0, rows, _BAND_ROWS):
+        n = min(_BAND_ROWS, rows - r)
+        band = np.array(frame[r * step:(r + n) * step, :columns * step])
+        if prepare is not None:
+            band = prepare(band)
+        out[r:r + n] = band.reshape(n, step, columns, step).mean(axis=(1, 3), dtype=np.float32)
+    return out
+
+
+def _read_native(source, header, step):
+    """Area-reduced first-frame pixels straight from the file (memory-mapped) or buffer."""
+    shape = (header["rows"], header["columns"])
+    dtype = _pixel_dtype(header)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        frame = np.frombuffer(
+            source, dtype=dtype, count=shape[0] * shape[1], offset=header["pixel_offset"]
+        ).reshape(shape)
+    else:
+        frame = np.memmap(source, dtype=dtype, mode="r", offset=header["pixel_offset"], shape=shape)
+    prepare = lambda band: _mask_unused_bits(band, header)
+    if step == 1:
+        return prepare(np.array(frame))
+    return _block_mean(frame, step, prepare)
+
+
+def _read_compressed(source, step):
+    """Full decode through pydicom's pixel handlers, then the same block mean."""
+    import pydicom
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    ds = pydicom.dcmread(source, force=True)
+    pixels = ds.pixel_array
+    if int(getattr(ds, "NumberOfFrames", 1) or 1) > 1:
+        pixels = pixels[0]
+    if pixels.ndim == 3:
+        # Colour secondary captures: luminance only
+        pixels = pixels.astype(np.float32).mean(axis=-1)
+    if step == 1:
+        return np.ascontiguousarray(pixels)
+    return _block_mean(pixels, step)
+
+
+def apply_window(pixels, header):
+    """
+    Rescale slope/intercept, then window/level (DICOM PS3.3 C.11.2.1.2
+    linear function) to uint8. Without a window the full pixel range is
+    used. MONOCHROME1 (bright = low attenuation) is inverted.
+    """
+    x = pixels.astype(np.float32)
+    if header["rescale_slope"] != 1.0:
+        x *= header["rescale_slope"]
+    if header["rescale_intercept"]:
+        x += header["rescale_intercept"]
+
+    center, width = header["window_center"], header["window_width"]
+    if center is not None and width is not None and width >= 1:
+        low = center - 0.5 - (width - 1) / 2
+        high = center - 0.5 + (width - 1) / 2
+    else:
+        low, high = float(x.min()), float(x.max())
+
+    x -= low
+    x *= 255.0 / max(high - low, 1e-6)
+    np.clip(x, 0, 255, out=x)
+    gray = x.astype(np.uint8)
+
+    if header["photometric"] == "MONOCHROME1":
+        np.subtract(255, gray, out=gray)
+    return gray
+
+
+def _check_budget(header, max_pixels):
+    pixels = header["rows"] * header["columns"]
+    if max_pixels and pixels > max_pixels:
+        raise ImageTooLarge(
+            f"Image is {header['columns']}x{header['rows']} pixels (max {max_pixels})"
+        )
+
+
+def _to_gray(source, header, target_size, reduced):
+    step = reduction_step(header["rows"], header["columns"], target_size, reduced)
+    if header["pixel_offset"] is not None:
+        pixels = _read_native(source, header, step)
+    else:
+        pixels = _read_compressed(source, step)
+    return apply_window(pixels, header)
+
+
+def read_dicom_gray(path, target_size=(224, 224), reduced=True,
+                    max_pixels=MAX_IMAGE_PIXELS, cache=header_cache):
+    """
+    Windowed uint8 grayscale image from a DICOM file on disk, downsampled
+    by up to 8x while still covering target_size. Headers come from `cache`.
+    """
+    if cache is not None:
+        header = cache.get(path)
+    else:
+        with open(path, "rb") as fp:
+            header = parse_header(fp)
+    _check_budget(header, max_pixels)
+    return _to_gray(path, header, target_size, reduced)
+
+
+def decode_dicom_gray(contents, target_size=(224, 224), reduced=True,
+                      max_bytes=MAX_IMAGE_BYTES, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    In-memory counterpart of read_dicom_gray for uploaded bytes; the pixel
+    data is read in place from the buffer.
+    Returns None if the bytes are not a readable DICOM image (bad header or
+    corrupt/truncated pixel data); over-budget images raise ImageTooLarge.
+    """
+    if max_bytes and len(contents) > max_bytes:
+        raise ImageTooLarge(f"Image is {len(contents)} bytes (max {max_bytes})")
+    try:
+        header = parse_header(io.BytesIO(contents))
+    except Exception:
+        return None
+    _check_budget(header, max_pixels)
+    try:
+        return _to_gray(contents, header, target_size, reduced)
+    except ImageTooLarge:
+        raise
+    except Exception:
+        return None
@@ -1,17 +1,71 @@
 import tensorflow as tf
 import os
+import numpy as np
 from tensorflow.keras.applications.resnet import preprocess_input
+from src.data.dicom import DICOM_EXTENSIONS, read_dicom_gray
+from src.data.constants import IMG_SIZE, CLASS_NAMES
 
-IMG_SIZE = (224, 224)
 BATCH_SIZE = 32
 AUTOTUNE = tf.data.AUTOTUNE
 
-CLASS_NAMES = ["NORMAL", "BACTERIAL_PNEUMONIA", "VIRAL_PNEUMONIA"]
+IMAGE_EXTENSIONS = ("jpg", "jpeg", "png") + tuple(ext.lstrip(".") for ext in DICOM_EXTENSIONS)
+
+def decode_jpeg_reduced(image_bytes, channels=3, target_size=IMG_SIZE):
+    """
+    Decode with JPEG DCT scaling (1/2, 1/4 or 1/8) when the source is large
+    enough that the reduced image still covers target_size; non-JPEG input
+    (e.g. PNG) is decoded at full size.
+    """
+    def reduced():
+        shape = tf.image.extract_jpeg_shape(image_bytes)
+        short_side = tf.minimum(shape[0], shape[1])
+        target = max(target_size)
+        branch = (
+            tf.cast(short_side >= 2 * target, tf.int32)
+            + tf.cast(short_side >= 4 * target, tf.int32)
+            + tf.cast(short_side >= 8 * target, tf.int32)
+        )
+        return tf.switch_case(branch, [
+            lambda r=r: tf.io.decode_jpeg(image_bytes, channels=channels, ratio=r)
+            for r in (1, 2, 4, 8)
+        ])
+
+    def full():
+        return tf.io.decode_jpeg(image_bytes, channels=channels)
+
+    return tf.cond(tf.io.is_jpeg(image_bytes), reduced, full)
+
+
+def _read_dicom_uint8(image_path, target_size, channels):
+    gray = read_dicom_gray(image_path.decode(), target_size)
+    return np.repeat(gray[..., None], channels, axis=-1)
+
+
+def decode_image_file(image_path, channels=3, target_size=IMG_SIZE):
+    """
+    Read and decode one image file as uint8 (H, W, channels).
+
+    DICOM files (.dcm/.dicom) are read natively (memory-mapped pixel data,
+    window/level, MONOCHROME1 inversion, downsampled; see src/data/dicom.py),
+    everything else goes through decode_jpeg_reduced.
+    """
+    def dicom():
+        image = tf.numpy_function(
+            lambda p: _read_dicom_uint8(p, target_size, channels), [image_path], tf.uint8
+        )
+        image.set_shape([None, None, channels])
+        return image
+
+    def encoded():
+        return decode_jpeg_reduced(tf.io.read_file(image_path), channels=channels, target_size=target_size)
+
+    is_dicom = tf.strings.regex_full_match(tf.strings.lower(image_path), r".*\.(dcm|dicom)")
+    return tf.cond(is_dicom, dicom, encoded)
+
 
 def decode_and_resize(image_path, label):
     # Load file
-    image = tf.io.read_file(image_path)
-    image = tf.io.decode_jpeg(image, channels=3)
+    image = decode_image_file(image_path, channels=3)
 
     # Resize
     image = tf.image.resize(image, IMG_SIZE)
@@ -29,7 +83,7 @@ def build_dataset(root_dir):
     for idx, cls in enumerate(CLASS_NAMES):
         class_dir = os.path.join(root_dir, cls)
         for file in os.listdir(class_dir):
-            if file.lower().endswith(("jpg", "jpeg", "png")):
+            if file.lower().endswith(IMAGE_EXTENSIONS):
                 image_paths.append(os.path.join(class_dir, file))
                 labels.append(idx)
 
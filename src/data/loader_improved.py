@@ -5,7 +5,8 @@ import tensorflow as tf
 import os
 import numpy as np
 from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, StratifiedKFold
+from src.data.loader import decode_image_file, IMAGE_EXTENSIONS
 
 IMG_SIZE = (224, 224)
 BATCH_SIZE = 32
@@ -39,40 +40,34 @@ def medical_augmentation(image, label):
 
 def decode_and_resize(image_path, label):
     """Load and preprocess image"""
-    image = tf.io.read_file(image_path)
-    image = tf.io.decode_jpeg(image, channels=3)
+    image = decode_image_file(image_path, channels=3)
     image = tf.image.resize(image, IMG_SIZE)
     image = preprocess_input(image)
     return image, label
 
 
-def build_dataset_with_validation(root_dir, val_split=0.15, augment=False):
-    """
-    Build dataset with proper train/validation split
-    
-    Args:
-        root_dir: Root directory with class folders
-        val_split: Fraction for validation (default 15%)
-        augment: Whether to apply data augmentation
-    
-    Returns:
-        train_ds, val_ds (TensorFlow datasets)
-    """
+def list_image_files(root_dir):
+    """Collect all image file paths and their class indices under root_dir/<CLASS_NAME>/"""
     image_paths = []
     labels = []
 
-    # Collect all file paths and labels
     for idx, cls in enumerate(CLASS_NAMES):
         class_dir = os.path.join(root_dir, cls)
         for file in os.listdir(class_dir):
-            if file.lower().endswith(("jpg", "jpeg", "png")):
+            if file.lower().endswith(IMAGE_EXTENSIONS):
                 image_paths.append(os.path.join(class_dir, file))
                 labels.append(idx)
 
-    # Stratified split to maintain class distribution
-    image_paths = np.array(image_paths)
-    labels = np.array(labels)
+    return np.array(image_paths), np.array(labels)
+
+
+def stratified_split(image_paths, labels, val_split=0.15):
+    """
+    Stratified train/validation split to maintain class distribution
     
+    Returns:
+        X_train, X_val, y_train, y_val
+    """
     X_train, X_val, y_train, y_val = train_test_split(
         image_paths, labels,
         test_size=val_split,
@@ -84,6 +79,41 @@ def build_dataset_with_validation(root_dir, val_split=0.15, augment=False):
     print(f"Train class distribution: {np.bincount(y_train)}")
     print(f"Val class distribution: {np.bincount(y_val)}")
     
+    return X_train, X_val, y_train, y_val
+
+
+def stratified_folds(image_paths, labels, folds=5):
+    """
+    Stratified k-fold partition (same seed as stratified_split)
+    
+    Returns:
+        [(X_fold, y_fold), ...] - each fold is the validation set of one split
+    """
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    partition = [
+        (image_paths[val_idx], labels[val_idx])
+        for _, val_idx in splitter.split(image_paths, labels)
+    ]
+    for i, (_, y_fold) in enumerate(partition):
+        print(f"Fold {i}: {len(y_fold)} samples, class distribution: {np.bincount(y_fold)}")
+    return partition
+
+
+def build_dataset_with_validation(root_dir, val_split=0.15, augment=False):
+    """
+    Build dataset with proper train/validation split
+    
+    Args:
+        root_dir: Root directory with class folders
+        val_split: Fraction for validation (default 15%)
+        augment: Whether to apply data augmentation
+    
+    Returns:
+        train_ds, val_ds (TensorFlow datasets)
+    """
+    image_paths, labels = list_image_files(root_dir)
+    X_train, X_val, y_train, y_val = stratified_split(image_paths, labels, val_split)
+    
     # Build training dataset
     train_ds = tf.data.Dataset.from_tensor_slices((X_train, y_train))
     train_ds = train_ds.shuffle(buffer_size=len(X_train), seed=42)
@@ -110,7 +140,7 @@ def build_dataset(root_dir):
     for idx, cls in enumerate(CLASS_NAMES):
         class_dir = os.path.join(root_dir, cls)
         for file in os.listdir(class_dir):
-            if file.lower().endswith(("jpg", "jpeg", "png")):
+            if file.lower().endswith(IMAGE_EXTENSIONS):
                 image_paths.append(os.path.join(class_dir, file))
                 labels.append(idx)
 
@@ -130,6 +160,6 @@ def get_all_labels_from_directory(root_dir):
     for idx, cls in enumerate(CLASS_NAMES):
         class_dir = os.path.join(root_dir, cls)
         for f in os.listdir(class_dir):
-            if f.lower().endswith(("jpg", "jpeg", "png")):
+            if f.lower().endswith(IMAGE_EXTENSIONS):
                 labels.append(idx)
     return np.array(labels)
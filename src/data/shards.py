@@ -0,0 +1,233 @@
+"""
+Sharded, pre-decoded dataset format for training.
+
+The JPEG loaders re-read, re-decode and re-resize every image on every
+epoch. This module decodes and resizes each image once, offline, into
+uint8 224x224x3 tensors stored in sharded TFRecord files with a JSON index.
+Training then streams the shards with parallel interleave; preprocessing
+and augmentation still run per epoch on top.
+
+Build shards:
+    python -m src.data.shards --root data/raw/train --out data/shards/train --val-split 0.15
+    python -m src.data.shards --root data/raw/test --out data/shards/test
+    python -m src.data.shards --root data/raw/train --out data/shards/folds --folds 5
+"""
+import os
+import json
+import argparse
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+
+from src.data.loader import decode_image_file
+from src.data.loader_improved import (
+    CLASS_NAMES, IMG_SIZE, BATCH_SIZE, AUTOTUNE,
+    list_image_files, stratified_split, stratified_folds, medical_augmentation,
+)
+
+SHARD_SIZE = 1024
+INDEX_FILE = "index.json"
+
+_FEATURES = {
+    "image": tf.io.FixedLenFeature([], tf.string),
+    "label": tf.io.FixedLenFeature([], tf.int64),
+}
+
+
+def _decode_to_uint8(image_path, label):
+    """Decode and resize once; stored as uint8 so shards stay 4x smaller than float32."""
+    image = decode_image_file(image_path, channels=3)
+    image = tf.image.resize(image, IMG_SIZE)
+    image = tf.cast(tf.round(tf.clip_by_value(image, 0.0, 255.0)), tf.uint8)
+    return image, label
+
+
+def _serialize(image, label):
+    example = tf.train.Example(features=tf.train.Features(feature={
+        "image": tf.train.Feature(bytes_list=tf.train.BytesList(value=[image.tobytes()])),
+        "label": tf.train.Feature(int64_list=tf.train.Int64List(value=[int(label)])),
+    }))
+    return example.SerializeToString()
+
+
+def write_shards(image_paths, labels, out_dir, prefix, shard_size=SHARD_SIZE):
+    """
+    Decode/resize images in parallel and write them to
+    out_dir/<prefix>-00000.tfrecord, ... Returns the index entries.
+    """
+    # Shuffle once so every shard holds a mix of classes
+    order = np.random.RandomState(42).permutation(len(image_paths))
+    image_paths = np.asarray(image_paths)[order]
+    labels = np.asarray(labels)[order]
+
+    ds = tf.data.Dataset.from_tensor_slices((image_paths, labels))
+    ds = ds.map(_decode_to_uint8, num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
+
+    shards = []
+    writer = None
+    count = 0
+    for i, (image, label) in enumerate(ds.as_numpy_iterator()):
+        if i % shard_size == 0:
+            if writer is not None:
+                writer.close()
+                shards[-1]["count"] = count
+            name = f"{prefix}-{len(shards):05d}.tfrecord"
+            writer = tf.io.TFRecordWriter(os.path.join(out_dir, name))
+            shards.append({"file": name, "count": 0})
+            count = 0
+        writer.write(_serialize(image, label))
+        count += 1
+
+    if writer is not None:
+        writer.close()
+        shards[-1]["count"] = count
+
+    return {
+        "shards": shards,
+        "num_samples": int(len(labels)),
+        "class_counts": np.bincount(labels, minlength=len(CLASS_NAMES)).tolist(),
+    }
+
+
+def build_shards(root_dir, out_dir, val_split=None, shard_size=SHARD_SIZE, folds=None):
+    """
+    Offline build step: decode every image under root_dir/<CLASS_NAME>/ once
+    and write sharded uint8 tensors plus an index.json.
+
+    With val_split, uses the same stratified split as
+    loader_improved.build_dataset_with_validation and writes separate
+    "train" and "val" shard sets. With folds, writes stratified k-fold
+    shard sets "fold0" ... "fold<k-1>" (see fold_splits).
+    """
+    if val_split and folds:
+        raise ValueError("Use either val_split or folds")
+    os.makedirs(out_dir, exist_ok=True)
+    image_paths, labels = list_image_files(root_dir)
+
+    if val_split:
+        X_train, X_val, y_train, y_val = stratified_split(image_paths, labels, val_split)
+        splits = {"train": (X_train, y_train), "val": (X_val, y_val)}
+    elif folds:
+        splits = {f"fold{i}": fold for i, fold in enumerate(stratified_folds(image_paths, labels, folds))}
+    else:
+        splits = {"all": (image_paths, labels)}
+
+    index = {
+        "source": root_dir,
+        "classes": CLASS_NAMES,
+        "image_shape": [IMG_SIZE[0], IMG_SIZE[1], 3],
+        "dtype": "uint8",
+        "val_split": val_split,
+        "folds": folds,
+        "splits": {},
+    }
+    for split, (paths, split_labels) in splits.items():
+        print(f"Writing {split}: {len(paths)} images...")
+        index["splits"][split] = write_shards(paths, split_labels, out_dir, split, shard_size)
+
+    with open(os.path.join(out_dir, INDEX_FILE), "w") as f:
+        json.dump(index, f, indent=2)
+
+    print(f"✓ Shards written to {out_dir}")
+    return index
+
+
+def fold_splits(index, fold):
+    """(train split names, val split name) for one fold of a --folds shard set."""
+    names = [f"fold{i}" for i in range(index["folds"])]
+    return [name for name in names if name != names[fold]], names[fold]
+
+
+def load_index(shard_dir):
+    with open(os.path.join(shard_dir, INDEX_FILE)) as f:
+        return json.load(f)
+
+
+def _parse(record, image_shape):
+    parsed = tf.io.parse_single_example(record, _FEATURES)
+    image = tf.io.decode_raw(parsed["image"], tf.uint8)
+    image = tf.reshape(image, image_shape)
+    return image, tf.cast(parsed["label"], tf.int32)
+
+
+def shard_dataset(
+    shard_dir,
+    split="all",
+    shuffle=False,
+    augment=False,
+    preprocess=preprocess_input,
+    batch_size=BATCH_SIZE,
+):
+    """
+    Stream a shard split (or a list of splits, e.g. all folds but one)
+    with parallel interleave.
+
+    Images are cast to float32 and passed through `preprocess` (the same
+    model preprocessing the JPEG loaders apply), then optionally augmented,
+    every epoch. Nothing is cached in RAM, so datasets larger than memory work.
+    """
+    index = load_index(shard_dir)
+    splits = [split] if isinstance(split, str) else list(split)
+    infos = [index["splits"][name] for name in splits]
+    num_samples = sum(info["num_samples"] for info in infos)
+    image_shape = index["image_shape"]
+    files = [os.path.join(shard_dir, s["file"]) for info in infos for s in info["shards"]]
+
+    ds = tf.data.Dataset.from_tensor_slices(files)
+    if shuffle:
+        ds = ds.shuffle(len(files), reshuffle_each_iteration=True)
+    ds = ds.interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=min(len(files), 8),
+        num_parallel_calls=AUTOTUNE,
+        deterministic=not shuffle,
+    )
+    if shuffle:
+        ds = ds.shuffle(buffer_size=min(num_samples, 4 * SHARD_SIZE))
+
+    def decode(record):
+        image, label = _parse(record, image_shape)
+        return preprocess(tf.cast(image, tf.float32)), label
+
+    ds = ds.map(decode, num_parallel_calls=AUTOTUNE)
+    if augment:
+        ds = ds.map(medical_augmentation, num_parallel_calls=AUTOTUNE)
+
+    return ds.batch(batch_size).prefetch(AUTOTUNE)
+
+
+def build_dataset_from_shards(shard_dir, preprocess=preprocess_input, shuffle=True):
+    """Shard-backed counterpart of build_dataset (whole directory, no split)"""
+    return shard_dataset(shard_dir, "all", shuffle=shuffle, preprocess=preprocess)
+
+
+def build_dataset_with_validation_from_shards(shard_dir, augment=False, preprocess=preprocess_input):
+    """
+    Shard-backed counterpart of loader_improved.build_dataset_with_validation.
+    Requires shards built with --val-split.
+    
+    Returns:
+        train_ds, val_ds (TensorFlow datasets)
+    """
+    train_ds = shard_dataset(shard_dir, "train", shuffle=True, augment=augment, preprocess=preprocess)
+    val_ds = shard_dataset(shard_dir, "val", preprocess=preprocess)
+    return train_ds, val_ds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build sharded, pre-decoded training data")
+    parser.add_argument("--root", required=True, help="Directory with one folder per class")
+    parser.add_argument("--out", required=True, help="Output directory for shards + index.json")
+    parser.add_argument("--val-split", type=float, default=None,
+                        help="Write stratified train/val shard sets (e.g. 0.15)")
+    parser.add_argument("--folds", type=int, default=None,
+                        help="Write stratified k-fold shard sets fold0..fold<k-1> (e.g. 5)")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    args = parser.parse_args()
+
+    build_shards(args.root, args.out, val_split=args.val_split, shard_size=args.shard_size, folds=args.folds)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,36 @@ Advanced X-ray preprocessing to improve model accuracy
 These techniques enhance lung features in chest X-rays
 """
 
+import threading
+
 import cv2
 import numpy as np
 from PIL import Image
 
+# CLAHE objects are not thread-safe, so each thread keeps its own
+_clahe_local = threading.local()
+
+
+def get_clahe(clip_limit=2.0, tile_grid_size=(8, 8)):
+    """
+    Per-thread cached CLAHE object (avoids cv2.createCLAHE on every image)
+    """
+    cache = getattr(_clahe_local, "cache", None)
+    if cache is None:
+        cache = _clahe_local.cache = {}
+    key = (clip_limit, tuple(tile_grid_size))
+    clahe = cache.get(key)
+    if clahe is None:
+        clahe = cache[key] = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tuple(tile_grid_size))
+    return clahe
+
+
+def apply_clahe_gray(gray):
+    """
+    CLAHE on a single-channel uint8 image; returns single-channel
+    """
+    return get_clahe().apply(gray)
+
 
 def apply_clahe(image_array):
     """
@@ -20,14 +46,35 @@ def apply_clahe(image_array):
         gray = image_array
     
     # Apply CLAHE
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    enhanced = clahe.apply(gray)
+    enhanced = apply_clahe_gray(gray)
     
     # Convert back to RGB
     enhanced_rgb = cv2.cvtColor(enhanced, cv2.COLOR_GRAY2RGB)
     return enhanced_rgb
 
 
+def preprocess_gray(gray, target_size=(224, 224)):
+    """
+    Grayscale-native fast path: CLAHE + LANCZOS4 resize on one channel.
+    Same pixels as apply_clahe + 3-channel resize, at a third of the resize work.
+    """
+    enhanced = apply_clahe_gray(gray)
+    return cv2.resize(enhanced, target_size, interpolation=cv2.INTER_LANCZOS4)
+
+
+def write_model_input(gray_resized, out):
+    """
+    Write a single-channel uint8 image into a (H, W, 3) float32 slot of a
+    model-input batch, scaled to [-1, 1] exactly like MobileNetV2's
+    preprocess_input. The channel is broadcast to 3 only here.
+    """
+    channel = gray_resized.astype(np.float32)
+    channel /= 127.5
+    channel -= 1.0
+    out[...] = channel[..., np.newaxis]
+    return out
+
+
 def denoise_xray(image_array):
     """
     Remove noise while preserving edges (lung boundaries)
@@ -22,69 +22,131 @@ def _get_head_layers(model: tf.keras.Model):
     return gap, dropout, dense
 
 
-def make_gradcam_heatmap(
-    img_tensor_4d,
-    model: tf.keras.Model,
-    container_name="resnet50",
-    last_conv_layer_name="conv5_block3_out",
-    pred_index=None
-):
-    """
-    Robust Grad-CAM for your architecture:
-    Input -> resnet50 -> GAP -> Dropout -> Dense
+# Default Grad-CAM target layer per backbone container
+DEFAULT_LAST_CONV_LAYERS = {
+    "resnet50": "conv5_block3_out",
+    "mobilenetv2": "out_relu",
+}
+
+
+def _find_container(model: tf.keras.Model):
+    """The nested backbone model (e.g. "resnet50", "mobilenetv2_1.00_224")."""
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.Model):
+            return layer.name
+    raise ValueError("Could not find a backbone container model inside the classifier.")
 
-    img_tensor_4d: (1, 224, 224, 3) preprocessed tensor/array
-    """
 
-    # Ensure correct tensor type
-    x = tf.convert_to_tensor(img_tensor_4d)
+def _default_last_conv(container_name):
+    for prefix, layer_name in DEFAULT_LAST_CONV_LAYERS.items():
+        if container_name.startswith(prefix):
+            return layer_name
+    raise ValueError(f"No default Grad-CAM layer for backbone {container_name!r}; pass last_conv_layer_name.")
 
-    # Some Keras models expect list structure for inputs
-    model_input = [x] if isinstance(model.inputs, (list, tuple)) and len(model.inputs) == 1 else x
 
-    backbone = model.get_layer(container_name)
+class GradCAMEngine:
+    """
+    Grad-CAM for Input -> backbone -> GAP -> Dropout -> Dense classifiers.
 
-    # Build model that outputs BOTH:
-    # - chosen conv layer output
-    # - backbone final output
-    backbone_multi = tf.keras.Model(
-        inputs=backbone.input,
-        outputs=[backbone.get_layer(last_conv_layer_name).output, backbone.output]
-    )
+    The multi-output backbone graph and head layers are resolved once per
+    (model, container, layer); the gradient step is a tf.function, and a
+    whole batch is explained in one tape.
 
-    gap, dropout, dense = _get_head_layers(model)
+    Works with both the ResNet50 ("resnet50") and MobileNetV2
+    ("mobilenetv2_1.00_224") containers; both are auto-detected by default.
+    """
 
-    with tf.GradientTape() as tape:
-        # Forward through backbone once (connected graph)
-        conv_out, backbone_out = backbone_multi(model_input, training=False)
+    def __init__(self, model: tf.keras.Model, container_name=None, last_conv_layer_name=None):
+        self.container_name = container_name or _find_container(model)
+        self.last_conv_layer_name = last_conv_layer_name or _default_last_conv(self.container_name)
 
-        # Forward through head using backbone_out (still connected)
-        x_head = gap(backbone_out)
-        if dropout is not None:
-            x_head = dropout(x_head, training=False)
-        preds = dense(x_head)
+        backbone = model.get_layer(self.container_name)
 
+        # Model that outputs BOTH:
+        # - chosen conv layer output
+        # - backbone final output
+        self.backbone_multi = tf.keras.Model(
+            inputs=backbone.input,
+            outputs=[backbone.get_layer(self.last_conv_layer_name).output, backbone.output]
+        )
+        self.gap, self.dropout, self.dense = _get_head_layers(model)
+        self._step = tf.function(self._compute, reduce_retracing=True)
+
+    def _compute(self, x, class_index):
+        with tf.GradientTape() as tape:
+            # Forward through backbone once (connected graph)
+            conv_out, backbone_out = self.backbone_multi(x, training=False)
+
+            # Forward through head using backbone_out (still connected)
+            x_head = self.gap(backbone_out)
+            if self.dropout is not None:
+                x_head = self.dropout(x_head, training=False)
+            preds = self.dense(x_head)
+
+            # Negative class index => explain the predicted class
+            target = tf.where(
+                class_index < 0,
+                tf.argmax(preds, axis=1, output_type=tf.int32),
+                class_index,
+            )
+            class_score = tf.gather(preds, target, batch_dims=1)
+
+        # Samples are independent, so one gradient gives each sample's own gradient
+        grads = tape.gradient(class_score, conv_out)
+
+        pooled_grads = tf.reduce_mean(grads, axis=(1, 2))  # (N, C)
+        heatmap = tf.einsum("nhwc,nc->nhw", conv_out, pooled_grads)
+        heatmap = tf.maximum(heatmap, 0)
+        heatmap = heatmap / (tf.reduce_max(heatmap, axis=(1, 2), keepdims=True) + 1e-9)
+        return heatmap, preds, target
+
+    def explain(self, img_tensor_4d, pred_index=None):
+        """
+        img_tensor_4d: (N, 224, 224, 3) preprocessed batch
+        pred_index: None (predicted class), an int for every sample, or one int per sample
+        Returns: heatmaps (N, Hc, Wc) in [0, 1], probabilities (N, classes), explained class indices (N,)
+        """
+        x = tf.convert_to_tensor(img_tensor_4d, dtype=tf.float32)
+        n = int(x.shape[0])
         if pred_index is None:
-            pred_index = tf.argmax(preds[0])
+            class_index = tf.fill([n], -1)
+        else:
+            class_index = tf.cast(tf.broadcast_to(tf.reshape(pred_index, [-1]), [n]), tf.int32)
 
-        class_score = preds[:, pred_index]
+        heatmap, preds, target = self._step(x, class_index)
+        return heatmap.numpy(), preds.numpy(), target.numpy()
 
-    grads = tape.gradient(class_score, conv_out)
 
-    if grads is None:
-        raise RuntimeError(
-            "Gradients are None. This means the class score is not connected to conv_out. "
-            "Double-check container_name/last_conv_layer_name."
-        )
+def get_gradcam_engine(model: tf.keras.Model, container_name=None, last_conv_layer_name=None, cache=None):
+    """
+    GradCAMEngine for `model`, reused from `cache` (a dict owned by whoever
+    owns the model, e.g. ModelVersion.explain_engines) so it is dropped with it.
+    """
+    if cache is None:
+        return GradCAMEngine(model, container_name, last_conv_layer_name)
+    key = (container_name, last_conv_layer_name)
+    engine = cache.get(key)
+    if engine is None:
+        engine = cache[key] = GradCAMEngine(model, container_name, last_conv_layer_name)
+    return engine
 
-    pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
 
-    conv_out = conv_out[0]  # (Hc, Wc, C)
-    heatmap = conv_out @ pooled_grads[..., tf.newaxis]
-    heatmap = tf.squeeze(heatmap)
+def make_gradcam_heatmap(
+    img_tensor_4d,
+    model: tf.keras.Model,
+    container_name="resnet50",
+    last_conv_layer_name="conv5_block3_out",
+    pred_index=None
+):
+    """
+    Robust Grad-CAM for your architecture:
+    Input -> resnet50 -> GAP -> Dropout -> Dense
 
-    heatmap = tf.maximum(heatmap, 0) / (tf.reduce_max(heatmap) + 1e-9)
-    return heatmap.numpy(), (container_name, last_conv_layer_name)
+    img_tensor_4d: (1, 224, 224, 3) preprocessed tensor/array
+    """
+    engine = get_gradcam_engine(model, container_name, last_conv_layer_name)
+    heatmaps, _, _ = engine.explain(img_tensor_4d, pred_index)
+    return heatmaps[0], (container_name, last_conv_layer_name)
 
 
 def overlay_heatmap_bgr(original_bgr, heatmap_01, alpha=0.35, colormap=cv2.COLORMAP_JET):
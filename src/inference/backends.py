@@ -0,0 +1,154 @@
+"""
+Inference backends selectable at startup.
+
+Every backend exposes `predict(x, verbose=0)` on a (N, 224, 224, 3)
+preprocessed batch and returns (N, num_classes) probabilities, so it can be
+used anywhere a Keras model is (the API, `evaluate_multiclass`, ...).
+"""
+import os
+import time
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+BACKENDS = ("keras", "tflite")
+
+# Batch sizes the serving function is traced for; other sizes are padded up
+BATCH_BUCKETS = (1, 4, 8, 16)
+
+
+class CompiledKerasModel:
+    """
+    Serve a Keras model through a traced tf.function instead of model.predict.
+
+    model.predict rebuilds its data adapter and callback machinery on every
+    call, which dominates latency for single images. Here the forward pass is
+    traced once per batch bucket with a fixed input signature; a batch is
+    padded up to the nearest bucket (and split if larger than the biggest).
+    """
+
+    def __init__(self, keras_model, buckets=BATCH_BUCKETS):
+        self.model = keras_model
+        self.buckets = tuple(sorted(set(int(b) for b in buckets)))
+        input_shape = tuple(keras_model.input_shape[1:])
+
+        forward = tf.function(lambda x: self.model(x, training=False))
+        self._fns = {
+            b: forward.get_concrete_function(tf.TensorSpec((b,) + input_shape, tf.float32))
+            for b in self.buckets
+        }
+
+    def _bucket_for(self, n):
+        for b in self.buckets:
+            if n <= b:
+                return b
+        return self.buckets[-1]
+
+    def _run_bucket(self, x):
+        n = x.shape[0]
+        bucket = self._bucket_for(n)
+        if n < bucket:
+            pad = np.zeros((bucket - n,) + x.shape[1:], dtype=np.float32)
+            x = np.concatenate([x, pad], axis=0)
+        return self._fns[bucket](tf.constant(x)).numpy()[:n]
+
+    def predict(self, x, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        largest = self.buckets[-1]
+        if x.shape[0] <= largest:
+            return self._run_bucket(x)
+        return np.concatenate(
+            [self._run_bucket(x[i:i + largest]) for i in range(0, x.shape[0], largest)],
+            axis=0,
+        )
+
+
+def warmup(model, buckets=BATCH_BUCKETS, input_shape=(224, 224, 3), repeats=3):
+    """
+    Run every batch bucket once to pay tracing/allocation cost up front,
+    then return the median warm latency per bucket in milliseconds.
+    """
+    latencies = {}
+    for b in buckets:
+        x = np.zeros((b,) + tuple(input_shape), dtype=np.float32)
+        model.predict(x, verbose=0)
+
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model.predict(x, verbose=0)
+            times.append((time.perf_counter() - start) * 1000.0)
+        latencies[b] = float(np.median(times))
+    return latencies
+
+
+class TFLiteModel:
+    """
+    TFLite interpreter wrapper with a Keras-like predict().
+
+    Handles float16 and int8 artifacts, including quantized input/output
+    tensors. The interpreter is not thread-safe, so calls are serialized.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = model_path
+        self.interpreter = tf.lite.Interpreter(
+            model_path=model_path,
+            num_threads=num_threads or os.cpu_count(),
+        )
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        if batch_size == self._batch_size:
+            return
+        shape = [batch_size] + [int(d) for d in self._input["shape"][1:]]
+        self.interpreter.resize_tensor_input(self._input["index"], shape)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = batch_size
+
+    def _quantize_input(self, x):
+        dtype = self._input["dtype"]
+        if dtype == np.float32:
+            return x.astype(np.float32, copy=False)
+        scale, zero_point = self._input["quantization"]
+        info = np.iinfo(dtype)
+        return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize_output(self, y):
+        if self._output["dtype"] == np.float32:
+            return y
+        scale, zero_point = self._output["quantization"]
+        return (y.astype(np.float32) - zero_point) * scale
+
+    def predict(self, x, verbose=0):
+        x = np.asarray(x)
+        with self._lock:
+            self._resize(x.shape[0])
+            self.interpreter.set_tensor(self._input["index"], self._quantize_input(x))
+            self.interpreter.invoke()
+            y = self.interpreter.get_tensor(self._output["index"])
+        return self._dequantize_output(y)
+
+
+def load_inference_model(backend, model_path, buckets=BATCH_BUCKETS, num_threads=None):
+    """
+    Load a model for serving.
+
+    backend: "keras" (Keras model from a .keras file, served through a
+             traced function per batch bucket) or
+             "tflite" (TFLite interpreter from a .tflite file)
+    num_threads: TFLite interpreter threads (Keras uses TensorFlow's
+             intra-op setting)
+    """
+    if backend == "keras":
+        return CompiledKerasModel(tf.keras.models.load_model(model_path), buckets=buckets)
+    if backend == "tflite":
+        return TFLiteModel(model_path, num_threads=num_threads)
+    raise ValueError(f"Unknown inference backend: {backend!r} (expected one of {BACKENDS})")
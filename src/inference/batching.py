@@ -0,0 +1,207 @@
+"""
+Dynamic micro-batching for the inference API.
+
+Concurrent requests are queued and gathered into a single batched forward
+pass, bounded by a maximum batch size and a maximum wait time. Each caller
+awaits its own row of the batched output.
+"""
+import asyncio
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+from src.inference.executor import INFERENCE_STAGE
+
+# Number of recent queueing delays kept for percentile reporting
+DELAY_WINDOW = 2048
+
+
+class MicroBatcher:
+    """
+    Collects single-image tensors from concurrent callers and runs them
+    through `predict_fn` as one (N, H, W, C) batch.
+
+    predict_fn: callable taking a stacked float32 batch and returning (N, num_classes) probs,
+        or a coroutine function doing the same (awaited directly)
+    max_batch_size: flush as soon as this many images are queued
+    max_wait_ms: flush after waiting this long for the batch to fill
+    executor: optional StageExecutor; when given, predict_fn runs on its
+        inference pool instead of blocking the event loop
+    collate_fn: builds the model batch from the list of submitted items
+        (default: np.stack)
+    max_concurrency: batches in flight at once (e.g. one per inference
+        replica); the next batch is collected while they run. A collate_fn
+        that reuses one buffer needs max_concurrency=1
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0, executor=None,
+                 collate_fn=None, max_concurrency=1):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must be >= 0")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be >= 1")
+
+        self.predict_fn = predict_fn
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait = float(max_wait_ms) / 1000.0
+        self.executor = executor
+        self.collate_fn = collate_fn or (lambda items: np.stack(items, axis=0))
+        self.max_concurrency = int(max_concurrency)
+
+        self._queue = None
+        self._task = None
+        self._in_flight = set()
+
+        # Stats
+        self._batch_sizes = Counter()
+        self._delays = deque(maxlen=DELAY_WINDOW)
+        self._total_images = 0
+        self._total_batches = 0
+        self._total_delay = 0.0
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Let batches already dispatched deliver their results
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+        # Fail anything still waiting so callers don't hang
+        while not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher stopped"))
+
+    async def submit(self, x):
+        """Queue one preprocessed image and wait for its probability vector."""
+        if self._task is None:
+            raise RuntimeError("Batcher not started")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((x, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        """Wait for the first item, then gather more until the batch is full or max_wait expires."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without yielding
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.max_concurrency)
+
+        def release(task):
+            self._in_flight.discard(task)
+            slots.release()
+
+        while True:
+            # Wait for a free slot first, so the next batch fills while others run
+            await slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                slots.release()
+                raise
+            task = loop.create_task(self._dispatch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(release)
+
+    async def _dispatch(self, batch):
+        dispatch_time = time.perf_counter()
+        for _, _, enqueued in batch:
+            self._record_delay(dispatch_time - enqueued)
+        self._batch_sizes[len(batch)] += 1
+        self._total_batches += 1
+        self._total_images += len(batch)
+
+        try:
+            x = self.collate_fn([item[0] for item in batch])
+            probs = await self._predict(x)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for i, (_, future, _) in enumerate(batch):
+            # Caller may have gone away (client disconnect / cancellation)
+            if not future.done():
+                future.set_result(probs[i])
+
+    async def _predict(self, x):
+        if asyncio.iscoroutinefunction(self.predict_fn):
+            probs = await self.predict_fn(x)
+        elif self.executor is not None:
+            probs = await self.executor.run(INFERENCE_STAGE, self.predict_fn, x)
+        else:
+            probs = self.predict_fn(x)
+        return np.asarray(probs)
+
+    def _record_delay(self, delay):
+        self._delays.append(delay)
+        self._total_delay += delay
+
+    def stats(self):
+        """Realized batch sizes and queueing delay, for tuning against p99 latency."""
+        delays_ms = np.asarray(self._delays, dtype=np.float64) * 1000.0
+        if delays_ms.size:
+            p50, p95, p99 = np.percentile(delays_ms, [50, 95, 99])
+            max_delay = float(delays_ms.max())
+        else:
+            p50 = p95 = p99 = max_delay = 0.0
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_concurrency": self.max_concurrency,
+            "batches_in_flight": len(self._in_flight),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "total_batches": self._total_batches,
+            "total_images": self._total_images,
+            "mean_batch_size": (
+                self._total_images / self._total_batches if self._total_batches else 0.0
+            ),
+            "batch_size_histogram": {
+                str(size): count for size, count in sorted(self._batch_sizes.items())
+            },
+            "queue_delay_ms": {
+                "mean": (
+                    self._total_delay * 1000.0 / self._total_images if self._total_images else 0.0
+                ),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+                "max": max_delay,
+            },
+        }
@@ -0,0 +1,98 @@
+"""
+Benchmark: inference throughput vs number of worker replicas.
+
+For each replica count R, starts an InferenceWorkerPool (each replica
+pinned to CPUs/R cores with matching intra-op threads), keeps it saturated
+with 2R client threads sending grayscale batches, and reports images/s and
+scaling efficiency relative to R=1. With --naive, each R is also run the way
+"just start more workers" would: unpinned, every replica sized for all
+cores, to show the cost of oversubscription.
+
+Usage:
+    python -m src.inference.bench_workers --model models/final/best_model.keras
+    python -m src.inference.bench_workers --replicas 1 2 4 8 16 --batch 16 --seconds 20 --naive
+"""
+import time
+import argparse
+import threading
+
+import numpy as np
+
+from src.data.constants import IMG_SIZE
+from src.inference.workers import InferenceWorkerPool, WorkerPoolFull, available_cpus
+
+
+def measure(pool, batch_size, seconds, clients):
+    """Images/s with `clients` threads sending batches back to back for `seconds`."""
+    rng = np.random.RandomState(0)
+    batch = rng.randint(0, 256, size=(batch_size, IMG_SIZE[1], IMG_SIZE[0]), dtype=np.uint8)
+    done = []
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        count = 0
+        while time.perf_counter() < deadline:
+            try:
+                pool.predict(batch)
+                count += batch_size
+            except WorkerPoolFull:
+                time.sleep(0.001)
+        done.append(count)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(done) / (time.perf_counter() - start)
+
+
+def run(args, replicas, pin):
+    intra = None if pin else len(available_cpus())
+    pool = InferenceWorkerPool(
+        args.backend, args.model, replicas,
+        buckets=(args.batch,), intra_op_threads=intra, pin_cpus=pin, max_batch=args.batch,
+    )
+    start = time.perf_counter()
+    pool.start()
+    load_s = time.perf_counter() - start
+    try:
+        # Short warm period, then the measured run
+        measure(pool, args.batch, min(2.0, args.seconds), 2 * replicas)
+        throughput = measure(pool, args.batch, args.seconds, 2 * replicas)
+    finally:
+        pool.shutdown()
+    return throughput, load_s, pool.intra_op_threads
+
+
+def main():
+    cpus = len(available_cpus())
+    default_replicas = sorted({r for r in (1, 2, 4, 8, 16, 32) if r <= cpus} | {cpus})
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="models/final/best_model.keras")
+    parser.add_argument("--backend", default="keras", choices=("keras", "tflite"))
+    parser.add_argument("--replicas", type=int, nargs="+", default=default_replicas)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--naive", action="store_true", help="also run unpinned replicas sized for all cores")
+    args = parser.parse_args()
+
+    print(f"{cpus} CPUs available, batch {args.batch}, {args.seconds:.0f}s per run\n")
+    print(f"{'mode':<10}{'replicas':>9}{'intra-op':>10}{'img/s':>10}{'speedup':>9}{'efficiency':>12}{'load s':>9}")
+
+    modes = [("pinned", True)] + ([("naive", False)] if args.naive else [])
+    for mode, pin in modes:
+        base = None
+        for replicas in args.replicas:
+            throughput, load_s, intra = run(args, replicas, pin)
+            if base is None:
+                base = throughput / replicas  # per-replica throughput of the smallest run
+            speedup = throughput / base
+            print(f"{mode:<10}{replicas:>9}{intra:>10}{throughput:>10.1f}{speedup:>8.2f}x"
+                  f"{100.0 * speedup / replicas:>11.0f}%{load_s:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Content-addressed cache of prediction results.
+
+Entries are keyed by a hash of the uploaded bytes plus the version of the
+loaded model, so repeat uploads of the same study skip decode, CLAHE,
+resize and the forward pass entirely.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_hash(contents):
+    """SHA-256 hex digest of uploaded bytes."""
+    return hashlib.sha256(contents).hexdigest()
+
+
+def model_fingerprint(model_path, chunk_size=1 << 20):
+    """Version string for a model file: hash of its contents."""
+    h = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+class PredictionCache:
+    """
+    LRU + TTL cache with bounded entry count and memory.
+
+    max_entries: maximum number of cached predictions
+    max_bytes: approximate memory budget (sum of serialized entry sizes)
+    ttl_seconds: entries older than this are treated as misses
+    """
+
+    def __init__(self, max_entries=4096, max_bytes=32 * 1024 * 1024, ttl_seconds=3600.0):
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl_seconds)
+
+        self.model_version = None
+        self._entries = OrderedDict()  # key -> (value, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def set_model_version(self, version):
+        """Record the loaded model version, dropping every entry if it changed."""
+        with self._lock:
+            if version != self.model_version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._bytes = 0
+                self.model_version = version
+
+    def _key(self, digest, version=None):
+        return f"{version or self.model_version}:{digest}"
+
+    def get(self, digest, version=None):
+        """
+        Return the cached prediction for a content hash, or None. `version`
+        selects another loaded model (e.g. a canary); default: model_version.
+        """
+        key = self._key(digest, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, size, stored_at = entry
+            if self.ttl > 0 and time.monotonic() - stored_at > self.ttl:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, digest, value, version=None):
+        key = self._key(digest, version)
+        size = len(key) + len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model_version": self.model_version,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
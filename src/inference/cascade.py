@@ -0,0 +1,121 @@
+"""
+Confidence-gated model cascade.
+
+A small screening model (build_mobilenetv2_screening_classifier) scores
+every image. Images it is unsure about are escalated to the full model:
+normalized entropy above CASCADE_MAX_ENTROPY or top-1/top-2 margin below
+CASCADE_MIN_MARGIN, the same signals severity scoring uses
+(severity.uncertainty). CascadeModel exposes the usual `predict(x,
+verbose=0)`, so it serves behind the micro-batcher like any backend.
+
+`python -m src.models.eval_cascade` measures escalation rate, latency saved
+and agreement with the full model on the test set for a grid of thresholds.
+Latency saved is only measured there: the full model runs on small
+escalated sub-batches here, which says little about its cost per image
+on a whole batch.
+"""
+import os
+import json
+import time
+import threading
+
+import numpy as np
+
+from src.inference.postprocess import uncertainty_batch
+
+CASCADE_MAX_ENTROPY = float(os.getenv("CASCADE_MAX_ENTROPY", "0.5"))
+CASCADE_MIN_MARGIN = float(os.getenv("CASCADE_MIN_MARGIN", "0.4"))
+
+
+def escalation_mask(probs, max_entropy=CASCADE_MAX_ENTROPY, min_margin=CASCADE_MIN_MARGIN):
+    """(N,) bool: screening outputs uncertain enough to need the full model."""
+    ent_norm, margin = uncertainty_batch(probs)
+    return (ent_norm > max_entropy) | (margin < min_margin)
+
+
+class CascadeModel:
+    """
+    Screening model first, full model on the uncertain rows of each batch.
+
+    Counters (stats()) cover every image served: how many were escalated,
+    how often the screening class agreed with the full model on those, and
+    the time spent in each model.
+    """
+
+    def __init__(self, screen, full, max_entropy=CASCADE_MAX_ENTROPY, min_margin=CASCADE_MIN_MARGIN):
+        self.screen = screen
+        self.full = full
+        self.max_entropy = max_entropy
+        self.min_margin = min_margin
+        self._lock = threading.Lock()
+        self.images = 0
+        self.escalated = 0
+        self.escalated_agreed = 0
+        self.screen_seconds = 0.0
+        self.full_seconds = 0.0
+
+    def predict(self, x, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        start = time.perf_counter()
+        probs = np.array(self.screen.predict(x, verbose=0), dtype=np.float32)
+        screen_seconds = time.perf_counter() - start
+
+        escalate = escalation_mask(probs, self.max_entropy, self.min_margin)
+        escalated = int(escalate.sum())
+        agreed, full_seconds = 0, 0.0
+        if escalated:
+            start = time.perf_counter()
+            full_probs = self.full.predict(x[escalate], verbose=0)
+            full_seconds = time.perf_counter() - start
+            agreed = int(np.sum(probs[escalate].argmax(axis=1) == full_probs.argmax(axis=1)))
+            probs[escalate] = full_probs
+
+        with self._lock:
+            self.images += len(probs)
+            self.escalated += escalated
+            self.escalated_agreed += agreed
+            self.screen_seconds += screen_seconds
+            self.full_seconds += full_seconds
+        return probs
+
+    def stats(self):
+        with self._lock:
+            images, escalated = self.images, self.escalated
+            screen_seconds, full_seconds = self.screen_seconds, self.full_seconds
+            agreed = self.escalated_agreed
+        return {
+            "max_entropy": self.max_entropy,
+            "min_margin": self.min_margin,
+            "images": images,
+            "escalated": escalated,
+            "escalation_rate": escalated / images if images else None,
+            "escalated_agreement": agreed / escalated if escalated else None,
+            "escalated_agreed": agreed,
+            "screen_seconds": screen_seconds,
+            "full_seconds": full_seconds,
+        }
+
+
+def load_test_set_results(path, max_entropy=CASCADE_MAX_ENTROPY, min_margin=CASCADE_MIN_MARGIN):
+    """
+    Test-set row of an eval_cascade report for these thresholds, or None
+    (no report, or the thresholds were not in its grid). latency_saved is
+    the end-to-end measurement if the report was run at these thresholds,
+    and left out otherwise (the grid rows only estimate it).
+    """
+    try:
+        with open(path) as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    def matches(row):
+        return np.isclose(row["max_entropy"], max_entropy) and np.isclose(row["min_margin"], min_margin)
+
+    for row in report.get("results", []):
+        if matches(row):
+            row = {k: v for k, v in row.items() if k != "latency_saved"}
+            if "measured_latency_saved" in report and matches(report["selected"]):
+                row["latency_saved"] = report["measured_latency_saved"]
+            return row
+    return None
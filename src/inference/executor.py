@@ -0,0 +1,100 @@
+"""
+Executors for the blocking stages of the inference pipeline.
+
+OpenCV decode/CLAHE/resize and TensorFlow inference release the GIL, so
+running them on a thread pool lets requests overlap while the asyncio
+event loop stays free for /health and new uploads. Preprocessing can
+optionally run on a process pool instead.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+PREPROCESS_STAGE = "preprocess"
+INFERENCE_STAGE = "inference"
+
+
+class _StageCounters:
+    def __init__(self, workers):
+        self.workers = workers
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+
+    def as_dict(self):
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            # Work submitted but not yet picked up by a worker
+            "queue_depth": max(0, self.in_flight - self.workers),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+class StageExecutor:
+    """
+    Runs blocking pipeline stages off the event loop and tracks per-stage queue depth.
+
+    kind: "thread" or "process" pool for the preprocess stage
+    preprocess_workers: pool size for decode + CLAHE + resize
+    inference_workers: thread pool size for model calls (the model lives in this
+        process, so inference always runs on threads)
+    """
+
+    def __init__(self, kind="thread", preprocess_workers=None, inference_workers=1):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind!r} (expected 'thread' or 'process')")
+
+        preprocess_workers = preprocess_workers or min(8, os.cpu_count() or 1)
+
+        self.kind = kind
+        if kind == "process":
+            # spawn: forking a process that already initialised TensorFlow is unsafe
+            self._preprocess_pool = ProcessPoolExecutor(
+                max_workers=preprocess_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            self._preprocess_pool = ThreadPoolExecutor(
+                max_workers=preprocess_workers, thread_name_prefix="preprocess"
+            )
+        self._inference_pool = ThreadPoolExecutor(
+            max_workers=inference_workers, thread_name_prefix="inference"
+        )
+
+        self._pools = {
+            PREPROCESS_STAGE: self._preprocess_pool,
+            INFERENCE_STAGE: self._inference_pool,
+        }
+        self._counters = {
+            PREPROCESS_STAGE: _StageCounters(preprocess_workers),
+            INFERENCE_STAGE: _StageCounters(inference_workers),
+        }
+
+    async def run(self, stage, fn, *args):
+        """Run `fn(*args)` on the pool for `stage` and await the result."""
+        counters = self._counters[stage]
+        loop = asyncio.get_running_loop()
+
+        counters.in_flight += 1
+        try:
+            result = await loop.run_in_executor(self._pools[stage], fn, *args)
+        except Exception:
+            counters.failed += 1
+            raise
+        finally:
+            counters.in_flight -= 1
+        counters.completed += 1
+        return result
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "stages": {stage: c.as_dict() for stage, c in self._counters.items()},
+        }
+
+    def shutdown(self, wait=True):
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait, cancel_futures=True)
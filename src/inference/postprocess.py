@@ -0,0 +1,162 @@
+"""
+Vectorized post-processing for batches of softmax outputs.
+
+postprocess_batch takes an (N, 3) probability array (plus optional CURB-65
+scores) and returns threshold-adjusted predictions, base severities and
+combined severities in one pass of NumPy array operations. It gives exactly
+the same results as the per-sample functions (smart_threshold,
+severity.compute_severity_1_to_10, severity.compute_combined_severity and
+severity.uncertainty);
+the dtype of every intermediate matches the scalar code
+(tests/test_postprocess.py). `python -m src.inference.postprocess` times
+both.
+"""
+import numpy as np
+
+from src.data.constants import CLASS_NAMES
+from src.inference.severity import compute_severity_1_to_10
+
+NORMAL_IDX = CLASS_NAMES.index("NORMAL")
+BACTERIAL_IDX = CLASS_NAMES.index("BACTERIAL_PNEUMONIA")
+VIRAL_IDX = CLASS_NAMES.index("VIRAL_PNEUMONIA")
+
+# smart_threshold constants. Python floats, as the app always used: scaling and
+# comparisons happen in float64 and scaled values are stored back as float32
+VIRAL_SCALE = 0.75
+NORMAL_BOOST = 1.3
+NORMAL_BOOST_MIN = 0.20
+VIRAL_MIN_CONFIDENCE = 0.70
+
+ENTROPY_EPS = 1e-9
+
+
+def smart_threshold(probs):
+    """
+    Reduce false VIRAL positives by adjusting probability distribution
+    """
+    probs = np.array(probs, dtype=np.float32)
+    probs[VIRAL_IDX] = float(probs[VIRAL_IDX]) * VIRAL_SCALE  # Reduce VIRAL bias
+    if float(probs[NORMAL_IDX]) > NORMAL_BOOST_MIN:
+        probs[NORMAL_IDX] = float(probs[NORMAL_IDX]) * NORMAL_BOOST  # Boost NORMAL
+    probs = probs / np.sum(probs)
+    pred_idx = int(np.argmax(probs))
+    if pred_idx == VIRAL_IDX and float(probs[VIRAL_IDX]) < VIRAL_MIN_CONFIDENCE:
+        pred_idx = NORMAL_IDX if probs[NORMAL_IDX] > probs[BACTERIAL_IDX] else BACTERIAL_IDX
+    return pred_idx, probs
+
+
+def smart_threshold_batch(probs):
+    """smart_threshold over an (N, 3) array. Returns (pred_idx (N,), adjusted probs (N, 3))."""
+    probs = np.array(probs, dtype=np.float32, ndmin=2)
+    # float64 like smart_threshold's Python-float arithmetic, stored back as float32
+    probs[:, VIRAL_IDX] = probs[:, VIRAL_IDX].astype(np.float64) * VIRAL_SCALE
+    normal = probs[:, NORMAL_IDX].astype(np.float64)
+    boost = normal > NORMAL_BOOST_MIN
+    probs[boost, NORMAL_IDX] = normal[boost] * NORMAL_BOOST
+    probs /= probs.sum(axis=1, keepdims=True)
+
+    pred_idx = np.argmax(probs, axis=1)
+    weak_viral = (pred_idx == VIRAL_IDX) & (probs[:, VIRAL_IDX].astype(np.float64) < VIRAL_MIN_CONFIDENCE)
+    fallback = np.where(probs[:, NORMAL_IDX] > probs[:, BACTERIAL_IDX], NORMAL_IDX, BACTERIAL_IDX)
+    pred_idx = np.where(weak_viral, fallback, pred_idx)
+    return pred_idx, probs
+
+
+def uncertainty_batch(probs):
+    """severity.uncertainty over an (N, 3) array: (normalized entropy (N,), margin (N,))."""
+    probs = np.asarray(probs, dtype=np.float32)
+    s = np.sort(probs, axis=1)
+    margin = (s[:, -1] - s[:, -2]).astype(np.float64)
+
+    p = np.clip(probs, ENTROPY_EPS, 1.0)
+    ent = (-np.sum(p * np.log(p), axis=1)).astype(np.float64)
+    return ent / np.log(probs.shape[1]), margin
+
+
+def severity_batch(probs, pred_idx, force_normal_zero=True):
+    """compute_severity_1_to_10 over an (N, 3) array and (N,) predicted indices."""
+    probs = np.asarray(probs, dtype=np.float32)
+    pred_idx = np.asarray(pred_idx)
+
+    p_pneu = (probs[:, BACTERIAL_IDX] + probs[:, VIRAL_IDX]).astype(np.float64)
+    ent_norm, margin = uncertainty_batch(probs)
+
+    raw = (0.75 * p_pneu) + (0.35 * margin) - (0.25 * ent_norm)
+    raw = np.clip(raw, 0.0, 1.0)
+
+    sev = np.ceil(10 * np.sqrt(raw)).astype(np.int64)
+    sev = np.where(pred_idx != NORMAL_IDX, np.maximum(sev, 1), sev)
+    sev = np.clip(sev, 0, 10)
+    if force_normal_zero:
+        sev = np.where(pred_idx == NORMAL_IDX, 0, sev)
+    return sev
+
+
+def combined_severity_batch(pred_idx, curb65_scores):
+    """compute_combined_severity over (N,) predicted indices and (N,) CURB-65 scores."""
+    pred_idx = np.asarray(pred_idx)
+    curb65_scores = np.asarray(curb65_scores)
+
+    base = np.where(curb65_scores <= 1, 2, np.where(curb65_scores == 2, 5, 8))
+    base = np.where(pred_idx == BACTERIAL_IDX, np.minimum(base + 1, 10), base)
+    return np.where(pred_idx == NORMAL_IDX, 0, np.minimum(base, 10))
+
+
+def postprocess_batch(probs, curb65_scores=None, smart=True, pneumonia_min_confidence=None):
+    """
+    Batched post-processing of model outputs.
+
+    probs: (N, 3) softmax outputs
+    curb65_scores: optional (N,) CURB-65 scores (0-5) for combined severity
+    smart: apply smart_threshold (as the Streamlit app does); otherwise argmax
+    pneumonia_min_confidence: pneumonia predictions whose (adjusted)
+        probability is below this fall back to NORMAL
+
+    Returns a dict of arrays:
+        pred_idx, probabilities (adjusted if smart), confidence,
+        thresholded (fell back to NORMAL), base_severity and
+        combined_severity (None without curb65_scores)
+    """
+    probs = np.array(probs, dtype=np.float32, ndmin=2)
+    if smart:
+        pred_idx, probs = smart_threshold_batch(probs)
+    else:
+        pred_idx = np.argmax(probs, axis=1)
+
+    thresholded = np.zeros(len(pred_idx), dtype=bool)
+    if pneumonia_min_confidence is not None:
+        confidence = probs[np.arange(len(pred_idx)), pred_idx]
+        # Compared as Python floats, like the app's float(adjusted[pred]) < threshold
+        thresholded = (pred_idx != NORMAL_IDX) & (confidence.astype(np.float64) < pneumonia_min_confidence)
+        pred_idx = np.where(thresholded, NORMAL_IDX, pred_idx)
+
+    base_severity = severity_batch(probs, pred_idx)
+
+    combined = None
+    if curb65_scores is not None:
+        combined = combined_severity_batch(pred_idx, curb65_scores)
+
+    return {
+        "pred_idx": pred_idx,
+        "probabilities": probs,
+        "confidence": probs[np.arange(len(pred_idx)), pred_idx],
+        "thresholded": thresholded,
+        "base_severity": base_severity,
+        "combined_severity": combined,
+    }
+
+
+if __name__ == "__main__":
+    import time
+
+    probs = np.random.RandomState(1).dirichlet([1, 1, 1], size=100_000).astype(np.float32)
+    start = time.perf_counter()
+    for p in probs:
+        pred, adjusted = smart_threshold(p)
+        compute_severity_1_to_10(adjusted, pred)
+    scalar_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    postprocess_batch(probs)
+    batch_s = time.perf_counter() - start
+    print(f"100k samples: per-sample {scalar_s:.2f}s, batched {batch_s * 1000:.1f}ms ({scalar_s / batch_s:.0f}x)")
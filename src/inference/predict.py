@@ -0,0 +1,146 @@
+"""
+Shared inference helpers: turn uploaded image bytes into model input
+and raw model probabilities into the /predict response schema
+"""
+import time
+
+import cv2
+import numpy as np
+
+from src.data.constants import CLASS_NAMES, IMG_SIZE
+from src.data.decode import decode_grayscale, MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS
+from src.data.dicom import is_dicom, is_dicom_path, decode_dicom_gray, read_dicom_gray
+from src.data.xray_preprocess import preprocess_gray, apply_clahe_gray, write_model_input
+from src.inference.severity import compute_severity_1_to_10
+from src.inference.postprocess import postprocess_batch
+
+
+def decode_and_enhance(contents, reduced=True, max_bytes=MAX_IMAGE_BYTES, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Decode image bytes (JPEG/PNG or DICOM) straight to grayscale (at reduced
+    resolution for large images), apply CLAHE and resize to the model
+    resolution, all on a single channel.
+
+    Returns a (224, 224) uint8 grayscale array, or None if the bytes could
+    not be decoded as an image. Raises ImageTooLarge past the byte/pixel budget.
+    """
+    return decode_and_enhance_timed(contents, reduced, max_bytes, max_pixels)[0]
+
+
+def decode_and_enhance_timed(contents, reduced=True, max_bytes=MAX_IMAGE_BYTES, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    decode_and_enhance that also returns per-stage seconds
+    {"decode", "clahe", "resize"}. Timings travel with the result, so they
+    survive the process-pool executor.
+    """
+    start = time.perf_counter()
+    decode = decode_dicom_gray if is_dicom(contents) else decode_grayscale
+    gray = decode(contents, IMG_SIZE, reduced=reduced, max_bytes=max_bytes, max_pixels=max_pixels)
+    decoded = time.perf_counter()
+
+    if gray is None:
+        return None, {"decode": decoded - start}
+
+    # CLAHE enhancement (improves X-ray contrast) + resize, on one channel;
+    # same steps as preprocess_gray, timed separately
+    enhanced = apply_clahe_gray(gray)
+    clahe_done = time.perf_counter()
+    image = cv2.resize(enhanced, IMG_SIZE, interpolation=cv2.INTER_LANCZOS4)
+    timings = {
+        "decode": decoded - start,
+        "clahe": clahe_done - decoded,
+        "resize": time.perf_counter() - clahe_done,
+    }
+    return image, timings
+
+
+def load_and_enhance_file(path, reduced=True, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    decode_and_enhance for a file on disk. DICOM pixel data is memory-mapped
+    and headers are cached, so only the sampled pixels are read.
+    """
+    if is_dicom_path(path):
+        gray = read_dicom_gray(path, IMG_SIZE, reduced=reduced, max_pixels=max_pixels)
+        return preprocess_gray(gray, IMG_SIZE)
+
+    with open(path, "rb") as f:
+        return decode_and_enhance(f.read(), reduced=reduced, max_pixels=max_pixels)
+
+
+def to_model_input(images, out=None):
+    """
+    Grayscale uint8 image (H, W) or batch (N, H, W) -> float32 MobileNetV2
+    input (..., H, W, 3), written into `out` if given.
+    """
+    images = np.asarray(images)
+    if out is None:
+        out = np.empty(images.shape + (3,), dtype=np.float32)
+    if images.ndim == 2:
+        return write_model_input(images, out)
+    for i in range(images.shape[0]):
+        write_model_input(images[i], out[i])
+    return out
+
+
+class BatchBuffer:
+    """
+    Preallocated (max_batch, 224, 224, 3) float32 model-input buffer.
+
+    fill() writes grayscale images straight into the buffer and returns a
+    view, so no per-image float32 arrays or stacking copies are made. Only
+    one batch may use the buffer at a time (the micro-batcher runs batches
+    sequentially).
+    """
+
+    def __init__(self, max_batch, image_size=IMG_SIZE):
+        self._buffer = np.empty((max_batch, image_size[1], image_size[0], 3), dtype=np.float32)
+
+    def fill(self, images):
+        n = len(images)
+        if n > self._buffer.shape[0]:
+            raise ValueError(f"Batch of {n} exceeds buffer size {self._buffer.shape[0]}")
+        for i, image in enumerate(images):
+            write_model_input(image, self._buffer[i])
+        return self._buffer[:n]
+
+
+def build_prediction(probs):
+    """
+    Build the /predict response body from a single softmax vector.
+    Returns: classification, confidence, probabilities, base severity and class index.
+    """
+    pred_idx = int(np.argmax(probs))
+    pred_label = CLASS_NAMES[pred_idx]
+    confidence = float(probs[pred_idx])
+
+    base_severity = compute_severity_1_to_10(probs, pred_idx)
+
+    probabilities = {
+        CLASS_NAMES[i]: float(probs[i]) for i in range(len(CLASS_NAMES))
+    }
+
+    return {
+        "classification": pred_label,
+        "confidence": confidence,
+        "probabilities": probabilities,
+        "base_severity": base_severity,
+        "class_index": pred_idx
+    }
+
+
+def build_predictions(probs):
+    """
+    build_prediction for an (N, 3) batch of softmax outputs, with argmax and
+    severity computed in one vectorized pass. Returns a list of N dicts.
+    """
+    out = postprocess_batch(probs, smart=False)
+    predictions = []
+    for row, pred_idx, severity in zip(probs, out["pred_idx"].tolist(), out["base_severity"].tolist()):
+        predictions.append({
+            "classification": CLASS_NAMES[pred_idx],
+            "confidence": float(row[pred_idx]),
+            "probabilities": {CLASS_NAMES[i]: float(row[i]) for i in range(len(CLASS_NAMES))},
+            "base_severity": severity,
+            "class_index": pred_idx,
+        })
+    return predictions
@@ -0,0 +1,267 @@
+"""
+Model registry with zero-downtime swaps, rollback and canary/shadow routing.
+
+A model version is a model file plus the metadata.json next to it (as
+written to models/final by training). Its ID is the metadata "version"
+(or "training_date") plus the first 8 hex digits of the file's SHA-256,
+e.g. "2026-02-01+1611e6f6", so replacing the file always yields a new ID.
+
+Loading (TensorFlow import, model load, warmup) happens off to the side
+while the active version keeps serving. The swap itself is one reference
+assignment. Each request resolves its version once through route() and
+holds it with use() (or acquire()/release()), so requests already in flight finish on the model
+they started with. A version that is no longer active, previous or canary
+is unloaded once its in-flight count reaches zero.
+
+The registry does not know how a model is served. `load_fn(version)` and
+`unload_fn(version)` are supplied by the caller (the API fills in
+version.model and version.batcher).
+"""
+import os
+import json
+import time
+import random
+import asyncio
+from contextlib import contextmanager
+
+from src.inference.cache import model_fingerprint
+
+METADATA_FILE = "metadata.json"
+ROUTING_MODES = ("canary", "shadow")
+RETIRE_POLL_S = 0.05
+
+
+class ModelVersion:
+    """One model file and its metadata; model/batcher are set while loaded."""
+
+    def __init__(self, model_path, metadata, fingerprint):
+        self.model_path = model_path
+        self.model_dir = os.path.dirname(model_path)
+        self.metadata = metadata
+        self.fingerprint = fingerprint
+        base = str(metadata.get("version") or metadata.get("training_date") or "unversioned")
+        self.id = f"{base}+{fingerprint[:8]}"
+
+        self.model = None
+        self.batcher = None
+        self.explain_model = None
+        # Grad-CAM engines for explain_model, by (container, layer)
+        self.explain_engines = {}
+        self.in_flight = 0
+        self.served = 0
+        self.loaded_at = None
+        self.load_seconds = None
+        self.timings = {}
+
+    @property
+    def loaded(self):
+        return self.model is not None
+
+    def acquire(self):
+        """Count a request against this version; it stays loaded until release()."""
+        self.in_flight += 1
+        return self
+
+    def release(self):
+        self.in_flight -= 1
+        self.served += 1
+
+    @contextmanager
+    def use(self):
+        self.acquire()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def info(self):
+        return {
+            "version": self.id,
+            "model_path": self.model_path,
+            "fingerprint": self.fingerprint,
+            "loaded": self.loaded,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "load_timings": self.timings,
+            "in_flight": self.in_flight,
+            "served": self.served,
+            "metadata": self.metadata,
+        }
+
+
+def read_version(model_path):
+    """ModelVersion for a model file (not loaded); metadata.json is optional."""
+    if not os.path.isfile(model_path):
+        raise FileNotFoundError(f"Model file not found: {model_path}")
+    metadata_path = os.path.join(os.path.dirname(model_path), METADATA_FILE)
+    metadata = {}
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+    return ModelVersion(model_path, metadata, model_fingerprint(model_path))
+
+
+class ModelRegistry:
+    """
+    Active model plus `keep_previous` warm previous versions (for instant
+    rollback) and an optional canary.
+
+    canary mode: `percent` of requests are served by the canary
+    shadow mode: `percent` of requests are also run on the canary in the
+        background; responses always come from the active version
+    """
+
+    def __init__(self, load_fn, unload_fn, keep_previous=1, retire_timeout=300.0):
+        self.load_fn = load_fn
+        self.unload_fn = unload_fn
+        self.keep_previous = keep_previous
+        self.retire_timeout = retire_timeout
+
+        self.active = None
+        self.previous = []
+        self.canary = None
+        self.canary_percent = 0.0
+        self.canary_mode = "canary"
+        self.loading = None
+        self.history = []
+        self._lock = asyncio.Lock()
+        self._retiring = set()
+
+    def route(self):
+        """(version that serves this request, version to shadow it on or None)."""
+        active, canary = self.active, self.canary
+        if canary is None or random.random() * 100.0 >= self.canary_percent:
+            return active, None
+        if self.canary_mode == "shadow":
+            return active, canary
+        return canary, None
+
+    def _find_loaded(self, fingerprint):
+        for version in [self.active, self.canary] + self.previous:
+            if version is not None and version.fingerprint == fingerprint and version.loaded:
+                return version
+        return None
+
+    async def _load(self, model_path):
+        """Loaded ModelVersion for a file, reusing an already loaded copy of the same bytes."""
+        version = await asyncio.to_thread(read_version, model_path)
+        existing = self._find_loaded(version.fingerprint)
+        if existing is not None:
+            return existing
+
+        self.loading = version.id
+        start = time.perf_counter()
+        try:
+            await self.load_fn(version)
+        finally:
+            self.loading = None
+        version.load_seconds = round(time.perf_counter() - start, 3)
+        version.loaded_at = time.time()
+        return version
+
+    def _record(self, event, version):
+        self.history.append({"event": event, "version": version.id, "at": time.time()})
+        print(f"✅ Model {event}: {version.id} ({version.model_path})")
+
+    def _in_use(self, version):
+        return version is self.active or version is self.canary or version in self.previous
+
+    def _retire_unused(self, *versions):
+        for version in versions:
+            if version is not None and not self._in_use(version) and version not in self._retiring:
+                self._retiring.add(version)
+                asyncio.get_running_loop().create_task(self._retire(version))
+
+    async def _retire(self, version):
+        """Unload a version after its in-flight requests finish (or retire_timeout)."""
+        deadline = time.monotonic() + self.retire_timeout
+        while version.in_flight > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(RETIRE_POLL_S)
+        try:
+            if not self._in_use(version):
+                await self.unload_fn(version)
+                print(f"✓ Unloaded model {version.id}")
+        finally:
+            self._retiring.discard(version)
+
+    def _push_previous(self, version):
+        if version is None:
+            return
+        self.previous = [version] + [v for v in self.previous if v is not version]
+        dropped = self.previous[self.keep_previous:]
+        self.previous = self.previous[:self.keep_previous]
+        self._retire_unused(*dropped)
+
+    async def activate(self, model_path):
+        """Load and warm `model_path` next to the active model, then swap it in."""
+        version = await self._load(model_path)
+        async with self._lock:
+            if version is self.active:
+                return version
+            old = self.active
+            self.previous = [v for v in self.previous if v is not version]
+            if version is self.canary:
+                self.canary = None
+            self.active = version
+            self._push_previous(old)
+            self._record("activated", version)
+        return version
+
+    async def rollback(self):
+        """Swap back to the most recent previous version (kept loaded, so this is instant)."""
+        async with self._lock:
+            if not self.previous:
+                past = [e["version"] for e in self.history if e["event"] in ("activated", "rolled back")]
+                raise LookupError(f"No previous model version to roll back to (history: {past})")
+            target, old = self.previous[0], self.active
+            self.previous = self.previous[1:]
+            self.active = target
+            self._push_previous(old)
+            self._record("rolled back", target)
+        return target
+
+    async def set_canary(self, model_path, percent, mode="canary"):
+        """Route `percent` of requests to (canary) or mirror them onto (shadow) another version."""
+        if mode not in ROUTING_MODES:
+            raise ValueError(f"mode must be one of {ROUTING_MODES}")
+        if not 0.0 <= percent <= 100.0:
+            raise ValueError("percent must be in [0, 100]")
+        version = await self._load(model_path)
+        async with self._lock:
+            if version is self.active:
+                raise ValueError(f"{version.id} is already the active version")
+            old = self.canary
+            self.canary, self.canary_percent, self.canary_mode = version, float(percent), mode
+            self._retire_unused(old)
+            self._record(f"{mode} at {percent:g}%", version)
+        return version
+
+    async def clear_canary(self):
+        async with self._lock:
+            old, self.canary, self.canary_percent = self.canary, None, 0.0
+            self._retire_unused(old)
+        return old
+
+    async def promote_canary(self):
+        if self.canary is None:
+            raise LookupError("No canary to promote")
+        return await self.activate(self.canary.model_path)
+
+    async def unload_all(self):
+        async with self._lock:
+            versions = [v for v in [self.active, self.canary] + self.previous if v is not None]
+            self.active, self.canary, self.previous = None, None, []
+        for version in versions:
+            await self.unload_fn(version)
+
+    def status(self):
+        return {
+            "active": self.active.info() if self.active else None,
+            "canary": (
+                {**self.canary.info(), "percent": self.canary_percent, "mode": self.canary_mode}
+                if self.canary else None
+            ),
+            "previous": [v.info() for v in self.previous],
+            "loading": self.loading,
+            "history": self.history[-20:],
+        }
@@ -0,0 +1,221 @@
+"""
+Bulk offline scanning of radiograph archives.
+
+Walks a directory tree, decodes and CLAHE-preprocesses images in parallel
+worker processes, runs them through the model in large batches and writes
+classification, probabilities and severity to Parquet part files. Each part
+is a checkpoint: a killed job re-run with the same output directory skips
+every file already scored.
+
+Usage:
+    python -m src.inference.scan /archive/xrays --output outputs/scan
+    python -m src.inference.scan /archive/xrays --output outputs/scan --workers 16 --batch-size 128
+
+Read the results with pandas.read_parquet("outputs/scan").
+"""
+import os
+import sys
+import time
+import glob
+import argparse
+import multiprocessing
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.data.constants import CLASS_NAMES
+from src.data.dicom import DICOM_EXTENSIONS
+from src.inference.predict import load_and_enhance_file, build_predictions, BatchBuffer
+
+MODEL_PATH = "models/final/best_model.keras"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png") + DICOM_EXTENSIONS
+BATCH_SIZE = 64
+CHECKPOINT_EVERY = 2048  # images per Parquet part file
+
+SCHEMA = pa.schema(
+    [
+        ("path", pa.string()),
+        ("classification", pa.string()),
+        ("class_index", pa.int8()),
+        ("confidence", pa.float32()),
+    ]
+    + [(f"prob_{cls.lower()}", pa.float32()) for cls in CLASS_NAMES]
+    + [
+        ("base_severity", pa.int8()),
+        ("error", pa.string()),
+    ]
+)
+
+
+def find_images(root_dir):
+    """All image files under root_dir, sorted for a stable scan order."""
+    paths = []
+    for dirpath, _, filenames in os.walk(root_dir):
+        for name in filenames:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(dirpath, name))
+    paths.sort()
+    return paths
+
+
+def completed_paths(output_dir):
+    """Paths already scored by a previous (possibly killed) run."""
+    done = set()
+    for part in sorted(glob.glob(os.path.join(output_dir, "part-*.parquet"))):
+        done.update(pq.read_table(part, columns=["path"]).column("path").to_pylist())
+    return done
+
+
+def _next_part_index(output_dir):
+    parts = glob.glob(os.path.join(output_dir, "part-*.parquet"))
+    return 1 + max((int(os.path.basename(p)[5:10]) for p in parts), default=-1)
+
+
+def write_part(rows, output_dir, part_index):
+    """Write one checkpoint atomically so a crash never leaves a partial part."""
+    columns = {field.name: [row.get(field.name) for row in rows] for field in SCHEMA}
+    table = pa.table(columns, schema=SCHEMA)
+    path = os.path.join(output_dir, f"part-{part_index:05d}.parquet")
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_and_enhance(path):
+    """Worker: read, decode, CLAHE and resize one file. Returns (path, uint8 grayscale image or None, error)."""
+    try:
+        image = load_and_enhance_file(path)
+        if image is None:
+            return path, None, "Could not decode image"
+        return path, image, None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def _result_row(path, prediction):
+    row = {
+        "path": path,
+        "classification": prediction["classification"],
+        "class_index": prediction["class_index"],
+        "confidence": prediction["confidence"],
+        "base_severity": prediction["base_severity"],
+        "error": None,
+    }
+    for cls in CLASS_NAMES:
+        row[f"prob_{cls.lower()}"] = prediction["probabilities"][cls]
+    return row
+
+
+class Progress:
+    """Throughput (images/s) and ETA for the current run."""
+
+    def __init__(self, total, already_done, interval=5.0):
+        self.total = total
+        self.already_done = already_done
+        self.processed = 0
+        self.start = time.perf_counter()
+        self.interval = interval
+        self._last_print = 0.0
+
+    def update(self, n, force=False):
+        self.processed += n
+        now = time.perf_counter()
+        if not force and now - self._last_print < self.interval:
+            return
+        self._last_print = now
+
+        elapsed = now - self.start
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        done = self.already_done + self.processed
+        remaining = self.total - done
+        eta = remaining / rate if rate > 0 else float("inf")
+        eta_str = time.strftime("%H:%M:%S", time.gmtime(eta)) if np.isfinite(eta) else "--:--:--"
+        print(
+            f"[{done}/{self.total}] {100.0 * done / max(self.total, 1):5.1f}%  "
+            f"{rate:7.1f} img/s  ETA {eta_str}",
+            flush=True,
+        )
+
+
+def scan(root_dir, output_dir, model_path=MODEL_PATH, backend="keras",
+         batch_size=BATCH_SIZE, workers=None, checkpoint_every=CHECKPOINT_EVERY):
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths = find_images(root_dir)
+    done = completed_paths(output_dir)
+    todo = [p for p in paths if p not in done]
+    print(f"Found {len(paths)} images, {len(done)} already scored, {len(todo)} to go")
+    if not todo:
+        return
+
+    print("Loading model:", model_path)
+    # TensorFlow is imported here, not at module level: spawned decode workers import this module
+    from src.inference.backends import load_inference_model, warmup
+
+    model = load_inference_model(backend, model_path, buckets=(batch_size,))
+    warmup(model, buckets=(batch_size,), repeats=1)
+
+    part_index = _next_part_index(output_dir)
+    progress = Progress(len(paths), len(done))
+    rows = []
+    batch_paths, batch_images = [], []
+    batch_buffer = BatchBuffer(batch_size)
+
+    def flush_batch():
+        if batch_images:
+            x = batch_buffer.fill(batch_images)
+            probs = model.predict(x, verbose=0)
+            rows.extend(map(_result_row, batch_paths, build_predictions(probs)))
+            progress.update(len(batch_images))
+            batch_paths.clear()
+            batch_images.clear()
+
+    # spawn: workers must not inherit the parent's TensorFlow state
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(processes=workers or os.cpu_count()) as pool:
+        for path, image, error in pool.imap(load_and_enhance, todo, chunksize=8):
+            if image is None:
+                rows.append({"path": path, "error": error})
+                progress.update(1)
+            else:
+                batch_paths.append(path)
+                batch_images.append(image)
+                if len(batch_images) >= batch_size:
+                    flush_batch()
+
+            if len(rows) >= checkpoint_every:
+                write_part(rows, output_dir, part_index)
+                part_index += 1
+                rows = []
+
+    flush_batch()
+    if rows:
+        write_part(rows, output_dir, part_index)
+    progress.update(0, force=True)
+    print(f"✓ Results in {output_dir} (pandas.read_parquet('{output_dir}'))")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-score a directory tree of chest X-rays")
+    parser.add_argument("root", help="Directory to scan recursively")
+    parser.add_argument("--output", default="outputs/scan", help="Directory for Parquet result parts")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--backend", choices=("keras", "tflite"), default="keras")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None, help="Decode/CLAHE worker processes")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY,
+                        help="Images per checkpointed Parquet part")
+    args = parser.parse_args(argv)
+
+    scan(
+        args.root, args.output,
+        model_path=args.model, backend=args.backend,
+        batch_size=args.batch_size, workers=args.workers,
+        checkpoint_every=args.checkpoint_every,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,17 @@ def _entropy(probs, eps=1e-9):
     p = np.clip(np.asarray(probs, dtype=np.float32), eps, 1.0)
     return float(-np.sum(p * np.log(p)))
 
+def uncertainty(probs):
+    """
+    (normalized entropy in [0, 1], top-1 minus top-2 margin) of a softmax vector.
+    High entropy / low margin = the model is unsure.
+    """
+    probs = np.asarray(probs, dtype=np.float32)
+    s = np.sort(probs)
+    margin = float(s[-1] - s[-2])
+    ent_norm = _entropy(probs) / np.log(len(probs))  # normalize to ~[0,1]
+    return ent_norm, margin
+
 def compute_severity_1_to_10(probs, pred_idx, force_normal_zero=True):
     """
     Heuristic severity score for demo:
@@ -22,13 +33,9 @@ def compute_severity_1_to_10(probs, pred_idx, force_normal_zero=True):
     # Pneumonia probability (how likely pneumonia overall)
     p_pneu = float(probs[1] + probs[2])  # bacterial + viral
 
-    # Margin: how confident the model is in its top class
-    s = np.sort(probs)
-    margin = float(s[-1] - s[-2])  # top1 - top2
-
+    # Margin: how confident the model is in its top class (top1 - top2)
     # Entropy: uncertainty measure (high entropy = uncertain)
-    ent = _entropy(probs)
-    ent_norm = ent / np.log(len(probs))  # normalize to ~[0,1]
+    ent_norm, margin = uncertainty(probs)
 
     # We want "higher severity" when pneumonia prob is high AND model is decisively pneumonia.
     # Penalize uncertainty slightly so borderline cases don't become severity 10.
@@ -80,3 +87,38 @@ def compute_combined_severity(
         base_sev = min(base_sev + 1, 10)
     
     return min(base_sev, 10)
+
+def compute_curb65(
+    age=None,
+    respiratory_rate=None,
+    systolic_bp=None,
+    diastolic_bp=None,
+    confusion=False,
+    urea=None
+) -> int:
+    """
+    CURB-65 score (0-5), same rules as the dashboard's calculateCURB65.
+    Missing values score 0.
+    """
+    score = 0
+    if age is not None and age >= 65:
+        score += 1
+    if respiratory_rate is not None and respiratory_rate >= 30:
+        score += 1
+    # Low BP: SBP < 90 OR DBP <= 60
+    if (systolic_bp is not None and systolic_bp < 90) or (diastolic_bp is not None and diastolic_bp <= 60):
+        score += 1
+    if confusion:
+        score += 1
+    # Urea > 7 mmol/L
+    if urea is not None and urea > 7:
+        score += 1
+    return score
+
+def risk_level(final_severity: int) -> str:
+    """Risk band of a combined severity: 0-3 low, 4-6 moderate, 7-10 high"""
+    if final_severity <= 3:
+        return "low"
+    if final_severity <= 6:
+        return "moderate"
+    return "high"
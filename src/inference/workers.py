@@ -0,0 +1,291 @@
+"""
+Multi-replica inference: a pool of worker processes, one model replica each.
+
+Running more uvicorn workers loads one model per worker and lets every
+TensorFlow runtime size its thread pools for the whole machine, so N
+processes oversubscribe the cores N times. Here the API process keeps the
+HTTP front-end (and preprocessing), and inference is sent to `replicas`
+spawned workers:
+
+- each worker is pinned to its own slice of the available CPUs
+  (os.sched_setaffinity, where supported)
+- intra-op threads default to the cores in that slice, inter-op to 1, set
+  before TensorFlow initialises
+- grayscale uint8 batches (50 KB per image) are sent over a pipe, and the
+  worker broadcasts them into its own float32 input buffer
+- jobs wait in one bounded queue; an idle worker takes the next job, so
+  routing is least-loaded. When the queue is full, submit() fails fast
+  with WorkerPoolFull instead of building unbounded latency
+- a worker that dies is respawned; its in-flight job fails
+
+Throughput vs replica count: `python -m src.inference.bench_workers`.
+"""
+import os
+import queue
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import Future
+
+import numpy as np
+
+BATCH_BUCKETS = (1, 4, 8, 16)  # as src.inference.backends, without importing TensorFlow here
+READY_TIMEOUT_S = 600
+
+
+class WorkerPoolFull(RuntimeError):
+    """Every replica is busy and the job queue is full."""
+
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def plan_cpus(replicas, pin=True):
+    """
+    Split the available CPUs into `replicas` disjoint slices (one per worker).
+    Returns a list of CPU lists, or [None] * replicas when not pinning or
+    when there are fewer CPUs than replicas.
+    """
+    cpus = available_cpus()
+    per_replica = len(cpus) // replicas
+    if not pin or per_replica == 0 or not hasattr(os, "sched_setaffinity"):
+        return [None] * replicas
+    return [cpus[i * per_replica:(i + 1) * per_replica] for i in range(replicas)]
+
+
+def _worker_main(conn, backend, model_path, buckets, max_batch, cpus, intra_op_threads, inter_op_threads):
+    """Worker process: pin, size thread pools, load + warm the model, then serve batches."""
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    # Must be set before TensorFlow (and its OpenMP/oneDNN runtime) starts
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(intra_op_threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = str(inter_op_threads)
+    os.environ["OMP_NUM_THREADS"] = str(intra_op_threads)
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+    from src.inference.backends import load_inference_model, warmup
+    from src.inference.predict import BatchBuffer, to_model_input
+
+    try:
+        model = load_inference_model(backend, model_path, buckets=buckets, num_threads=intra_op_threads)
+        latencies = warmup(model, buckets)
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    buffer = BatchBuffer(max_batch)
+    conn.send(("ready", latencies))
+
+    while True:
+        try:
+            x = conn.recv()
+        except EOFError:
+            return
+        if x is None:
+            return
+        try:
+            if x.dtype == np.uint8 and x.ndim == 3:
+                # Grayscale batch -> 3-channel float32 model input
+                x = buffer.fill(x) if len(x) <= max_batch else to_model_input(x)
+            conn.send(("ok", np.asarray(model.predict(x, verbose=0))))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, index, cpus):
+        self.index = index
+        self.cpus = cpus
+        self.process = None
+        self.conn = None
+        self.latencies = None
+        self.busy = False
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+
+
+class InferenceWorkerPool:
+    """
+    `replicas` inference processes behind one bounded job queue.
+
+    predict(x) (blocking) and submit(x) (async) take a grayscale uint8
+    batch (N, H, W) or a float32 model input (N, H, W, 3) and return
+    (N, num_classes) probabilities, so the pool can stand in for a model.
+
+    intra_op_threads: per replica; default = CPUs in its slice (or CPUs / replicas)
+    inter_op_threads: per replica
+    pin_cpus: pin each replica to a disjoint CPU slice
+    max_queue: jobs allowed to wait for a free replica (default 2 x replicas)
+    """
+
+    def __init__(self, backend, model_path, replicas, buckets=BATCH_BUCKETS, intra_op_threads=None,
+                 inter_op_threads=1, pin_cpus=True, max_queue=None, max_batch=16):
+        if replicas < 1:
+            raise ValueError("replicas must be >= 1")
+        self.backend = backend
+        self.model_path = model_path
+        self.replicas = replicas
+        self.buckets = tuple(buckets)
+        self.max_batch = max(max_batch, max(self.buckets))
+        self.inter_op_threads = inter_op_threads
+        self.max_queue = max_queue or 2 * replicas
+
+        cpu_slices = plan_cpus(replicas, pin_cpus)
+        self.intra_op_threads = intra_op_threads or len(cpu_slices[0] or ()) or max(
+            1, len(available_cpus()) // replicas
+        )
+        self._workers = [_Worker(i, cpus) for i, cpus in enumerate(cpu_slices)]
+        self._jobs = queue.Queue(maxsize=self.max_queue)
+        self._context = multiprocessing.get_context("spawn")
+        self._threads = []
+        self.rejected = 0
+
+    def _spawn(self, worker):
+        parent, child = self._context.Pipe()
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(child, self.backend, self.model_path, self.buckets, self.max_batch,
+                  worker.cpus, self.intra_op_threads, self.inter_op_threads),
+            name=f"inference-worker-{worker.index}",
+            daemon=True,
+        )
+        worker.process.start()
+        child.close()
+        worker.conn = parent
+
+    def _wait_ready(self, worker, timeout=READY_TIMEOUT_S):
+        if not worker.conn.poll(timeout):
+            raise RuntimeError(f"Inference worker {worker.index} not ready after {timeout}s")
+        try:
+            status, payload = worker.conn.recv()
+        except EOFError:
+            status, payload = "error", f"exited with code {worker.process.exitcode}"
+        if status != "ready":
+            raise RuntimeError(f"Inference worker {worker.index} failed to load the model: {payload}")
+        worker.latencies = payload
+
+    def start(self):
+        """Spawn every replica (loading in parallel), wait until all are warm. Returns warm latencies per worker."""
+        for worker in self._workers:
+            self._spawn(worker)
+        for worker in self._workers:
+            self._wait_ready(worker)
+        for worker in self._workers:
+            thread = threading.Thread(
+                target=self._dispatch, args=(worker,), name=f"dispatch-{worker.index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        return {worker.index: worker.latencies for worker in self._workers}
+
+    def _dispatch(self, worker):
+        """One thread per worker: take the next job, send it, wait for the result."""
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                try:
+                    worker.conn.send(None)
+                except OSError:
+                    pass
+                return
+            x, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            worker.busy = True
+            try:
+                worker.conn.send(x)
+                status, payload = worker.conn.recv()
+            except (EOFError, OSError) as e:
+                worker.failed += 1
+                future.set_exception(RuntimeError(f"Inference worker {worker.index} died: {e!r}"))
+                self._restart(worker)
+                continue
+            finally:
+                worker.busy = False
+
+            if status == "ok":
+                worker.completed += 1
+                future.set_result(payload)
+            else:
+                worker.failed += 1
+                future.set_exception(RuntimeError(payload))
+
+    def _restart(self, worker):
+        print(f"❌ Inference worker {worker.index} died, restarting")
+        worker.conn.close()
+        worker.process.join(timeout=1)
+        worker.restarts += 1
+        self._spawn(worker)
+        try:
+            self._wait_ready(worker)
+            print(f"✅ Inference worker {worker.index} restarted")
+        except RuntimeError as e:
+            print(f"❌ {e}")
+
+    def _enqueue(self, x):
+        x = np.ascontiguousarray(x)
+        future = Future()
+        try:
+            self._jobs.put_nowait((x, future))
+        except queue.Full:
+            self.rejected += 1
+            raise WorkerPoolFull(
+                f"All {self.replicas} inference replicas busy and {self.max_queue} batches queued"
+            )
+        return future
+
+    def predict(self, x, verbose=0):
+        return self._enqueue(x).result()
+
+    async def submit(self, x):
+        return await asyncio.wrap_future(self._enqueue(x))
+
+    def stats(self):
+        return {
+            "replicas": self.replicas,
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "queue_depth": self._jobs.qsize(),
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "busy": sum(worker.busy for worker in self._workers),
+            "workers": [
+                {
+                    "index": worker.index,
+                    "pid": worker.process.pid if worker.process is not None else None,
+                    "cpus": worker.cpus,
+                    "busy": worker.busy,
+                    "completed": worker.completed,
+                    "failed": worker.failed,
+                    "restarts": worker.restarts,
+                }
+                for worker in self._workers
+            ],
+        }
+
+    def shutdown(self):
+        # Fail anything still queued so callers don't hang
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None and not job[1].done():
+                job[1].set_exception(RuntimeError("Inference worker pool stopped"))
+        # Each dispatch thread finishes its current job, then stops its worker
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5)
+        for worker in self._workers:
+            if worker.process is None:
+                continue
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
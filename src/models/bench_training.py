@@ -0,0 +1,173 @@
+"""
+Benchmark: training throughput vs macro recall for the CPU training settings.
+
+Each configuration trains the same ResNet50 classifier from the same seed
+on the same cached subset of the training set, in its own process (thread
+pools and the precision policy are process-wide), then is evaluated on the
+test set:
+
+    baseline             the current train.py settings
+    steps                steps_per_execution only
+    xla                  XLA JIT only
+    xla+steps            XLA + steps_per_execution
+    xla+steps+bf16       XLA + steps_per_execution + bfloat16 mixed precision
+
+images/s excludes the first epoch (tracing / XLA compilation, reported
+separately). The report is written as Markdown and JSON.
+
+Usage:
+    python -m src.models.bench_training
+    python -m src.models.bench_training --finetune --epochs 4 --train-batches 40
+    python -m src.models.bench_training --configs baseline xla+steps+bf16 --threads 8
+"""
+import os
+import json
+import time
+import argparse
+import multiprocessing
+
+from src.models.cpu_training import STEPS_PER_EXECUTION
+
+CONFIGS = {
+    "baseline": {"jit": False, "steps_per_execution": 1, "bf16": "off"},
+    "steps": {"jit": False, "steps_per_execution": STEPS_PER_EXECUTION, "bf16": "off"},
+    "xla": {"jit": True, "steps_per_execution": 1, "bf16": "off"},
+    "xla+steps": {"jit": True, "steps_per_execution": STEPS_PER_EXECUTION, "bf16": "off"},
+    "xla+steps+bf16": {"jit": True, "steps_per_execution": STEPS_PER_EXECUTION, "bf16": "on"},
+}
+REPORT_PATH = "outputs/reports/training_throughput.md"
+
+
+def run_config(name, settings, args):
+    """Train and evaluate one configuration (runs in a fresh process)."""
+    import tensorflow as tf
+    from tensorflow.keras.optimizers import Adam
+
+    from src.data.loader import build_dataset, BATCH_SIZE, CLASS_NAMES
+    from src.models.build import build_resnet50_classifier, unfreeze_top_layers, DEFAULT_UNFREEZE_LAYERS
+    from src.models.cpu_training import configure_cpu_training, ThroughputMeter
+    from src.models.metrics import evaluate_multiclass
+
+    training = configure_cpu_training(
+        jit=settings["jit"],
+        bf16=settings["bf16"],
+        steps_per_execution=settings["steps_per_execution"],
+        intra_op_threads=args.threads,
+        inter_op_threads=args.inter_op_threads,
+    )
+    tf.keras.utils.set_random_seed(args.seed)
+
+    # Decoded once, so the input pipeline does not hide compute differences
+    train_ds = build_dataset(args.train_dir).take(args.train_batches).cache()
+    test_ds = build_dataset(args.test_dir).take(args.test_batches).cache()
+    # Fills the cache and counts the images, including a short final batch
+    train_samples = sum(int(y.shape[0]) for _, y in train_ds)
+
+    model = build_resnet50_classifier(num_classes=len(CLASS_NAMES), weights=args.weights)
+    learning_rate = 1e-3
+    if args.finetune:
+        # Same layers as the fine-tuning stage of train.py
+        unfreeze_top_layers(model, DEFAULT_UNFREEZE_LAYERS)
+        learning_rate = 1e-5 if args.weights == "imagenet" else 1e-4
+
+    model.compile(
+        optimizer=Adam(learning_rate=learning_rate),
+        loss="sparse_categorical_crossentropy",
+        metrics=["sparse_categorical_accuracy"],
+        **training["compile"],
+    )
+    meter = ThroughputMeter(BATCH_SIZE, samples=train_samples)
+    start = time.perf_counter()
+    model.fit(train_ds, epochs=args.epochs, callbacks=[meter], verbose=0)
+    train_seconds = time.perf_counter() - start
+
+    _, _, macro_recall = evaluate_multiclass(model, test_ds, CLASS_NAMES)
+    return {
+        "config": name,
+        "jit_compile": training["jit_compile"],
+        "steps_per_execution": training["steps_per_execution"],
+        "precision": training["mixed_precision"],
+        "images_per_second": meter.images_per_second,
+        "first_epoch_seconds": meter.epochs[0]["seconds"],
+        "train_seconds": train_seconds,
+        "macro_recall": float(macro_recall),
+    }
+
+
+def _run_isolated(name, settings, args):
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(run_config, (name, settings, args))
+
+
+def write_report(results, args, cpu_bf16):
+    base = next((r for r in results if r["config"] == "baseline"), results[0])
+    lines = [
+        "# CPU training throughput vs macro recall",
+        "",
+        f"ResNet50 ({'fine-tuning the top layers' if args.finetune else 'frozen backbone'}, "
+        f"weights={args.weights}), {args.epochs} epochs on {args.train_batches} batches of "
+        f"{args.train_dir}, macro recall on {args.test_batches} batches of {args.test_dir}. "
+        f"{os.cpu_count()} CPUs, native bf16: {'yes' if cpu_bf16 else 'no'}, seed {args.seed}.",
+        "",
+        "| config | XLA | steps/exec | precision | images/s | speedup | first epoch s | macro recall | Δ recall |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    for r in results:
+        lines.append(
+            f"| {r['config']} | {'on' if r['jit_compile'] else 'off'} | {r['steps_per_execution']} "
+            f"| {r['precision']} | {r['images_per_second']:.1f} "
+            f"| {r['images_per_second'] / base['images_per_second']:.2f}x | {r['first_epoch_seconds']:.1f} "
+            f"| {r['macro_recall']:.4f} | {r['macro_recall'] - base['macro_recall']:+.4f} |"
+        )
+    lines += [
+        "",
+        "images/s excludes the first epoch, which includes tracing and XLA compilation.",
+        "",
+    ]
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        f.write("\n".join(lines))
+    with open(os.path.splitext(args.out)[0] + ".json", "w") as f:
+        json.dump({"settings": vars(args), "cpu_bf16": cpu_bf16, "results": results}, f, indent=2)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--train-dir", default="data/raw/train")
+    parser.add_argument("--test-dir", default="data/raw/test")
+    parser.add_argument("--train-batches", type=int, default=20, help="training batches (of 32) per epoch")
+    parser.add_argument("--test-batches", type=int, default=20)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--finetune", action="store_true", help="train the top backbone layers too")
+    parser.add_argument("--weights", default="imagenet", help="'imagenet' or 'none' (random init)")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--threads", type=int, default=None, help="intra-op threads (default: all cores)")
+    parser.add_argument("--inter-op-threads", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=REPORT_PATH)
+    args = parser.parse_args()
+    if args.weights == "none":
+        args.weights = None
+    if args.epochs < 2:
+        parser.error("--epochs must be >= 2 (the first epoch is excluded from images/s)")
+
+    from src.models.cpu_training import cpu_supports_bf16
+    cpu_bf16 = cpu_supports_bf16()
+    if not cpu_bf16 and "xla+steps+bf16" in args.configs:
+        print("⚠️ No native bf16 on this CPU; the bf16 configuration is emulated")
+
+    results = []
+    for name in args.configs:
+        print(f"🔬 {name}...")
+        result = _run_isolated(name, CONFIGS[name], args)
+        print(f"✓ {name}: {result['images_per_second']:.1f} images/s, macro recall {result['macro_recall']:.4f}")
+        results.append(result)
+
+    print("\n" + write_report(results, args, cpu_bf16))
+    print(f"✅ Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
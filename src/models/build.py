@@ -2,10 +2,14 @@ import tensorflow as tf
 from tensorflow.keras import layers, models
 from tensorflow.keras.applications import ResNet50, MobileNetV2
 
-def build_resnet50_classifier(num_classes=3, input_shape=(224, 224, 3), dropout=0.3):
+# Backbone layers trained in the fine-tuning stage
+DEFAULT_UNFREEZE_LAYERS = 10
+
+
+def build_resnet50_classifier(num_classes=3, input_shape=(224, 224, 3), dropout=0.3, weights="imagenet"):
     base = ResNet50(
         include_top=False,
-        weights="imagenet",
+        weights=weights,
         input_shape=input_shape
     )
     base.trainable = False  # freeze backbone for baseline
@@ -14,16 +18,17 @@ def build_resnet50_classifier(num_classes=3, input_shape=(224, 224, 3), dropout=
     x = base(inputs, training=False)
     x = layers.GlobalAveragePooling2D()(x)
     x = layers.Dropout(dropout)(x)
-    outputs = layers.Dense(num_classes, activation="softmax")(x)
+    # float32 softmax, also under a mixed_bfloat16 policy
+    outputs = layers.Dense(num_classes, activation="softmax", dtype="float32")(x)
 
     model = models.Model(inputs, outputs, name="pneumonia_resnet50")
     return model
 
 
-def build_mobilenetv2_classifier(num_classes=3, input_shape=(224, 224, 3), dropout=0.2):
+def build_mobilenetv2_classifier(num_classes=3, input_shape=(224, 224, 3), dropout=0.2, weights="imagenet"):
     base = MobileNetV2(
         include_top=False,
-        weights="imagenet",
+        weights=weights,
         input_shape=input_shape
     )
     base.trainable = False
@@ -35,4 +40,46 @@ def build_mobilenetv2_classifier(num_classes=3, input_shape=(224, 224, 3), dropo
     outputs = layers.Dense(num_classes, activation="softmax", dtype="float32")(x)
 
     model = models.Model(inputs, outputs, name="pneumonia_mobilenetv2")
-    return model
\ No newline at end of file
+    return model
+
+
+# Screening model of the inference cascade (src/inference/cascade.py)
+SCREENING_ALPHA = 0.35
+SCREENING_RESOLUTION = 128
+SCREENING_BACKBONE = "mobilenetv2_screening"
+
+
+def build_mobilenetv2_screening_classifier(num_classes=3, input_shape=(224, 224, 3), alpha=SCREENING_ALPHA,
+                                           resolution=SCREENING_RESOLUTION, dropout=0.2, weights="imagenet"):
+    """
+    Reduced-width, reduced-resolution MobileNetV2 for first-pass screening.
+
+    Takes the same input as build_mobilenetv2_classifier and downsizes it
+    inside the model, so both models of the cascade share one preprocessed batch.
+    """
+    base = MobileNetV2(
+        include_top=False,
+        weights=weights,
+        input_shape=(resolution, resolution, 3),
+        alpha=alpha,
+        name=SCREENING_BACKBONE,
+    )
+    base.trainable = False
+
+    inputs = layers.Input(shape=input_shape)
+    x = layers.Resizing(resolution, resolution)(inputs)
+    x = base(x, training=False)
+    x = layers.GlobalAveragePooling2D()(x)
+    x = layers.Dropout(dropout)(x)
+    outputs = layers.Dense(num_classes, activation="softmax", dtype="float32")(x)
+
+    model = models.Model(inputs, outputs, name="pneumonia_mobilenetv2_screening")
+    return model
+
+
+def unfreeze_top_layers(model, num_layers, backbone="resnet50"):
+    """Make the last `num_layers` layers of the backbone trainable (0 keeps it frozen)."""
+    base = model.get_layer(backbone)
+    base.trainable = num_layers > 0
+    for i, layer in enumerate(base.layers):
+        layer.trainable = i >= len(base.layers) - num_layers
@@ -0,0 +1,159 @@
+"""
+Throughput settings for training on CPU-only machines.
+
+- XLA: compile(jit_compile=True) fuses the train step into a few large
+  kernels instead of hundreds of small op dispatches
+- steps_per_execution: run several train steps per call from Python, so
+  the per-step overhead (Python, callbacks, host-device sync) is amortised
+- bfloat16 mixed precision: compute in bf16, keep variables in float32.
+  It is only faster on CPUs with native bf16 (AVX512_BF16 / AMX); elsewhere
+  it is emulated and slower, so "auto" enables it only when supported
+- threads: intra-op (one op's parallelism) and inter-op (independent ops)
+  pool sizes, fixed before TensorFlow starts its runtime
+
+configure_cpu_training() must run before any model or dataset is created,
+and models trained under it are saved with save_for_serving().
+Speed vs recall: `python -m src.models.bench_training`.
+"""
+import os
+import time
+
+import tensorflow as tf
+
+STEPS_PER_EXECUTION = int(os.getenv("STEPS_PER_EXECUTION", "32"))
+BF16_CPU_FLAGS = ("avx512_bf16", "amx_bf16")
+
+
+def cpu_flags():
+    """CPU feature flags from /proc/cpuinfo (empty set where unavailable)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return set(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+
+def cpu_supports_bf16():
+    return any(flag in cpu_flags() for flag in BF16_CPU_FLAGS)
+
+
+def configure_cpu_training(
+    fast=False,
+    jit=None,
+    bf16="auto",
+    steps_per_execution=None,
+    intra_op_threads=None,
+    inter_op_threads=None,
+):
+    """
+    Apply thread and precision settings; returns the resulting config with
+    the keyword arguments to pass to model.compile() under "compile".
+
+    fast: XLA + steps_per_execution (STEPS_PER_EXECUTION) + bf16 "auto"
+    jit, steps_per_execution: override what `fast` picks
+    bf16: "on", "off" or "auto" (on only if `fast` and the CPU has native bf16)
+    """
+    if bf16 not in ("on", "off", "auto"):
+        raise ValueError("bf16 must be 'on', 'off' or 'auto'")
+
+    if intra_op_threads:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    if inter_op_threads:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+    jit = fast if jit is None else jit
+    steps_per_execution = steps_per_execution or (STEPS_PER_EXECUTION if fast else 1)
+    use_bf16 = bf16 == "on" or (bf16 == "auto" and fast and cpu_supports_bf16())
+    if bf16 == "on" and not cpu_supports_bf16():
+        print("⚠️ bfloat16 requested but this CPU has no native bf16; it will be emulated (slower)")
+    tf.keras.mixed_precision.set_global_policy("mixed_bfloat16" if use_bf16 else "float32")
+
+    config = {
+        "jit_compile": bool(jit),
+        "steps_per_execution": int(steps_per_execution),
+        "mixed_precision": "mixed_bfloat16" if use_bf16 else "float32",
+        "intra_op_threads": tf.config.threading.get_intra_op_parallelism_threads() or "default",
+        "inter_op_threads": tf.config.threading.get_inter_op_parallelism_threads() or "default",
+        "cpu_bf16": cpu_supports_bf16(),
+    }
+    config["compile"] = {"jit_compile": config["jit_compile"], "steps_per_execution": config["steps_per_execution"]}
+    print(f"✅ Training config: XLA {'on' if jit else 'off'}, {config['steps_per_execution']} steps per execution, "
+          f"{config['mixed_precision']}, threads intra={config['intra_op_threads']} inter={config['inter_op_threads']}")
+    return config
+
+
+def _float32_config(config):
+    if isinstance(config, dict):
+        if str(config.get("class_name", "")).endswith("DTypePolicy"):
+            return {**config, "config": {**config["config"], "name": "float32"}}
+        return {key: _float32_config(value) for key, value in config.items()}
+    if isinstance(config, list):
+        return [_float32_config(value) for value in config]
+    return config
+
+
+def save_for_serving(model, path):
+    """
+    Save `model` with every layer in float32. Layer configs record the
+    policy they were built under, so a model trained with mixed_bfloat16
+    would otherwise also serve in bf16. Variables are float32 either way.
+    """
+    if tf.keras.mixed_precision.global_policy().name == "float32":
+        model.save(path)
+        return
+    serving = type(model).from_config(_float32_config(model.get_config()))
+    serving.set_weights(model.get_weights())
+    serving.save(path)
+
+
+class ThroughputMeter(tf.keras.callbacks.Callback):
+    """
+    Training images/s per epoch. The clock stops when validation starts, and
+    `samples` (training set size, if known) counts the final partial batch
+    exactly. The first epoch includes tracing/XLA compilation, so
+    `images_per_second` averages the later ones.
+    """
+
+    def __init__(self, batch_size, samples=None):
+        super().__init__()
+        self.batch_size = batch_size
+        self.samples = samples
+        self.epochs = []
+        self._start = None
+        self._seconds = None
+        self._steps = 0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._steps = 0
+        self._seconds = None
+        self._start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        # With steps_per_execution > 1 this is called once per execution, with the last step index
+        self._steps = batch + 1
+
+    def on_test_begin(self, logs=None):
+        # Validation at the end of the epoch is not training throughput
+        if self._start is not None and self._seconds is None:
+            self._seconds = time.perf_counter() - self._start
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = self._seconds if self._seconds is not None else time.perf_counter() - self._start
+        self._start = None
+        # The last execution can be cut short by the end of the dataset
+        total_steps = self.params.get("steps")
+        steps = min(self._steps, total_steps or self._steps)
+        images = steps * self.batch_size
+        if self.samples:
+            images = self.samples if total_steps is None or steps >= total_steps else min(images, self.samples)
+        self.epochs.append({"epoch": epoch, "seconds": seconds, "images": images})
+        print(f"⚡ Epoch {epoch + 1}: {images / seconds:.1f} images/s")
+
+    @property
+    def images_per_second(self):
+        steady = self.epochs[1:] or self.epochs
+        seconds = sum(e["seconds"] for e in steady)
+        return sum(e["images"] for e in steady) / seconds if seconds else 0.0
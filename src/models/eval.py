@@ -0,0 +1,63 @@
+"""
+Evaluate a trained classifier on the test split in one inference pass.
+
+Prints the confusion matrix and per-class report and saves the probability
+matrix with the labels (.npz), so threshold experiments run against the
+cached probabilities instead of repeating inference:
+
+    python -m src.models.eval
+    python -m src.models.eval --model models/final/best_model_int8.tflite --out outputs/eval/int8.npz
+    python -m src.models.threshold_tuning --predictions outputs/eval/test_predictions.npz
+"""
+import os
+import time
+import json
+import argparse
+
+import numpy as np
+
+MODEL_PATH = "models/final/best_model.keras"
+TEST_DIR = "data/raw/test"
+PREDICTIONS_PATH = "outputs/eval/test_predictions.npz"
+
+
+def load_model(path):
+    """Keras model or TFLite artifact (by extension)."""
+    if path.endswith(".tflite"):
+        from src.inference.backends import TFLiteModel
+        return TFLiteModel(path)
+    import tensorflow as tf
+    return tf.keras.models.load_model(path, compile=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--test-dir", default=TEST_DIR)
+    parser.add_argument("--out", default=PREDICTIONS_PATH, help="where to save the probability matrix")
+    args = parser.parse_args()
+
+    # Same preprocessing as the serving path and the TFLite export (MobileNetV2)
+    from src.data.loader_improved import build_dataset, CLASS_NAMES
+    from src.models.metrics import StreamingEvaluator, save_predictions
+
+    model = load_model(args.model)
+    print(f"🔬 Evaluating {args.model} on {args.test_dir}...")
+    start = time.perf_counter()
+    evaluator = StreamingEvaluator(CLASS_NAMES).run(model, build_dataset(args.test_dir))
+    seconds = time.perf_counter() - start
+    probs, labels = evaluator.probabilities, evaluator.labels
+    print(f"✓ {len(labels)} images in {seconds:.1f}s ({len(labels) / max(seconds, 1e-9):.1f} images/s)")
+
+    report = evaluator.report()
+    print("Confusion Matrix:\n", evaluator.confusion)
+    print(json.dumps({cls: report[cls] for cls in CLASS_NAMES}, indent=2))
+    print(f"Accuracy: {report['accuracy']:.4f}  Macro Recall: {report['macro avg']['recall']:.4f}")
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    save_predictions(args.out, probs, labels, CLASS_NAMES, model=args.model, test_dir=args.test_dir)
+    print(f"✅ Probabilities saved to {args.out} ({probs.shape[0]}x{probs.shape[1]}, {np.bincount(labels, minlength=len(CLASS_NAMES))} per class)")
+
+
+if __name__ == "__main__":
+    main()
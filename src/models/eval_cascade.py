@@ -0,0 +1,196 @@
+"""
+Measure the inference cascade (src/inference/cascade.py) on the test set.
+
+One pass runs the screening model, the full model and the cascade at the
+serving thresholds on every batch, timing each model call. Escalation rate,
+agreement with the full model's class and macro recall are then computed for
+every (max entropy, min margin) pair from the cached probabilities. Latency
+saved is measured end to end for the serving thresholds and estimated for
+the rest of the grid as screen time + escalation rate x full time.
+
+The JSON report is read by the API (CASCADE_REPORT_PATH) and exposed as
+xray_cascade_test_set{metric} for the thresholds it serves with.
+
+Usage:
+    python -m src.models.eval_cascade
+    python -m src.models.eval_cascade --min-agreement 0.98 --max-entropy 0.3 0.5 0.7
+"""
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+from src.inference.cascade import CASCADE_MAX_ENTROPY, CASCADE_MIN_MARGIN
+
+MODEL_PATH = "models/final/best_model.keras"
+SCREEN_MODEL_PATH = "models/final/screening_model.keras"
+TEST_DIR = "data/raw/test"
+REPORT_PATH = "outputs/reports/cascade.md"
+
+
+def _grid(values, selected):
+    return sorted(set(round(float(v), 4) for v in values) | {round(float(selected), 4)})
+
+
+def run_models(screen, full, cascade, dataset, class_names):
+    """One pass: a StreamingEvaluator and the total predict seconds for each model."""
+    from src.models.metrics import StreamingEvaluator
+
+    models = {"screen": screen, "full": full, "cascade": cascade}
+    evaluators = {name: StreamingEvaluator(class_names) for name in models}
+    seconds = dict.fromkeys(models, 0.0)
+    for x, y in dataset:
+        x, y = x.numpy(), y.numpy()
+        for name, model in models.items():
+            start = time.perf_counter()
+            probs = model.predict(x, verbose=0)
+            seconds[name] += time.perf_counter() - start
+            evaluators[name].update(probs, y)
+    return evaluators, seconds
+
+
+def sweep(screen_probs, full_probs, labels, max_entropy, min_margin):
+    """Escalation rate, agreement and macro recall for every threshold pair, as flat arrays."""
+    from src.inference.postprocess import uncertainty_batch
+    from src.models.threshold_tuning import confusion_grid, score_confusions
+
+    ent_norm, margin = uncertainty_batch(screen_probs)
+    entropy_grid, margin_grid = (g.ravel() for g in np.meshgrid(max_entropy, min_margin, indexing="ij"))
+    escalate = (ent_norm[None, :] > entropy_grid[:, None]) | (margin[None, :] < margin_grid[:, None])
+
+    full_pred = full_probs.argmax(axis=1)
+    pred = np.where(escalate, full_pred[None, :], screen_probs.argmax(axis=1)[None, :])
+    scores = score_confusions(confusion_grid(pred, np.asarray(labels, dtype=np.int64), full_probs.shape[1]))
+    return {
+        "max_entropy": entropy_grid,
+        "min_margin": margin_grid,
+        "escalation_rate": escalate.mean(axis=1),
+        "agreement": (pred == full_pred[None, :]).mean(axis=1),
+        "macro_recall": scores["macro_recall"],
+        "false_pneumonia_rate": scores["false_pneumonia_rate"],
+    }
+
+
+def write_report(report, out):
+    def line(name, r):
+        return (
+            f"| {name} | {r['max_entropy']:.2f} | {r['min_margin']:.2f} | {r['escalation_rate']:.3f} "
+            f"| {r['latency_saved']:+.1%} | {r['agreement']:.4f} | {r['macro_recall']:.4f} "
+            f"| {r['false_pneumonia_rate']:.4f} |"
+        )
+
+    ms = report["ms_per_image"]
+    header = [
+        "| | max entropy | min margin | escalation rate | latency saved | agreement | macro recall "
+        "| false-pneumonia rate |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    lines = [
+        "# Inference cascade: screening model + full model",
+        "",
+        f"{report['samples']} test images ({report['test_dir']}). Screening model {report['screen_model']} "
+        f"({ms['screen']:.2f} ms/image, macro recall {report['screen_macro_recall']:.4f}); full model "
+        f"{report['model']} ({ms['full']:.2f} ms/image, macro recall {report['full_macro_recall']:.4f}). "
+        "Agreement is the share of images where the cascade's class equals the full model's.",
+        "",
+        f"Serving thresholds, measured end to end: {ms['cascade']:.2f} ms/image, "
+        f"{report['measured_latency_saved']:+.1%} latency vs the full model.",
+        "",
+        *header,
+        line("serving", report["selected"]),
+    ]
+    if report["recommended"] is not None:
+        lines.append(line(f"agreement >= {report['min_agreement']}", report["recommended"]))
+    lines += [
+        "",
+        "## Escalation rate vs agreement (Pareto front)",
+        "",
+        *header,
+        *(line(i + 1, r) for i, r in enumerate(report["front"])),
+        "",
+        "Latency saved outside the serving row is estimated from per-model timings.",
+        "",
+    ]
+
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        f.write("\n".join(lines))
+    with open(os.path.splitext(out)[0] + ".json", "w") as f:
+        json.dump(report, f, indent=2)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--screen-model", default=SCREEN_MODEL_PATH)
+    parser.add_argument("--test-dir", default=TEST_DIR)
+    parser.add_argument("--max-entropy", type=float, nargs="+", default=np.arange(0.1, 0.95, 0.05).tolist())
+    parser.add_argument("--min-margin", type=float, nargs="+", default=np.arange(0.0, 0.85, 0.05).tolist())
+    parser.add_argument("--serving-max-entropy", type=float, default=CASCADE_MAX_ENTROPY)
+    parser.add_argument("--serving-min-margin", type=float, default=CASCADE_MIN_MARGIN)
+    parser.add_argument("--min-agreement", type=float, default=0.99,
+                        help="recommend the lowest escalation rate with at least this agreement")
+    parser.add_argument("--out", default=REPORT_PATH)
+    args = parser.parse_args()
+
+    from src.data.loader_improved import build_dataset, CLASS_NAMES
+    from src.inference.backends import load_inference_model, warmup
+    from src.inference.cascade import CascadeModel
+    from src.models.threshold_tuning import pareto_front
+
+    screen = load_inference_model("keras", args.screen_model)
+    full = load_inference_model("keras", args.model)
+    for name, model in (("screen", screen), ("full", full)):
+        latencies = warmup(model)
+        print(f"🔥 {name}: " + ", ".join(f"{b}={ms:.1f}ms" for b, ms in latencies.items()))
+    cascade = CascadeModel(screen, full, args.serving_max_entropy, args.serving_min_margin)
+
+    print(f"🔬 Running both models and the cascade on {args.test_dir}...")
+    evaluators, seconds = run_models(screen, full, cascade, build_dataset(args.test_dir), CLASS_NAMES)
+    labels = evaluators["full"].labels
+    n = len(labels)
+    ms = {name: 1000.0 * s / max(n, 1) for name, s in seconds.items()}
+
+    max_entropy = _grid(args.max_entropy, args.serving_max_entropy)
+    min_margin = _grid(args.min_margin, args.serving_min_margin)
+    results = sweep(evaluators["screen"].probabilities, evaluators["full"].probabilities, labels,
+                    max_entropy, min_margin)
+    results["latency_saved"] = 1.0 - (seconds["screen"] + results["escalation_rate"] * seconds["full"]) / seconds["full"]
+    rows = [{k: float(v[i]) for k, v in results.items()} for i in range(len(results["max_entropy"]))]
+
+    selected = next(
+        r for r in rows
+        if np.isclose(r["max_entropy"], args.serving_max_entropy) and np.isclose(r["min_margin"], args.serving_min_margin)
+    )
+    eligible = [r for r in rows if r["agreement"] >= args.min_agreement]
+    recommended = min(eligible, key=lambda r: (r["escalation_rate"], -r["macro_recall"])) if eligible else None
+    front = pareto_front(results["agreement"], results["escalation_rate"])
+
+    report = {
+        "model": args.model,
+        "screen_model": args.screen_model,
+        "test_dir": args.test_dir,
+        "samples": int(n),
+        "ms_per_image": ms,
+        "measured_latency_saved": 1.0 - seconds["cascade"] / seconds["full"],
+        "measured_escalation_rate": cascade.stats()["escalation_rate"],
+        "screen_macro_recall": float(evaluators["screen"].report()["macro avg"]["recall"]),
+        "full_macro_recall": float(evaluators["full"].report()["macro avg"]["recall"]),
+        "min_agreement": args.min_agreement,
+        "selected": selected,
+        "recommended": recommended,
+        "front": [rows[i] for i in front],
+        "results": rows,
+    }
+    print("\n" + write_report(report, args.out))
+    if recommended is not None:
+        print(f"⚡ Lowest escalation with agreement >= {args.min_agreement}: "
+              f"CASCADE_MAX_ENTROPY={recommended['max_entropy']:.2f} CASCADE_MIN_MARGIN={recommended['min_margin']:.2f}")
+    print(f"✅ Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Export the trained MobileNetV2 classifier to float16 and int8 TFLite artifacts
+and report accuracy/recall drift against the Keras model on the test split.
+
+Usage:
+    python -m src.models.export_tflite
+    python -m src.models.export_tflite --model models/final/best_model.keras --calibration-samples 300
+"""
+import os
+import json
+import argparse
+
+import numpy as np
+import tensorflow as tf
+
+from src.data.loader_improved import build_dataset, build_dataset_with_validation, CLASS_NAMES
+from src.inference.backends import TFLiteModel
+from src.models.metrics import evaluate_multiclass
+
+MODEL_PATH = "models/final/best_model.keras"
+TRAIN_DIR = "data/raw/train"
+TEST_DIR = "data/raw/test"
+OUTPUT_DIR = "models/final"
+CALIBRATION_SAMPLES = 200
+
+
+def representative_dataset(train_dir, num_samples):
+    """
+    Calibration samples for int8 quantization, drawn from the training split
+    and preprocessed exactly like the data the model was trained on.
+    """
+    train_ds, _ = build_dataset_with_validation(train_dir, augment=False)
+
+    def gen():
+        seen = 0
+        for images, _ in train_ds:
+            for image in images:
+                yield [image[tf.newaxis, ...]]
+                seen += 1
+                if seen >= num_samples:
+                    return
+
+    return gen
+
+
+def export_float16(model):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    return converter.convert()
+
+
+def export_int8(model, rep_dataset):
+    """Full-integer weights and activations; float32 input/output so it's a drop-in replacement."""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = rep_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def summarize(cm, report, macro_recall):
+    return {
+        "accuracy": float(report["accuracy"]),
+        "macro_recall": float(macro_recall),
+        "per_class_recall": {cls: float(report[cls]["recall"]) for cls in CLASS_NAMES},
+        "confusion_matrix": np.asarray(cm).tolist(),
+    }
+
+
+def drift(candidate, reference):
+    return {
+        "accuracy": candidate["accuracy"] - reference["accuracy"],
+        "macro_recall": candidate["macro_recall"] - reference["macro_recall"],
+        "per_class_recall": {
+            cls: candidate["per_class_recall"][cls] - reference["per_class_recall"][cls]
+            for cls in CLASS_NAMES
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export TFLite float16/int8 artifacts")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--train-dir", default=TRAIN_DIR)
+    parser.add_argument("--test-dir", default=TEST_DIR)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--calibration-samples", type=int, default=CALIBRATION_SAMPLES)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(args.model))[0]
+
+    print("Loading Keras model:", args.model)
+    model = tf.keras.models.load_model(args.model)
+
+    artifacts = {}
+
+    print("\nConverting float16...")
+    path = os.path.join(args.output_dir, f"{stem}_float16.tflite")
+    with open(path, "wb") as f:
+        f.write(export_float16(model))
+    artifacts["float16"] = path
+
+    print(f"Converting int8 ({args.calibration_samples} calibration samples)...")
+    path = os.path.join(args.output_dir, f"{stem}_int8.tflite")
+    rep_dataset = representative_dataset(args.train_dir, args.calibration_samples)
+    with open(path, "wb") as f:
+        f.write(export_int8(model, rep_dataset))
+    artifacts["int8"] = path
+
+    print("\nEvaluating on test set...")
+    test_ds = build_dataset(args.test_dir)
+
+    results = {"keras": summarize(*evaluate_multiclass(model, test_ds, CLASS_NAMES))}
+    results["keras"]["size_bytes"] = os.path.getsize(args.model)
+
+    for name, path in artifacts.items():
+        tflite_model = TFLiteModel(path)
+        results[name] = summarize(*evaluate_multiclass(tflite_model, test_ds, CLASS_NAMES))
+        results[name]["size_bytes"] = os.path.getsize(path)
+        results[name]["path"] = path
+        results[name]["drift_vs_keras"] = drift(results[name], results["keras"])
+
+    print(f"\n{'backend':<10}{'size (MB)':>12}{'accuracy':>12}{'macro recall':>15}{'Δ recall':>12}")
+    for name, r in results.items():
+        delta = r.get("drift_vs_keras", {}).get("macro_recall", 0.0)
+        print(
+            f"{name:<10}{r['size_bytes'] / 1e6:>12.2f}{r['accuracy']:>12.4f}"
+            f"{r['macro_recall']:>15.4f}{delta:>+12.4f}"
+        )
+
+    report_path = os.path.join(args.output_dir, f"{stem}_tflite_report.json")
+    with open(report_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print("\nSaved report:", report_path)
+
+
+if __name__ == "__main__":
+    main()
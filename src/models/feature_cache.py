@@ -0,0 +1,128 @@
+"""
+Frozen-backbone embedding cache for baseline training.
+
+While the backbone is frozen, every epoch pushes every image through it only
+to update the Dense head. Instead, run the backbone once over a dataset,
+store the pooled embeddings on disk as memory-mapped float16 arrays, and
+train the head on those. The head layers are shared with the full model, so
+after training the full model can be saved as the usual `.keras` file.
+"""
+import os
+import json
+import hashlib
+
+import numpy as np
+import tensorflow as tf
+
+from src.explainability.gradcam import _get_head_layers
+
+BATCH_SIZE = 256
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+def _weights_fingerprint(model):
+    """SHA-256 over a model's weight values, so a cache is tied to the exact backbone weights."""
+    digest = hashlib.sha256()
+    for weight in model.weights:
+        value = np.ascontiguousarray(weight.numpy())
+        digest.update(f"{weight.path}:{value.dtype}:{value.shape}".encode())
+        digest.update(value.tobytes())
+    return digest.hexdigest()
+
+
+def _cache_paths(cache_dir, name):
+    return (
+        os.path.join(cache_dir, f"{name}_features.npy"),
+        os.path.join(cache_dir, f"{name}_labels.npy"),
+        os.path.join(cache_dir, f"{name}_meta.json"),
+    )
+
+
+def extract_embeddings(model, dataset, num_samples, cache_dir, name, source=None):
+    """
+    Run the frozen backbone + pooling once over `dataset` and store the result.
+
+    model: full classifier (Input -> backbone -> GAP -> Dropout -> Dense)
+    dataset: batched (images, labels) dataset, e.g. from build_dataset
+    num_samples: number of images in the dataset (sizes the memmap)
+    source: identifies the data (e.g. its root directory) so a cache built
+        from different data is not reused
+    Returns memory-mapped (features, labels) arrays.
+    Re-uses an existing cache if it was built for the same backbone weights,
+    data and size.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    features_path, labels_path, meta_path = _cache_paths(cache_dir, name)
+    gap, _, _ = _get_head_layers(model)
+    dim = int(gap.output.shape[-1])
+    embedder = tf.keras.Model(model.inputs, gap.output)
+
+    # model.name is the same for every build of the classifier; the weights are not
+    meta = {
+        "model": model.name,
+        "weights_sha256": _weights_fingerprint(embedder),
+        "source": source,
+        "num_samples": int(num_samples),
+        "dim": dim,
+    }
+    if os.path.exists(meta_path) and os.path.exists(features_path):
+        with open(meta_path) as f:
+            if json.load(f) == meta:
+                print(f"Using cached embeddings: {features_path}")
+                return load_embeddings(cache_dir, name)
+
+    @tf.function
+    def embed(x):
+        return embedder(x, training=False)
+
+    features = np.lib.format.open_memmap(
+        features_path, mode="w+", dtype=np.float16, shape=(num_samples, dim)
+    )
+    labels = np.lib.format.open_memmap(
+        labels_path, mode="w+", dtype=np.int32, shape=(num_samples,)
+    )
+
+    offset = 0
+    for x, y in dataset:
+        n = int(y.shape[0])
+        features[offset:offset + n] = embed(x).numpy().astype(np.float16)
+        labels[offset:offset + n] = y.numpy()
+        offset += n
+
+    if offset != num_samples:
+        raise ValueError(f"Dataset yielded {offset} samples, expected {num_samples}")
+
+    features.flush()
+    labels.flush()
+    del features, labels
+
+    with open(meta_path, "w") as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"Cached {offset} embeddings ({dim}-d, float16) to {features_path}")
+    return load_embeddings(cache_dir, name)
+
+
+def load_embeddings(cache_dir, name):
+    features_path, labels_path, _ = _cache_paths(cache_dir, name)
+    return np.load(features_path, mmap_mode="r"), np.load(labels_path, mmap_mode="r")
+
+
+def embedding_dataset(features, labels, shuffle=False):
+    ds = tf.data.Dataset.from_tensor_slices((features, labels))
+    if shuffle:
+        ds = ds.shuffle(buffer_size=len(labels))
+    ds = ds.map(lambda f, y: (tf.cast(f, tf.float32), y), num_parallel_calls=AUTOTUNE)
+    return ds.batch(BATCH_SIZE).prefetch(AUTOTUNE)
+
+
+def build_cached_head(model):
+    """
+    Head-only model over pooled embeddings, sharing the Dropout/Dense layers
+    of `model`: training it trains the full model's head in place.
+    """
+    gap, dropout, dense = _get_head_layers(model)
+    inputs = tf.keras.layers.Input(shape=(int(gap.output.shape[-1]),))
+    x = dropout(inputs) if dropout is not None else inputs
+    outputs = dense(x)
+    return tf.keras.Model(inputs, outputs, name=f"{model.name}_head")
@@ -1,18 +1,126 @@
+"""
+Streaming evaluation: one inference pass, a cached probability matrix and
+incrementally accumulated confusion matrices.
+
+StreamingEvaluator runs the model over a dataset once, appending each
+batch's softmax outputs to a probability matrix and adding the batch to a
+confusion matrix (one np.bincount per batch). The probabilities can be
+saved (save_predictions) so threshold experiments (src.models.threshold_tuning)
+rescore them without running inference again.
+"""
+import json
+
 import numpy as np
-from sklearn.metrics import classification_report, confusion_matrix
 
-def evaluate_multiclass(model, dataset, class_names):
-    y_true = []
-    y_pred = []
 
-    for x, y in dataset:
-        probs = model.predict(x, verbose=0)
-        preds = np.argmax(probs, axis=1)
-        y_true.extend(y.numpy().tolist())
-        y_pred.extend(preds.tolist())
+def _batch_predict_fn(model):
+    """Per-batch inference without model.predict's per-call setup, where the model offers it."""
+    if hasattr(model, "predict_on_batch"):
+        return lambda x: model.predict_on_batch(x)
+    return lambda x: model.predict(x, verbose=0)
+
+
+def confusion_from_predictions(y_true, y_pred, num_classes):
+    """(num_classes, num_classes) confusion matrix, rows = true class, columns = predicted."""
+    index = num_classes * np.asarray(y_true, dtype=np.int64) + np.asarray(y_pred, dtype=np.int64)
+    return np.bincount(index, minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+
+
+def report_from_confusion(cm, class_names):
+    """Per-class precision/recall/F1/support, accuracy and macro/weighted averages (sklearn's output_dict layout)."""
+    cm = np.asarray(cm, dtype=np.float64)
+    tp = np.diag(cm)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    # Undefined ratios count as 0, as sklearn's default zero_division does
+    precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+    recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+    denom = precision + recall
+    f1 = np.divide(2 * precision * recall, denom, out=np.zeros_like(tp), where=denom > 0)
+
+    total = support.sum()
+    report = {
+        name: {
+            "precision": float(precision[i]),
+            "recall": float(recall[i]),
+            "f1-score": float(f1[i]),
+            "support": float(support[i]),
+        }
+        for i, name in enumerate(class_names)
+    }
+    report["accuracy"] = float(tp.sum() / total) if total else 0.0
+    weights = support / total if total else np.zeros_like(support)
+    for avg, w in (("macro avg", np.full(len(class_names), 1.0 / len(class_names))), ("weighted avg", weights)):
+        report[avg] = {
+            "precision": float(np.dot(w, precision)),
+            "recall": float(np.dot(w, recall)),
+            "f1-score": float(np.dot(w, f1)),
+            "support": float(total),
+        }
+    return report
+
+
+class StreamingEvaluator:
+    """Accumulates labels, probabilities and the confusion matrix batch by batch."""
+
+    def __init__(self, class_names):
+        self.class_names = list(class_names)
+        self.num_classes = len(self.class_names)
+        self.confusion = np.zeros((self.num_classes, self.num_classes), dtype=np.int64)
+        self._probs = []
+        self._labels = []
 
-    cm = confusion_matrix(y_true, y_pred)
-    report = classification_report(y_true, y_pred, target_names=class_names, digits=4, output_dict=True)
+    def update(self, probs, labels):
+        probs = np.asarray(probs, dtype=np.float32)
+        labels = np.asarray(labels, dtype=np.int64)
+        self._probs.append(probs)
+        self._labels.append(labels)
+        self.confusion += confusion_from_predictions(labels, probs.argmax(axis=1), self.num_classes)
+
+    def run(self, model, dataset):
+        """One inference pass over a (x, y) batched dataset."""
+        predict = _batch_predict_fn(model)
+        for x, y in dataset:
+            self.update(predict(x), y.numpy() if hasattr(y, "numpy") else y)
+        return self
+
+    @property
+    def probabilities(self):
+        if not self._probs:
+            return np.zeros((0, self.num_classes), dtype=np.float32)
+        if len(self._probs) > 1:
+            self._probs = [np.concatenate(self._probs)]
+        return self._probs[0]
+
+    @property
+    def labels(self):
+        if not self._labels:
+            return np.zeros(0, dtype=np.int64)
+        if len(self._labels) > 1:
+            self._labels = [np.concatenate(self._labels)]
+        return self._labels[0]
+
+    def report(self):
+        return report_from_confusion(self.confusion, self.class_names)
+
+
+def save_predictions(path, probs, labels, class_names, **info):
+    """Store an evaluation's probability matrix and labels (.npz) for later rescoring."""
+    np.savez_compressed(
+        path, probs=probs, labels=labels, class_names=np.array(class_names), info=np.array(json.dumps(info))
+    )
+
+
+def load_predictions(path):
+    """(probs, labels, class_names) saved by save_predictions."""
+    with np.load(path) as data:
+        return data["probs"], data["labels"], data["class_names"].tolist()
+
+
+def evaluate_multiclass(model, dataset, class_names):
+    evaluator = StreamingEvaluator(class_names).run(model, dataset)
+    cm = evaluator.confusion
+    report = evaluator.report()
 
     # macro recall = average of per-class recalls
     macro_recall = report["macro avg"]["recall"]
@@ -0,0 +1,348 @@
+"""
+Parallel hyperparameter / k-fold sweep over one shared decoded dataset.
+
+The training images are decoded once into shards (src.data.shards) under
+--cache. They are split with the same stratified split as
+loader_improved.build_dataset_with_validation, or into stratified folds
+with --folds. A sweep that finds a matching cache reuses it. Trials run
+concurrently in a spawn process pool. Each process gets its own CPU slice
+(where supported) and a matching intra-op thread count, so N concurrent
+trials do not each size their thread pools for the whole machine.
+
+A trial trains the ResNet50 classifier with one combination of dropout,
+head learning rate, unfreeze depth (backbone layers trained in the
+fine-tuning stage) and fine-tune learning rate. It is evaluated on
+validation macro recall after every epoch. Every evaluation and every
+trial result is appended to one leaderboard file (JSON lines), so the
+sweep can be watched while it runs (--summary). After --grace-epochs, a
+trial stops early when its best recall so far is more than --prune-margin
+below the best finished trial's at the same epoch (same fold).
+
+Usage:
+    python -m src.models.sweep --dropout 0.2 0.3 0.5 --unfreeze 0 10 30 --lr 1e-3 3e-4
+    python -m src.models.sweep --folds 5 --unfreeze 10 30 --parallel 4
+    python -m src.models.sweep --summary
+"""
+import os
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from src.inference.workers import available_cpus, plan_cpus
+
+SWEEP_CACHE_DIR = "data/shards/sweep"
+LEADERBOARD_PATH = "outputs/sweeps/leaderboard.jsonl"
+
+# Set in each pool process by _init_worker
+_lock = None
+_threads = None
+
+
+def build_trials(args):
+    """One trial per parameter combination (and per fold with --folds)."""
+    trials = []
+    for dropout, lr, unfreeze in itertools.product(args.dropout, args.lr, args.unfreeze):
+        # The fine-tune learning rate only matters when layers are unfrozen
+        for finetune_lr in (args.finetune_lr if unfreeze else [None]):
+            params = {"dropout": dropout, "lr": lr, "unfreeze": unfreeze, "finetune_lr": finetune_lr}
+            for fold in (range(args.folds) if args.folds else [None]):
+                trials.append({"id": len(trials), "params": params, "fold": fold})
+    return trials
+
+
+def ensure_cache(args):
+    """Decode the training images once into shards; reuse the cache if it matches the split."""
+    from src.data.shards import build_shards, load_index, INDEX_FILE
+
+    if os.path.exists(os.path.join(args.cache, INDEX_FILE)):
+        index = load_index(args.cache)
+        if (index["source"], index.get("val_split"), index.get("folds")) == (
+            args.data, None if args.folds else args.val_split, args.folds
+        ):
+            print(f"✓ Reusing decoded dataset in {args.cache}")
+            return index
+        raise SystemExit(
+            f"❌ {args.cache} holds a different split of {index['source']}; pass another --cache"
+        )
+    print(f"Decoding {args.data} once into {args.cache}...")
+    if args.folds:
+        return build_shards(args.data, args.cache, folds=args.folds)
+    return build_shards(args.data, args.cache, val_split=args.val_split)
+
+
+def _append(path, record):
+    with _lock:
+        with open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def read_leaderboard(path, sweep=None):
+    """Records of one sweep (default: the most recent one in the file)."""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if sweep is None and records:
+        sweep = records[-1]["sweep"]
+    return [r for r in records if r["sweep"] == sweep]
+
+
+def best_curve(records, fold):
+    """{epoch: best recall so far} of the best finished trial on `fold`, or None."""
+    done = [r for r in records if r["event"] == "done" and r["fold"] == fold]
+    if not done:
+        return None
+    best = max(done, key=lambda r: r["best_val_macro_recall"])["trial"]
+    curve, running = {}, 0.0
+    for r in sorted((r for r in records if r["event"] == "epoch" and r["trial"] == best), key=lambda r: r["epoch"]):
+        running = max(running, r["val_macro_recall"])
+        curve[r["epoch"]] = running
+    return curve
+
+
+def _init_worker(cpu_slots, lock, threads):
+    """Pool process setup, before TensorFlow is imported: take a CPU slice and size thread pools."""
+    global _lock, _threads
+    _lock, _threads = lock, threads
+    cpus = cpu_slots.get()
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+
+
+def run_trial(trial, args, sweep):
+    """Train and evaluate one trial in a pool process; returns its final leaderboard record."""
+    import tensorflow as tf
+    from tensorflow.keras.optimizers import Adam
+    from tensorflow.keras.applications.resnet import preprocess_input as resnet_preprocess_input
+
+    from src.data.loader_improved import CLASS_NAMES
+    from src.data.shards import shard_dataset, load_index, fold_splits
+    from src.models.build import build_resnet50_classifier, unfreeze_top_layers
+    from src.models.cpu_training import configure_cpu_training, save_for_serving
+    from src.models.metrics import evaluate_multiclass
+
+    params, fold = trial["params"], trial["fold"]
+    base = {"sweep": sweep, "trial": trial["id"], "fold": fold, "params": params}
+    start = time.perf_counter()
+
+    tf.keras.backend.clear_session()
+    # Threads were sized by _init_worker; configure only applies precision/XLA here
+    training = configure_cpu_training(fast=args.fast)
+    tf.keras.utils.set_random_seed(args.seed)
+
+    index = load_index(args.cache)
+    if fold is None:
+        train_splits, val_split = ["train"], "val"
+    else:
+        train_splits, val_split = fold_splits(index, fold)
+    train_ds = shard_dataset(
+        args.cache, train_splits, shuffle=True, augment=args.augment, preprocess=resnet_preprocess_input
+    )
+    val_ds = shard_dataset(args.cache, val_split, preprocess=resnet_preprocess_input)
+    if args.train_batches:
+        train_ds = train_ds.take(args.train_batches)
+
+    counts = np.sum([index["splits"][name]["class_counts"] for name in train_splits], axis=0)
+    class_weight = {i: counts.sum() / (len(counts) * c) for i, c in enumerate(counts) if c}
+
+    class Monitor(tf.keras.callbacks.Callback):
+        """
+        Validation macro recall after every epoch, streamed to the leaderboard;
+        prunes losing trials. With --save-best it keeps the best epoch's weights.
+        """
+
+        def __init__(self, keep_weights=False):
+            super().__init__()
+            self.best = 0.0
+            self.best_weights = None
+            self.keep_weights = keep_weights
+            self.epochs = 0
+            self.pruned = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            _, _, recall = evaluate_multiclass(self.model, val_ds, CLASS_NAMES)
+            if self.keep_weights and (self.best_weights is None or float(recall) > self.best):
+                self.best_weights = self.model.get_weights()
+            self.best = max(self.best, float(recall))
+            self.epochs = epoch + 1
+            _append(args.leaderboard, {**base, "event": "epoch", "epoch": epoch, "val_macro_recall": float(recall)})
+
+            if epoch + 1 < args.grace_epochs:
+                return
+            with _lock:
+                records = read_leaderboard(args.leaderboard, sweep)
+            curve = best_curve(records, fold)
+            if curve is None:
+                return
+            target = curve.get(epoch, max(curve.values()))
+            if self.best + args.prune_margin < target:
+                print(f"✂️ Trial {trial['id']} pruned at epoch {epoch + 1}: "
+                      f"best {self.best:.4f} vs {target:.4f} for the leader")
+                self.pruned = True
+                self.model.stop_training = True
+
+    monitor = Monitor(keep_weights=args.save_best and fold is None)
+    compile_kwargs = {
+        "loss": "sparse_categorical_crossentropy",
+        "metrics": ["sparse_categorical_accuracy"],
+        **training["compile"],
+    }
+
+    try:
+        model = build_resnet50_classifier(
+            num_classes=len(CLASS_NAMES), dropout=params["dropout"], weights=args.weights
+        )
+        model.compile(optimizer=Adam(learning_rate=params["lr"]), **compile_kwargs)
+        model.fit(train_ds, epochs=args.epochs, class_weight=class_weight, callbacks=[monitor], verbose=0)
+
+        if params["unfreeze"] and not monitor.pruned:
+            unfreeze_top_layers(model, params["unfreeze"])
+            model.compile(optimizer=Adam(learning_rate=params["finetune_lr"]), **compile_kwargs)
+            model.fit(
+                train_ds,
+                initial_epoch=args.epochs,
+                epochs=args.epochs + args.finetune_epochs,
+                class_weight=class_weight,
+                callbacks=[monitor],
+                verbose=0,
+            )
+    except Exception as e:
+        record = {**base, "event": "failed", "error": f"{type(e).__name__}: {e}"}
+        _append(args.leaderboard, record)
+        return record
+
+    record = {
+        **base,
+        "event": "pruned" if monitor.pruned else "done",
+        "best_val_macro_recall": monitor.best,
+        "epochs": monitor.epochs,
+        "seconds": round(time.perf_counter() - start, 1),
+        "threads": _threads,
+    }
+    with _lock:
+        if args.save_best and not monitor.pruned and fold is None:
+            records = read_leaderboard(args.leaderboard, sweep)
+            leader = max(
+                (r["best_val_macro_recall"] for r in records if r["event"] == "done"), default=-1.0
+            )
+            if monitor.best > leader:
+                os.makedirs(args.out_dir, exist_ok=True)
+                # The leaderboard scores the best epoch, not the last one
+                model.set_weights(monitor.best_weights)
+                save_for_serving(model, os.path.join(args.out_dir, "best_model.keras"))
+                with open(os.path.join(args.out_dir, "best_trial.json"), "w") as f:
+                    json.dump(record, f, indent=2)
+        with open(args.leaderboard, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    return record
+
+
+def summarize(records):
+    """Leaderboard table: one row per parameter combination, best mean validation recall first."""
+    rows = {}
+    for r in records:
+        if r["event"] not in ("done", "pruned", "failed"):
+            continue
+        key = json.dumps(r["params"], sort_keys=True)
+        rows.setdefault(key, {"params": r["params"], "scores": [], "pruned": 0, "failed": 0})
+        if r["event"] == "failed":
+            rows[key]["failed"] += 1
+        else:
+            rows[key]["scores"].append(r["best_val_macro_recall"])
+            rows[key]["pruned"] += r["event"] == "pruned"
+
+    ranked = sorted(rows.values(), key=lambda row: -np.mean(row["scores"]) if row["scores"] else 1.0)
+    lines = [f"{'rank':<6}{'dropout':>8}{'lr':>10}{'unfreeze':>10}{'ft lr':>10}{'recall':>9}{'± std':>8}"
+             f"{'runs':>6}{'pruned':>8}"]
+    for rank, row in enumerate(ranked, 1):
+        p = row["params"]
+        scores = row["scores"] or [float("nan")]
+        finetune_lr = f"{p['finetune_lr']:.0e}" if p["finetune_lr"] else "-"
+        lines.append(
+            f"{rank:<6}{p['dropout']:>8}{p['lr']:>10.0e}{p['unfreeze']:>10}{finetune_lr:>10}"
+            f"{np.mean(scores):>9.4f}{np.std(scores):>8.4f}{len(row['scores']):>6}{row['pruned']:>8}"
+            + (f"  ({row['failed']} failed)" if row["failed"] else "")
+        )
+    return "\n".join(lines)
+
+
+def main():
+    cpus = len(available_cpus())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="data/raw/train", help="training images, one folder per class")
+    parser.add_argument("--cache", default=SWEEP_CACHE_DIR, help="decoded shard cache shared by all trials")
+    parser.add_argument("--val-split", type=float, default=0.15)
+    parser.add_argument("--folds", type=int, default=None, help="k-fold cross-validation instead of one split")
+    parser.add_argument("--dropout", type=float, nargs="+", default=[0.3])
+    parser.add_argument("--lr", type=float, nargs="+", default=[1e-3], help="head learning rate")
+    parser.add_argument("--unfreeze", type=int, nargs="+", default=[10], help="backbone layers to fine-tune")
+    parser.add_argument("--finetune-lr", type=float, nargs="+", default=[1e-5])
+    parser.add_argument("--epochs", type=int, default=5, help="epochs with the backbone frozen")
+    parser.add_argument("--finetune-epochs", type=int, default=3)
+    parser.add_argument("--train-batches", type=int, default=None, help="limit batches per epoch (quick sweeps)")
+    parser.add_argument("--augment", action="store_true")
+    parser.add_argument("--weights", default="imagenet", help="'imagenet' or 'none' (random init)")
+    parser.add_argument("--fast", action="store_true", help="XLA + steps_per_execution (+ bf16 where native)")
+    parser.add_argument("--parallel", type=int, default=max(1, cpus // 4), help="concurrent trials")
+    parser.add_argument("--no-pin", action="store_true", help="do not pin trials to CPU slices")
+    parser.add_argument("--grace-epochs", type=int, default=2, help="epochs before a trial can be pruned")
+    parser.add_argument("--prune-margin", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--leaderboard", default=LEADERBOARD_PATH)
+    parser.add_argument("--name", default=None, help="sweep name in the leaderboard (default: start time)")
+    parser.add_argument("--out-dir", default="outputs/sweeps")
+    parser.add_argument("--save-best", action="store_true", help="save the leading model (single split only)")
+    parser.add_argument("--summary", action="store_true", help="print the leaderboard of a sweep and exit")
+    args = parser.parse_args()
+
+    if args.summary:
+        print(summarize(read_leaderboard(args.leaderboard, args.name)))
+        return
+    if args.weights == "none":
+        args.weights = None
+
+    sweep = args.name or time.strftime("%Y%m%d-%H%M%S")
+    trials = build_trials(args)
+    ensure_cache(args)
+    os.makedirs(os.path.dirname(args.leaderboard) or ".", exist_ok=True)
+
+    parallel = min(args.parallel, len(trials))
+    cpu_slices = plan_cpus(parallel, pin=not args.no_pin)
+    threads = len(cpu_slices[0] or ()) or max(1, cpus // parallel)
+    print(f"🔬 Sweep {sweep}: {len(trials)} trials, {parallel} at a time, {threads} threads each "
+          f"→ {args.leaderboard}")
+
+    context = multiprocessing.get_context("spawn")
+    cpu_slots = context.Queue()
+    for cpus_for_trial in cpu_slices:
+        cpu_slots.put(cpus_for_trial)
+    with ProcessPoolExecutor(
+        max_workers=parallel,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(cpu_slots, context.Lock(), threads),
+    ) as pool:
+        futures = [pool.submit(run_trial, trial, args, sweep) for trial in trials]
+        for future in as_completed(futures):
+            r = future.result()
+            fold = f" fold {r['fold']}" if r["fold"] is not None else ""
+            if r["event"] == "failed":
+                print(f"❌ Trial {r['trial']}{fold} {r['params']}: {r['error']}")
+            else:
+                print(f"✓ Trial {r['trial']}{fold} {r['params']}: {r['event']}, "
+                      f"best val macro recall {r['best_val_macro_recall']:.4f} after {r['epochs']} epochs "
+                      f"({r['seconds']:.0f}s)")
+
+    print("\n" + summarize(read_leaderboard(args.leaderboard, sweep)))
+
+
+if __name__ == "__main__":
+    main()
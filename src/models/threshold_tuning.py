@@ -0,0 +1,272 @@
+"""
+Vectorized threshold tuning against cached test-set probabilities.
+
+Scores every combination of the smart_threshold constants
+(src/inference/postprocess.py) and the app's pneumonia confidence gate:
+
+    viral_scale          VIRAL probability multiplier (0.75)
+    normal_boost         NORMAL multiplier (1.3) ...
+    normal_boost_min     ... applied when NORMAL > this (0.20)
+    viral_min_confidence weaker VIRAL calls fall back to NORMAL/BACTERIAL (0.70)
+    pneumonia_min_conf   weaker pneumonia calls fall back to NORMAL (the
+                         Streamlit slider, 0.65; 0 = no gate)
+
+Each chunk of combinations is applied to the whole (N, 3) probability matrix
+as (combinations, N) arrays, and the per-combination confusion matrices come
+from a single np.bincount. Results are the Pareto front of macro recall
+(maximize) vs false-pneumonia rate (NORMAL cases called pneumonia, minimize),
+with the current constants placed on it.
+
+Usage:
+    python -m src.models.eval                     # caches outputs/eval/test_predictions.npz
+    python -m src.models.threshold_tuning
+    python -m src.models.threshold_tuning --viral-scale 0.6 0.7 0.75 0.8 --max-fpr 0.1
+"""
+import os
+import json
+import time
+import argparse
+import itertools
+
+import numpy as np
+
+from src.inference.postprocess import (
+    NORMAL_IDX, BACTERIAL_IDX, VIRAL_IDX,
+    VIRAL_SCALE, NORMAL_BOOST, NORMAL_BOOST_MIN, VIRAL_MIN_CONFIDENCE,
+)
+
+PREDICTIONS_PATH = "outputs/eval/test_predictions.npz"
+REPORT_PATH = "outputs/reports/threshold_tuning.md"
+# The Streamlit app's default pneumonia confidence gate
+APP_PNEUMONIA_MIN_CONFIDENCE = 0.65
+# (combinations x samples) evaluated per chunk, bounds peak memory
+CHUNK_ELEMENTS = int(os.getenv("THRESHOLD_CHUNK_ELEMENTS", str(4_000_000)))
+
+PARAMS = ("viral_scale", "normal_boost", "normal_boost_min", "viral_min_confidence", "pneumonia_min_conf")
+
+
+def _steps(start, stop, step):
+    return [round(float(v), 2) for v in np.arange(start, stop + step / 2, step)]
+
+
+DEFAULT_GRID = {
+    "viral_scale": _steps(0.5, 1.0, 0.05),
+    "normal_boost": _steps(1.0, 2.0, 0.1),
+    "normal_boost_min": [0.0, 0.1, 0.2, 0.3],
+    "viral_min_confidence": _steps(0.4, 0.9, 0.05),
+    "pneumonia_min_conf": [0.0] + _steps(0.5, 0.8, 0.05),
+}
+
+
+def current_settings():
+    """The constants the app ships with."""
+    return {
+        "viral_scale": float(VIRAL_SCALE),
+        "normal_boost": float(NORMAL_BOOST),
+        "normal_boost_min": float(NORMAL_BOOST_MIN),
+        "viral_min_confidence": float(VIRAL_MIN_CONFIDENCE),
+        "pneumonia_min_conf": APP_PNEUMONIA_MIN_CONFIDENCE,
+    }
+
+
+def build_grid(grid):
+    """(M, 5) float64 array of parameter combinations (columns in PARAMS order)."""
+    return np.array(list(itertools.product(*(grid[p] for p in PARAMS))), dtype=np.float64)
+
+
+def predict_grid(probs, combos):
+    """
+    (M, N) predictions of smart_threshold + the confidence gate for every combination.
+
+    Same operations, in the same order and precision, as smart_threshold_batch
+    and postprocess_batch (float64 scaling and comparisons against the
+    constants, float32 normalization), so the default constants reproduce
+    them exactly.
+    """
+    probs = np.asarray(probs, dtype=np.float32)
+    combos = np.asarray(combos, dtype=np.float64)
+    vs, nb, nbm, vmc, pmc = (combos[:, i, None] for i in range(5))
+    n = probs[None, :, NORMAL_IDX]
+    b = probs[None, :, BACTERIAL_IDX]
+    v = (probs[None, :, VIRAL_IDX] * vs).astype(np.float32)
+    n = np.where(n > nbm, (n * nb).astype(np.float32), n)
+    b = np.broadcast_to(b, n.shape)
+    total = (n + b) + v
+    n, b, v = n / total, b / total, v / total
+
+    # argmax with ties going to the lower index, as np.argmax does
+    pred = np.where((n >= b) & (n >= v), NORMAL_IDX, np.where(b >= v, BACTERIAL_IDX, VIRAL_IDX))
+    weak_viral = (pred == VIRAL_IDX) & (v < vmc)
+    pred = np.where(weak_viral, np.where(n > b, NORMAL_IDX, BACTERIAL_IDX), pred)
+
+    confidence = np.where(pred == NORMAL_IDX, n, np.where(pred == BACTERIAL_IDX, b, v))
+    gated = (pred != NORMAL_IDX) & (confidence < pmc)
+    return np.where(gated, NORMAL_IDX, pred)
+
+
+def confusion_grid(pred, labels, num_classes=3):
+    """(M, k, k) confusion matrices for (M, N) predictions in one bincount."""
+    m = pred.shape[0]
+    index = (np.arange(m, dtype=np.int64)[:, None] * num_classes + labels[None, :]) * num_classes + pred
+    return np.bincount(index.ravel(), minlength=m * num_classes * num_classes).reshape(m, num_classes, num_classes)
+
+
+def score_confusions(cms):
+    """Per-combination macro recall, false-pneumonia rate, accuracy and per-class recall."""
+    cms = cms.astype(np.float64)
+    support = cms.sum(axis=2)
+    recall = np.divide(np.diagonal(cms, axis1=1, axis2=2), support, out=np.zeros(support.shape), where=support > 0)
+    normal = support[:, NORMAL_IDX]
+    false_pneumonia = cms[:, NORMAL_IDX, BACTERIAL_IDX] + cms[:, NORMAL_IDX, VIRAL_IDX]
+    return {
+        "macro_recall": recall.mean(axis=1),
+        "false_pneumonia_rate": np.divide(false_pneumonia, normal, out=np.zeros(len(cms)), where=normal > 0),
+        "accuracy": np.trace(cms, axis1=1, axis2=2) / np.maximum(support.sum(axis=1), 1),
+        "recall": recall,
+    }
+
+
+def evaluate_grid(probs, labels, combos, chunk_elements=CHUNK_ELEMENTS):
+    """Scores of every combination, evaluated in chunks of combinations."""
+    labels = np.asarray(labels, dtype=np.int64)
+    chunk = max(1, chunk_elements // max(len(labels), 1))
+    cms = np.concatenate([
+        confusion_grid(predict_grid(probs, combos[i:i + chunk]), labels)
+        for i in range(0, len(combos), chunk)
+    ])
+    return score_confusions(cms)
+
+
+def pareto_front(macro_recall, false_pneumonia_rate):
+    """
+    Indices of the non-dominated combinations, by ascending false-pneumonia rate.
+
+    Ties on both metrics keep the first combination in grid order.
+    """
+    order = np.lexsort((np.arange(len(macro_recall)), -macro_recall, false_pneumonia_rate))
+    front, best = [], -np.inf
+    for i in order:
+        if macro_recall[i] > best:
+            front.append(int(i))
+            best = macro_recall[i]
+    return front
+
+
+def _row(combo, scores, i, class_names):
+    row = {p: round(float(combo[j]), 4) for j, p in enumerate(PARAMS)}
+    row.update({
+        "macro_recall": float(scores["macro_recall"][i]),
+        "false_pneumonia_rate": float(scores["false_pneumonia_rate"][i]),
+        "accuracy": float(scores["accuracy"][i]),
+        "recall": {cls: float(r) for cls, r in zip(class_names, scores["recall"][i])},
+    })
+    return row
+
+
+def tune(probs, labels, class_names, grid=DEFAULT_GRID):
+    """Grid results: the Pareto front, the current constants and the plain argmax baseline."""
+    combos = build_grid(grid)
+    reference = np.array([
+        [current_settings()[p] for p in PARAMS],
+        # viral_scale 1, no boost, no fallbacks: plain argmax
+        [1.0, 1.0, 1.0, 0.0, 0.0],
+    ], dtype=np.float64)
+
+    start = time.perf_counter()
+    scores = evaluate_grid(probs, labels, combos)
+    seconds = time.perf_counter() - start
+    ref_scores = evaluate_grid(probs, labels, reference)
+
+    front = pareto_front(scores["macro_recall"], scores["false_pneumonia_rate"])
+    current = _row(reference[0], ref_scores, 0, class_names)
+    dominating = [
+        i for i in front
+        if scores["macro_recall"][i] >= current["macro_recall"]
+        and scores["false_pneumonia_rate"][i] <= current["false_pneumonia_rate"]
+        and (scores["macro_recall"][i], scores["false_pneumonia_rate"][i])
+        != (current["macro_recall"], current["false_pneumonia_rate"])
+    ]
+    return {
+        "samples": int(len(labels)),
+        "combinations": int(len(combos)),
+        "seconds": seconds,
+        "grid": grid,
+        "current": current,
+        "argmax": _row(reference[1], ref_scores, 1, class_names),
+        "front": [_row(combos[i], scores, i, class_names) for i in front],
+        "dominating_current": [_row(combos[i], scores, i, class_names) for i in dominating],
+    }
+
+
+def write_report(results, out, predictions_path, max_fpr=None):
+    def line(name, r):
+        return (
+            f"| {name} | {r['viral_scale']:.2f} | {r['normal_boost']:.2f} | {r['normal_boost_min']:.2f} "
+            f"| {r['viral_min_confidence']:.2f} | {r['pneumonia_min_conf']:.2f} "
+            f"| {r['macro_recall']:.4f} | {r['false_pneumonia_rate']:.4f} | {r['accuracy']:.4f} |"
+        )
+
+    front = results["front"]
+    if max_fpr is not None:
+        front = [r for r in front if r["false_pneumonia_rate"] <= max_fpr]
+    header = [
+        "| | viral scale | normal boost | boost min | viral min conf | pneumonia min conf "
+        "| macro recall | false-pneumonia rate | accuracy |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    lines = [
+        "# Threshold tuning: macro recall vs false-pneumonia rate",
+        "",
+        f"{results['combinations']} combinations scored on {results['samples']} cached test predictions "
+        f"({predictions_path}) in {results['seconds']:.2f}s. False-pneumonia rate is the share of NORMAL "
+        "cases predicted as bacterial or viral pneumonia.",
+        "",
+        "## Current settings",
+        "",
+        *header,
+        line("current", results["current"]),
+        line("argmax", results["argmax"]),
+        "",
+        f"{len(results['dominating_current'])} Pareto-front combinations dominate the current settings.",
+        "",
+        "## Pareto front" + (f" (false-pneumonia rate <= {max_fpr})" if max_fpr is not None else ""),
+        "",
+        *header,
+        *(line(i + 1, r) for i, r in enumerate(front)),
+        "",
+    ]
+
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        f.write("\n".join(lines))
+    with open(os.path.splitext(out)[0] + ".json", "w") as f:
+        json.dump({"predictions": predictions_path, **results}, f, indent=2)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--predictions", default=PREDICTIONS_PATH, help="probability matrix saved by src.models.eval")
+    parser.add_argument("--out", default=REPORT_PATH)
+    parser.add_argument("--max-fpr", type=float, default=None, help="only list front points up to this rate")
+    for p in PARAMS:
+        parser.add_argument(f"--{p.replace('_', '-')}", type=float, nargs="+", default=DEFAULT_GRID[p])
+    args = parser.parse_args()
+
+    if not os.path.exists(args.predictions):
+        parser.error(f"{args.predictions} not found; run `python -m src.models.eval` first")
+
+    from src.models.metrics import load_predictions
+    probs, labels, class_names = load_predictions(args.predictions)
+    grid = {p: getattr(args, p) for p in PARAMS}
+
+    results = tune(probs, labels, class_names, grid)
+    rate = results["combinations"] * results["samples"] / max(results["seconds"], 1e-9)
+    print(f"⚡ {results['combinations']} combinations x {results['samples']} samples "
+          f"in {results['seconds']:.2f}s ({rate / 1e6:.1f}M predictions/s)")
+    print("\n" + write_report(results, args.out, args.predictions, args.max_fpr))
+    print(f"✅ Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 import os
 import json
+import argparse
+from datetime import datetime
 import tensorflow as tf
 from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau, ModelCheckpoint
 from tensorflow.keras.optimizers import Adam
@@ -7,12 +9,21 @@ from sklearn.utils.class_weight import compute_class_weight
 import numpy as np
 
 from src.models.metrics import evaluate_multiclass
-from src.data.loader import build_dataset, CLASS_NAMES
-from src.models.build import build_resnet50_classifier
+from src.data.loader import build_dataset, CLASS_NAMES, IMAGE_EXTENSIONS, BATCH_SIZE
+from src.data.shards import build_dataset_from_shards
+from tensorflow.keras.applications.resnet import preprocess_input as resnet_preprocess_input
+from src.models.build import build_resnet50_classifier, unfreeze_top_layers, DEFAULT_UNFREEZE_LAYERS
+from src.models.feature_cache import extract_embeddings, embedding_dataset, build_cached_head
+from src.models.cpu_training import configure_cpu_training, save_for_serving, ThroughputMeter
 
 TRAIN_DIR = "data/raw/train"
 TEST_DIR  = "data/raw/test"
 MODEL_DIR = "models/final"
+FEATURE_CACHE_DIR = "models/feature_cache"
+SHARD_TRAIN_DIR = "data/shards/train"
+SHARD_TEST_DIR = "data/shards/test"
+# Top backbone layers trained in the fine-tuning stage (see src.models.sweep to tune it)
+UNFREEZE_LAYERS = int(os.getenv("UNFREEZE_LAYERS", str(DEFAULT_UNFREEZE_LAYERS)))
 os.makedirs(MODEL_DIR, exist_ok=True)
 
 def get_all_labels_from_directory(root_dir):
@@ -20,14 +31,66 @@ def get_all_labels_from_directory(root_dir):
     for idx, cls in enumerate(CLASS_NAMES):
         class_dir = os.path.join(root_dir, cls)
         for f in os.listdir(class_dir):
-            if f.lower().endswith(("jpg", "jpeg", "png")):
+            if f.lower().endswith(IMAGE_EXTENSIONS):
                 labels.append(idx)
     return np.array(labels)
 
-def main():
+def resave_checkpoint(path):
+    """ModelCheckpoint saves with the training policy; rewrite the file in float32."""
+    if tf.keras.mixed_precision.global_policy().name != "float32" and os.path.exists(path):
+        save_for_serving(tf.keras.models.load_model(path), path)
+
+def train_baseline_on_feature_cache(model, train_ds, test_ds, class_weights, compile_options):
+    """
+    Baseline stage with the backbone frozen: embed train/test once, then fit
+    the shared Dropout/Dense head on the cached float16 embeddings.
+    """
+    n_train = len(get_all_labels_from_directory(TRAIN_DIR))
+    n_test = len(get_all_labels_from_directory(TEST_DIR))
+
+    print("Embedding train/test sets through the frozen backbone (once)...")
+    train_x, train_y = extract_embeddings(model, train_ds, n_train, FEATURE_CACHE_DIR, "train", source=TRAIN_DIR)
+    test_x, test_y = extract_embeddings(model, test_ds, n_test, FEATURE_CACHE_DIR, "test", source=TEST_DIR)
+
+    head = build_cached_head(model)
+    head.compile(
+        optimizer=Adam(learning_rate=1e-3),
+        loss="sparse_categorical_crossentropy",
+        metrics=["sparse_categorical_accuracy"],
+        **compile_options
+    )
+
+    head_callbacks = [
+        ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=2),
+        EarlyStopping(monitor="val_loss", patience=4, restore_best_weights=True),
+    ]
+
+    print("\nTraining (baseline: head on cached embeddings)...")
+    head.fit(
+        embedding_dataset(train_x, train_y, shuffle=True),
+        validation_data=embedding_dataset(test_x, test_y),
+        epochs=10,
+        class_weight=class_weights,
+        callbacks=head_callbacks
+    )
+
+    # Head layers are shared, so the full model already carries the trained weights
+    save_for_serving(model, os.path.join(MODEL_DIR, "best_baseline.keras"))
+
+def main(feature_cache=False, shards=False, training=None):
+    # Threads and precision must be set before any dataset or model exists
+    training = training or configure_cpu_training()
+    compile_options = training["compile"]
+    throughput = {}
+
     print("Loading datasets...")
-    train_ds = build_dataset(TRAIN_DIR)
-    test_ds  = build_dataset(TEST_DIR)
+    if shards:
+        # Pre-decoded uint8 shards (python -m src.data.shards), streamed every epoch
+        train_ds = build_dataset_from_shards(SHARD_TRAIN_DIR, preprocess=resnet_preprocess_input)
+        test_ds  = build_dataset_from_shards(SHARD_TEST_DIR, preprocess=resnet_preprocess_input, shuffle=False)
+    else:
+        train_ds = build_dataset(TRAIN_DIR)
+        test_ds  = build_dataset(TEST_DIR)
 
     print("Computing class weights...")
     y_train = get_all_labels_from_directory(TRAIN_DIR)
@@ -45,54 +108,61 @@ def main():
     # -------------------------
     # BASELINE TRAIN (FROZEN)
     # -------------------------
-    model.compile(
-        optimizer=Adam(learning_rate=1e-3),
-        loss="sparse_categorical_crossentropy",
-        metrics=["sparse_categorical_accuracy"]
-    )
-
-    baseline_callbacks = [
-        ModelCheckpoint(
-            filepath=os.path.join(MODEL_DIR, "best_baseline.keras"),
-            monitor="val_sparse_categorical_accuracy",
-            save_best_only=True,
-            mode="max"
-        ),
-        ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=2),
-        EarlyStopping(monitor="val_loss", patience=4, restore_best_weights=True),
-    ]
-
-    print("\nTraining (baseline: frozen ResNet backbone)...")
-    model.fit(
-        train_ds,
-        validation_data=test_ds,
-        epochs=10,
-        class_weight=class_weights,
-        callbacks=baseline_callbacks
-    )
+    if feature_cache:
+        train_baseline_on_feature_cache(model, train_ds, test_ds, class_weights, compile_options)
+    else:
+        model.compile(
+            optimizer=Adam(learning_rate=1e-3),
+            loss="sparse_categorical_crossentropy",
+            metrics=["sparse_categorical_accuracy"],
+            **compile_options
+        )
+        baseline_meter = ThroughputMeter(BATCH_SIZE, samples=len(y_train))
+
+        baseline_callbacks = [
+            ModelCheckpoint(
+                filepath=os.path.join(MODEL_DIR, "best_baseline.keras"),
+                monitor="val_sparse_categorical_accuracy",
+                save_best_only=True,
+                mode="max"
+            ),
+            ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=2),
+            EarlyStopping(monitor="val_loss", patience=4, restore_best_weights=True),
+            baseline_meter,
+        ]
+
+        print("\nTraining (baseline: frozen ResNet backbone)...")
+        model.fit(
+            train_ds,
+            validation_data=test_ds,
+            epochs=10,
+            class_weight=class_weights,
+            callbacks=baseline_callbacks
+        )
+        throughput["baseline_images_per_second"] = round(baseline_meter.images_per_second, 1)
+        resave_checkpoint(os.path.join(MODEL_DIR, "best_baseline.keras"))
 
     print("\nEvaluating BASELINE on test set (macro recall + confusion matrix)...")
     cm, report, macro_recall = evaluate_multiclass(model, test_ds, CLASS_NAMES)
     print("Baseline Macro Recall:", macro_recall)
     print("Baseline Confusion Matrix:\n", cm)
 
-    model.save(os.path.join(MODEL_DIR, "baseline_final.keras"))
+    save_for_serving(model, os.path.join(MODEL_DIR, "baseline_final.keras"))
 
     # -------------------------
     # FINE-TUNING (UNFREEZE TOP)
     # -------------------------
     print("\n--- Fine-tuning: unfreezing top ResNet layers ---")
 
-    model.get_layer("resnet50").trainable = True
-
-    for layer in model.get_layer("resnet50").layers[:-10]:
-        layer.trainable = False
+    unfreeze_top_layers(model, UNFREEZE_LAYERS)
 
     model.compile(
         optimizer=Adam(learning_rate=1e-5),
         loss="sparse_categorical_crossentropy",
-        metrics=["sparse_categorical_accuracy"]
+        metrics=["sparse_categorical_accuracy"],
+        **compile_options
     )
+    finetune_meter = ThroughputMeter(BATCH_SIZE, samples=len(y_train))
 
     finetune_callbacks = [
         ModelCheckpoint(
@@ -103,6 +173,7 @@ def main():
         ),
         ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=1),
         EarlyStopping(monitor="val_loss", patience=2, restore_best_weights=True),
+        finetune_meter,
     ]
 
     model.fit(
@@ -112,21 +183,28 @@ def main():
         class_weight=class_weights,
         callbacks=finetune_callbacks
     )
+    throughput["finetune_images_per_second"] = round(finetune_meter.images_per_second, 1)
+    resave_checkpoint(os.path.join(MODEL_DIR, "best_finetuned.keras"))
 
     print("\nEvaluating FINETUNED on test set (macro recall + confusion matrix)...")
     cm2, report2, macro_recall2 = evaluate_multiclass(model, test_ds, CLASS_NAMES)
     print("Fine-tuned Macro Recall:", macro_recall2)
     print("Fine-tuned Confusion Matrix:\n", cm2)
 
-    model.save(os.path.join(MODEL_DIR, "fine_tuned.keras"))
+    save_for_serving(model, os.path.join(MODEL_DIR, "fine_tuned.keras"))
 
+    trained_at = datetime.now()
     metadata = {
+        # Names the model version in the serving registry (src/inference/registry.py)
+        "version": os.getenv("MODEL_VERSION") or trained_at.strftime("%Y%m%d-%H%M%S"),
+        "training_date": trained_at.isoformat(timespec="seconds"),
         "classes": CLASS_NAMES,
         "img_size": [224, 224],
         "model": "ResNet50",
         "baseline_macro_recall": float(macro_recall),
         "finetuned_macro_recall": float(macro_recall2),
-        "note": "Baseline trained with frozen backbone, then fine-tuned last ~30 layers."
+        "training": {**{k: v for k, v in training.items() if k != "compile"}, **throughput},
+        "unfreeze_layers": UNFREEZE_LAYERS,
     }
     with open(os.path.join(MODEL_DIR, "metadata.json"), "w") as f:
         json.dump(metadata, f, indent=2)
@@ -134,4 +212,34 @@ def main():
     print("\nDone ✅ (baseline + fine-tuning complete)")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Train the pneumonia classifier")
+    parser.add_argument(
+        "--feature-cache",
+        action="store_true",
+        help="Train the frozen-backbone baseline on cached embeddings instead of images"
+    )
+    parser.add_argument(
+        "--shards",
+        action="store_true",
+        help=f"Stream pre-decoded shards from {SHARD_TRAIN_DIR} / {SHARD_TEST_DIR} instead of JPEGs"
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="CPU throughput mode: XLA, steps_per_execution and bf16 where the CPU supports it"
+    )
+    parser.add_argument("--jit", action=argparse.BooleanOptionalAction, default=None, help="XLA JIT compilation")
+    parser.add_argument("--bf16", choices=("auto", "on", "off"), default="auto", help="bfloat16 mixed precision")
+    parser.add_argument("--steps-per-execution", type=int, default=None)
+    parser.add_argument("--intra-op-threads", type=int, default=None)
+    parser.add_argument("--inter-op-threads", type=int, default=None)
+    args = parser.parse_args()
+    training = configure_cpu_training(
+        fast=args.fast,
+        jit=args.jit,
+        bf16=args.bf16,
+        steps_per_execution=args.steps_per_execution,
+        intra_op_threads=args.intra_op_threads,
+        inter_op_threads=args.inter_op_threads,
+    )
+    main(feature_cache=args.feature_cache, shards=args.shards, training=training)
@@ -0,0 +1,115 @@
+"""
+Train the screening model of the inference cascade (src/inference/cascade.py):
+a MobileNetV2 at reduced width and input resolution, on the same
+MobileNetV2-preprocessed data as the serving model.
+
+Usage:
+    python -m src.models.train_screening
+    python -m src.models.train_screening --alpha 0.5 --resolution 160 --epochs 15
+    python -m src.models.eval_cascade --screen-model models/final/screening_model.keras
+"""
+import os
+import json
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+TRAIN_DIR = "data/raw/train"
+TEST_DIR = "data/raw/test"
+OUTPUT_PATH = "models/final/screening_model.keras"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--train-dir", default=TRAIN_DIR)
+    parser.add_argument("--test-dir", default=TEST_DIR)
+    parser.add_argument("--out", default=OUTPUT_PATH)
+    parser.add_argument("--alpha", type=float, default=None, help="width multiplier (default 0.35)")
+    parser.add_argument("--resolution", type=int, default=None, help="backbone input size (default 128)")
+    parser.add_argument("--epochs", type=int, default=10, help="frozen-backbone epochs")
+    parser.add_argument("--finetune-epochs", type=int, default=5)
+    parser.add_argument("--unfreeze-layers", type=int, default=20, help="top backbone layers to fine-tune")
+    parser.add_argument("--weights", default="imagenet", help="'imagenet' or 'none' (random init)")
+    parser.add_argument("--fast", action="store_true", help="CPU throughput mode (see src.models.cpu_training)")
+    args = parser.parse_args()
+
+    from src.models.cpu_training import configure_cpu_training, save_for_serving
+    training = configure_cpu_training(fast=args.fast)
+
+    from sklearn.utils.class_weight import compute_class_weight
+    from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
+    from tensorflow.keras.optimizers import Adam
+
+    from src.data.loader_improved import build_dataset, build_dataset_with_validation, list_image_files, CLASS_NAMES
+    from src.models.build import (
+        build_mobilenetv2_screening_classifier, unfreeze_top_layers,
+        SCREENING_ALPHA, SCREENING_RESOLUTION, SCREENING_BACKBONE,
+    )
+    from src.models.metrics import evaluate_multiclass
+
+    alpha = args.alpha or SCREENING_ALPHA
+    resolution = args.resolution or SCREENING_RESOLUTION
+
+    print("Loading datasets...")
+    train_ds, val_ds = build_dataset_with_validation(args.train_dir, augment=True)
+    test_ds = build_dataset(args.test_dir)
+
+    _, y_train = list_image_files(args.train_dir)
+    weights_arr = compute_class_weight(class_weight="balanced", classes=np.unique(y_train), y=y_train)
+    class_weights = {i: w for i, w in enumerate(weights_arr)}
+    print("Class weights:", class_weights)
+
+    model = build_mobilenetv2_screening_classifier(
+        num_classes=len(CLASS_NAMES),
+        alpha=alpha,
+        resolution=resolution,
+        weights=None if args.weights == "none" else args.weights,
+    )
+    print(f"Screening model: MobileNetV2 alpha={alpha}, {resolution}x{resolution}, {model.count_params():,} parameters")
+
+    stages = [("frozen backbone", 0, 1e-3, args.epochs), ("fine-tuning", args.unfreeze_layers, 1e-5, args.finetune_epochs)]
+    for stage, unfreeze, learning_rate, epochs in stages:
+        if epochs <= 0:
+            continue
+        unfreeze_top_layers(model, unfreeze, backbone=SCREENING_BACKBONE)
+        model.compile(
+            optimizer=Adam(learning_rate=learning_rate),
+            loss="sparse_categorical_crossentropy",
+            metrics=["sparse_categorical_accuracy"],
+            **training["compile"],
+        )
+        print(f"\nTraining ({stage})...")
+        model.fit(
+            train_ds,
+            validation_data=val_ds,
+            epochs=epochs,
+            class_weight=class_weights,
+            callbacks=[
+                ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=2),
+                EarlyStopping(monitor="val_loss", patience=4, restore_best_weights=True),
+            ],
+        )
+
+    cm, report, macro_recall = evaluate_multiclass(model, test_ds, CLASS_NAMES)
+    print("Screening Macro Recall:", macro_recall)
+    print("Screening Confusion Matrix:\n", cm)
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    save_for_serving(model, args.out)
+    metadata = {
+        "model": "MobileNetV2 (screening)",
+        "alpha": alpha,
+        "resolution": resolution,
+        "parameters": int(model.count_params()),
+        "training_date": datetime.now().isoformat(timespec="seconds"),
+        "classes": CLASS_NAMES,
+        "macro_recall": float(macro_recall),
+    }
+    with open(os.path.splitext(args.out)[0] + "_metadata.json", "w") as f:
+        json.dump(metadata, f, indent=2)
+    print(f"✅ Screening model saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+DICOM ingestion (src/data/dicom.py) on synthetic studies: window/level,
+MONOCHROME1 inversion, area reduction, signed pixels, the header cache and
+corrupt uploads.
+"""
+import numpy as np
+import pytest
+
+from src.data.dicom import (
+    EXPLICIT_VR_LITTLE_ENDIAN, _read_native, decode_dicom_gray, header_cache, parse_header, read_dicom_gray,
+)
+
+pydicom = pytest.importorskip("pydicom")
+
+
+def write_dicom(path, pixels, photometric="MONOCHROME2", window=None, rescale=(1.0, 0.0), bits_stored=12):
+    """Minimal uncompressed DICOM file (no real patient data)."""
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import generate_uid, SecondaryCaptureImageStorage
+
+    meta = FileMetaDataset()
+    meta.TransferSyntaxUID = EXPLICIT_VR_LITTLE_ENDIAN
+    meta.MediaStorageSOPClassUID = SecondaryCaptureImageStorage
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.Modality = "DX"
+    ds.Rows, ds.Columns = pixels.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = photometric
+    ds.BitsAllocated = pixels.dtype.itemsize * 8
+    ds.BitsStored = bits_stored
+    ds.HighBit = bits_stored - 1
+    ds.PixelRepresentation = int(pixels.dtype.kind == "i")
+    ds.RescaleSlope, ds.RescaleIntercept = rescale
+    if window is not None:
+        ds.WindowCenter, ds.WindowWidth = window
+    ds.PixelData = pixels.astype(pixels.dtype.newbyteorder("<")).tobytes()
+    ds.save_as(str(path), enforce_file_format=True)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def ramp_pixels():
+    """3000x2400 12-bit horizontal ramp with a little noise, kept within BitsStored."""
+    rng = np.random.RandomState(0)
+    ramp = np.tile(np.linspace(0, 4095, 3000, dtype=np.float32), (2400, 1))
+    return np.minimum(ramp + rng.randint(0, 8, ramp.shape), 4095).astype(np.uint16)
+
+
+@pytest.fixture(scope="module")
+def mono2(tmp_path_factory, ramp_pixels):
+    return write_dicom(tmp_path_factory.mktemp("dicom") / "mono2.dcm", ramp_pixels, window=(2048, 4096))
+
+
+def test_window_and_reduction(mono2):
+    gray = read_dicom_gray(mono2)
+    assert gray.shape == (300, 375) and gray.dtype == np.uint8
+    assert gray[:, 0].max() <= 1 and gray[:, -1].min() >= 254
+
+
+def test_monochrome1_is_inverted(tmp_path, mono2, ramp_pixels):
+    mono1 = write_dicom(tmp_path / "mono1.dcm", ramp_pixels, "MONOCHROME1", (2048, 4096))
+    assert np.array_equal(read_dicom_gray(mono1), 255 - read_dicom_gray(mono2))
+
+
+def test_decode_from_bytes_matches_file(mono2):
+    with open(mono2, "rb") as f:
+        assert np.array_equal(decode_dicom_gray(f.read()), read_dicom_gray(mono2))
+
+
+def test_area_reduction_averages_blocks(tmp_path):
+    # A one-pixel checkerboard averages to flat grey, not to one of its phases
+    checker = (np.indices((2400, 3000)).sum(axis=0) % 2 * 4000).astype(np.uint16)
+    flat = read_dicom_gray(write_dicom(tmp_path / "checker.dcm", checker, window=(2048, 4096)))
+    assert flat.max() - flat.min() <= 1, (flat.min(), flat.max())
+
+
+def test_signed_pixels_are_sign_extended(tmp_path):
+    # Signed 12-bit in 16: stray high bits are replaced by the sign of bit 11
+    signed = np.array([[-2048, -1, 0, 2047]] * 4, dtype=np.int16)
+    dirty = signed.view(np.uint16) & 0x0FFF | 0x5000
+    path = write_dicom(tmp_path / "signed.dcm", dirty.view(np.int16), window=(0, 4096))
+    with open(path, "rb") as f:
+        header = parse_header(f)
+    assert np.array_equal(_read_native(path, header, 1), signed)
+
+
+def test_header_cache_parses_once(mono2):
+    header_cache.clear()
+    for _ in range(3):
+        read_dicom_gray(mono2)
+    assert header_cache.stats()["misses"] == 1
+
+
+def test_truncated_pixel_data_decodes_to_none(mono2):
+    with open(mono2, "rb") as f:
+        contents = f.read()
+    assert decode_dicom_gray(contents[: len(contents) // 2]) is None
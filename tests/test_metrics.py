@@ -0,0 +1,75 @@
+"""
+Serving metrics (src/api/metrics.py): counter and histogram rendering and
+the request middleware's endpoint labelling.
+"""
+import asyncio
+
+import pytest
+
+from src.api.metrics import (
+    IN_FLIGHT, REQUEST_BYTES, REQUESTS, Counter, Histogram, MetricsMiddleware,
+)
+
+
+def test_counter_counts_per_label_set():
+    errors = Counter("test_errors_total", "errors", ("endpoint", "cause"))
+    for _ in range(1000):
+        errors.inc(endpoint="/predict", cause="decode_failed")
+    errors.inc(5, endpoint="/batch", cause="too_large")
+
+    assert errors.value(endpoint="/predict", cause="decode_failed") == 1000
+    assert errors.value(endpoint="/batch", cause="too_large") == 5
+    assert errors.value(endpoint="/batch", cause="decode_failed") == 0
+    assert 'test_errors_total{endpoint="/predict",cause="decode_failed"} 1000' in errors.render()
+
+
+def test_histogram_buckets_are_cumulative():
+    latency = Histogram("test_seconds", "latency", ("stage",), buckets=(0.01, 0.1))
+    for seconds in (0.005, 0.01, 0.05, 0.5):
+        latency.observe(seconds, stage="decode")
+
+    lines = latency.render()
+    assert 'test_seconds_bucket{stage="decode",le="0.01"} 2' in lines
+    assert 'test_seconds_bucket{stage="decode",le="0.1"} 3' in lines
+    assert 'test_seconds_bucket{stage="decode",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{stage="decode"} 4' in lines
+    assert any(line.startswith('test_seconds_sum{stage="decode"} 0.565') for line in lines)
+
+
+def test_endpoint_labels_are_bounded():
+    middleware = MetricsMiddleware(None, ["/predict", "/images/{image_id}"])
+    assert middleware.endpoint("/predict") == "/predict"
+    assert middleware.endpoint("/images/abc123") == "/images/{image_id}"
+    assert middleware.endpoint("/images/abc123/extra") == "other"
+    assert middleware.endpoint("/predict/../admin") == "other"
+
+
+def _request(middleware, path, headers):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": headers}
+    asyncio.run(middleware(scope, receive, send))
+    return sent
+
+
+async def _ok(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+@pytest.mark.parametrize("length, counted", [(b"1234", 1234), (b"12ab", 0), (b"", 0)])
+def test_request_bytes_from_content_length(length, counted):
+    endpoint = f"/metrics-test/{length.decode() or 'empty'}"
+    middleware = MetricsMiddleware(_ok, [endpoint])
+    sent = _request(middleware, endpoint, [(b"content-length", length)])
+
+    assert sent[0]["status"] == 200
+    assert REQUEST_BYTES.value(endpoint=endpoint) == counted
+    assert REQUESTS.value(endpoint=endpoint, status="200") == 1
+    assert f'xray_http_requests_in_flight{{endpoint="{endpoint}"}} 0' in IN_FLIGHT.render()
@@ -0,0 +1,100 @@
+"""
+Batched post-processing (src/inference/postprocess.py) and the threshold
+tuning engine (src/models/threshold_tuning.py) must reproduce the
+per-sample functions exactly.
+
+Run with `python -m pytest tests`.
+"""
+import numpy as np
+import pytest
+
+from src.data.constants import CLASS_NAMES
+from src.inference.postprocess import (
+    NORMAL_IDX, NORMAL_BOOST_MIN, VIRAL_MIN_CONFIDENCE,
+    postprocess_batch, smart_threshold, uncertainty_batch,
+)
+from src.inference.severity import compute_severity_1_to_10, compute_combined_severity, uncertainty
+from src.models.threshold_tuning import (
+    APP_PNEUMONIA_MIN_CONFIDENCE, DEFAULT_GRID, PARAMS,
+    build_grid, confusion_grid, current_settings, predict_grid,
+)
+
+SAMPLES = 20_000
+
+
+@pytest.fixture(scope="module")
+def probs():
+    """Softmax outputs from sharp to flat, plus ties, one-hots and values on the threshold constants."""
+    rng = np.random.RandomState(0)
+    logits = rng.normal(scale=rng.choice([0.5, 3.0, 10.0], size=(SAMPLES, 1)), size=(SAMPLES, 3))
+    probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+    probs = (probs / probs.sum(axis=1, keepdims=True)).astype(np.float32)
+    edges = np.array([
+        [1 / 3, 1 / 3, 1 / 3], [1, 0, 0], [0, 1, 0], [0, 0, 1], [0.5, 0.5, 0], [0, 0.5, 0.5],
+        [NORMAL_BOOST_MIN, 0.1, 0.7], [0.15, 0.15, VIRAL_MIN_CONFIDENCE], [0.2, 0.3, 0.5],
+    ], dtype=np.float32)
+    return np.concatenate([edges, probs])
+
+
+@pytest.mark.parametrize("smart", [False, True])
+def test_postprocess_batch_matches_scalar(probs, smart):
+    curb65 = np.random.RandomState(1).randint(0, 6, size=len(probs))
+    out = postprocess_batch(probs, curb65, smart=smart)
+    for i in range(len(probs)):
+        if smart:
+            pred, adjusted = smart_threshold(probs[i])
+            assert pred == out["pred_idx"][i], (i, probs[i])
+            assert np.array_equal(adjusted, out["probabilities"][i]), (i, probs[i])
+        else:
+            pred, adjusted = int(np.argmax(probs[i])), probs[i]
+        assert compute_severity_1_to_10(adjusted, pred) == out["base_severity"][i], (i, probs[i])
+        assert compute_combined_severity(CLASS_NAMES[pred], int(curb65[i])) == out["combined_severity"][i]
+
+
+def test_uncertainty_batch_matches_scalar(probs):
+    ent_norm, margin = uncertainty_batch(probs)
+    for i in range(len(probs)):
+        assert uncertainty(probs[i]) == (ent_norm[i], margin[i]), (i, probs[i])
+
+
+def test_confidence_fallback_matches_app_rule(probs):
+    out = postprocess_batch(probs, smart=True, pneumonia_min_confidence=0.65)
+    for i in range(len(probs)):
+        pred, adjusted = smart_threshold(probs[i])
+        if pred != NORMAL_IDX and float(adjusted[pred]) < 0.65:
+            pred = NORMAL_IDX
+        assert pred == out["pred_idx"][i], (i, probs[i])
+        assert compute_severity_1_to_10(adjusted, pred) == out["base_severity"][i], (i, probs[i])
+
+
+@pytest.mark.parametrize("gate", [None, 0.5, APP_PNEUMONIA_MIN_CONFIDENCE])
+def test_predict_grid_matches_postprocess_batch(probs, gate):
+    settings = current_settings()
+    combo = np.array([[*(settings[p] for p in PARAMS[:-1]), gate or 0.0]])
+    expected = postprocess_batch(probs, smart=True, pneumonia_min_confidence=gate)["pred_idx"]
+    assert np.array_equal(predict_grid(probs, combo)[0], expected)
+
+
+def test_predict_grid_neutral_constants_give_argmax(probs):
+    argmax = np.array([[1.0, 1.0, 1.0, 0.0, 0.0]])
+    assert np.array_equal(predict_grid(probs, argmax)[0], probs.argmax(axis=1))
+
+
+def test_confusion_grid_matches_per_combination(probs):
+    labels = np.random.RandomState(2).randint(0, 3, size=len(probs))
+    combos = build_grid({p: v[::3] for p, v in DEFAULT_GRID.items()})[:50]
+    pred = predict_grid(probs, combos)
+    cms = confusion_grid(pred, labels)
+    for i in range(len(combos)):
+        expected = np.zeros((3, 3), dtype=np.int64)
+        np.add.at(expected, (labels, pred[i]), 1)
+        assert np.array_equal(cms[i], expected), i
+
+
+def test_constants_compare_as_python_floats():
+    # float32(0.2) is just above 0.2, so the app's `probs[0] > 0.20` boosts NORMAL:
+    # 0.26 / 0.985 after the boost, 0.2 / 0.925 without it
+    probs = np.array([[NORMAL_BOOST_MIN, 0.5, 0.3]], dtype=np.float32)
+    _, adjusted = smart_threshold(probs[0])
+    assert adjusted[NORMAL_IDX] > 0.25
+    assert np.array_equal(postprocess_batch(probs)["probabilities"][0], adjusted)
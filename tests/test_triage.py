@@ -0,0 +1,117 @@
+"""
+Triage store (src/api/triage.py): incremental statistics, queue order and
+the image garbage collection sweep.
+"""
+import os
+import random
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from src.api.images import ImageStore
+from src.api.triage import STATUSES, TriageStore
+from src.data.constants import CLASS_NAMES
+
+
+def _png(value):
+    ok, encoded = cv2.imencode(".png", np.full((8, 8), value, dtype=np.uint8))
+    assert ok
+    return encoded.tobytes()
+
+
+@pytest.fixture
+def populated():
+    db = TriageStore(":memory:")
+    rng = random.Random(0)
+    ids = [
+        db.add(rng.choice(CLASS_NAMES), rng.randint(0, 5), {"prediction": {}},
+               arrival=time.time() - rng.uniform(0, 7200))["id"]
+        for _ in range(2000)
+    ]
+    for pid in rng.sample(ids, 500):
+        db.update_status(pid, rng.choice(STATUSES))
+    for pid in rng.sample(ids, 200):
+        db.remove(pid)
+    yield db
+    db.close()
+
+
+def test_incremental_stats_match_recount(populated):
+    now = time.time()
+    assert populated.stats.as_dict(now) == populated._rebuild_stats().as_dict(now)
+
+
+def test_queue_page_in_priority_order(populated):
+    page, total = populated.queue(offset=0, limit=20, status="waiting")
+    keys = [(-p["severityResult"]["finalSeverity"], p["timestamp"]) for p in page]
+    assert keys == sorted(keys)
+    assert total == populated.stats.by_status["waiting"]
+
+
+@pytest.fixture
+def store_with_images(tmp_path):
+    image_store = ImageStore(str(tmp_path / "images"))
+    db = TriageStore(str(tmp_path / "triage.sqlite3"), image_store=image_store)
+    yield db, image_store
+    db.close()
+
+
+def _age(image_store, image_id, seconds):
+    old = time.time() - seconds
+    os.utime(image_store.path(image_id), (old, old))
+
+
+def test_collect_images_keeps_referenced_and_recent(store_with_images):
+    db, image_store = store_with_images
+    referenced, _ = image_store.put(_png(10))
+    orphan, _ = image_store.put(_png(20))
+    recent, _ = image_store.put(_png(30))
+    db.add("NORMAL", 0, {}, image_id=referenced)
+    for image_id in (referenced, orphan):
+        _age(image_store, image_id, 7200)
+
+    assert db.collect_images(grace_seconds=3600) == 1
+    assert image_store.exists(referenced) and image_store.exists(recent)
+    assert not image_store.exists(orphan)
+
+
+def test_collect_images_walks_the_store_without_the_lock(store_with_images, monkeypatch):
+    db, image_store = store_with_images
+    image_id, _ = image_store.put(_png(40))
+    _age(image_store, image_id, 7200)
+
+    walk = image_store.stored_before
+
+    def stored_before(cutoff):
+        for found in walk(cutoff):
+            assert not db._lock.locked()
+            yield found
+
+    monkeypatch.setattr(image_store, "stored_before", stored_before)
+    assert db.collect_images(grace_seconds=3600) == 1
+
+
+def test_collect_images_rechecks_references_before_deleting(store_with_images, monkeypatch):
+    db, image_store = store_with_images
+    image_id, _ = image_store.put(_png(50))
+    _age(image_store, image_id, 7200)
+
+    walk = image_store.stored_before
+
+    def stored_before(cutoff):
+        # A patient is added with the image after the reference snapshot
+        found = list(walk(cutoff))
+        db.add("NORMAL", 0, {}, image_id=image_id)
+        return iter(found)
+
+    monkeypatch.setattr(image_store, "stored_before", stored_before)
+    assert db.collect_images(grace_seconds=3600) == 0
+    assert image_store.exists(image_id)
+
+
+def test_add_rejects_missing_image(store_with_images):
+    db, _ = store_with_images
+    with pytest.raises(LookupError):
+        db.add("NORMAL", 0, {}, image_id="0" * 64)